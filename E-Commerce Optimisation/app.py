@@ -1,32 +1,207 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, status
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, status
+from fastapi.responses import StreamingResponse
 import pandas as pd
 from io import StringIO
+from typing import List
+from pydantic import BaseModel, Field
 from tabs.bonus_computer_vision import (
-    predict_product_category,
-    load_product_categorisation_model,
-    search_similar_products,
+    preprocess_category_image,
+    predict_product_categories,
+    preprocess_search_image,
+    find_similar_products_batch,
+    classification_server,
+    similarity_server,
+    decoded_image_cache,
+    result_cache,
+)
+from tabs.image_cache import content_hash
+from tabs.model_server import ModelUnavailableError
+from tabs.request_batcher import MicroBatcher
+from sentiment_analysis.scoring import (
+    get_vader_score,
+    get_vader_scores,
+    load_vader,
+    sentiment_label,
 )
-from tabs.bonus_sentiment_analysis import get_vader_score, load_vader
 from tabs.bonus_personalized_email import generate_personalized_email_h2o
 from tabs.bonus_ai_chatbot import get_recommendation
 from demand_forecast.demand_forecasting import load_model_and_predict
+from demand_forecast.inventory import get_inventory_plan
+from tabs.pricing_optimizer import load_optimal_discount_table
+from tabs.promotion_simulator import shutdown_executor, simulate_plans
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVERS = [classification_server, similarity_server]
+
+# Concurrent image requests are queued for up to CV_MAX_WAIT_MS and run as one
+# batch; CV_MAX_BATCH_SIZE=1 turns batching off
+CV_MAX_BATCH_SIZE = int(os.getenv("CV_MAX_BATCH_SIZE", "16"))
+CV_MAX_WAIT_MS = float(os.getenv("CV_MAX_WAIT_MS", "5"))
+classification_batcher = MicroBatcher(
+    classification_server,
+    predict_product_categories,
+    max_batch_size=CV_MAX_BATCH_SIZE,
+    max_wait_ms=CV_MAX_WAIT_MS,
+)
+similarity_batcher = MicroBatcher(
+    similarity_server,
+    find_similar_products_batch,
+    max_batch_size=CV_MAX_BATCH_SIZE,
+    max_wait_ms=CV_MAX_WAIT_MS,
+)
+BATCHERS = [classification_batcher, similarity_batcher]
+
+# Most scenarios one promotion simulation can ask for; each takes a few floats
+# per promoted item
+MAX_SCENARIOS = 100_000
+
+# Most similar products one search can ask for
+MAX_SIMILAR_PRODUCTS = 100
+
+# Reviews scored per worker-thread call by the batch sentiment endpoint
+SENTIMENT_BATCH_SIZE = 1000
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load and warm every model before serving requests. A model that fails to
+    # load (e.g. its files have not been built) only makes its own endpoints
+    # return 503; it is retried on their next request
+    for server in MODEL_SERVERS:
+        try:
+            server.load()
+        except ModelUnavailableError:
+            logger.exception("Could not load model %s", server.name)
+    load_vader()
+    for batcher in BATCHERS:
+        batcher.start()
+    yield
+    for batcher in BATCHERS:
+        await batcher.stop()
+    shutdown_executor()
+
 
 app = FastAPI(
-    title="Passion8", description="Ecommerce Analysis and Optimization", version="0.1.0"
+    title="Passion8",
+    description="Ecommerce Analysis and Optimization",
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 
+class PromotionItem(BaseModel):
+    product_id: str
+    month: str
+    discount: float
+
+
+class PromotionRequest(BaseModel):
+    plans: List[List[PromotionItem]]
+    n_scenarios: int = Field(1000, ge=1, le=MAX_SCENARIOS)
+    seed: int = 0
+
+
 @app.post("/bonus/analyse_sentiment", tags=["Bonus"])
 async def analyse_sentiment(review: str):
     try:
         model = load_vader()
         score = get_vader_score(review, model)
-        if score >= 0.5:
-            return {"sentiment": "Positive"}
-        elif score <= -0.5:
-            return {"sentiment": "Negative"}
-        else:
-            return {"sentiment": "Neutral"}
+        return {"sentiment": sentiment_label(score)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+def review_text(item):
+    """Text of a review given as a string or an {"id", "review"} object."""
+    review = item.get("review") if isinstance(item, dict) else item
+    if review is not None and not isinstance(review, str):
+        raise ValueError(
+            "Each review must be a string or an object with a 'review' string"
+        )
+    return review
+
+
+def score_review_items(items):
+    """
+    Score a batch of reviews given as strings or {"id", "review"} objects.
+
+    Returns one result per item, with the item's id echoed back if it had one.
+    """
+    reviews = [review_text(item) for item in items]
+    scores = get_vader_scores(reviews, load_vader())
+    results = []
+    for item, score in zip(items, scores):
+        result = {"compound": score, "sentiment": sentiment_label(score)}
+        if isinstance(item, dict) and "id" in item:
+            result = {"id": item["id"], **result}
+        results.append(result)
+    return results
+
+
+def score_ndjson_lines(lines):
+    """Score a batch of NDJSON lines and return the NDJSON results."""
+    items, errors = [], {}
+    for i, line in enumerate(lines):
+        try:
+            item = json.loads(line)
+            review_text(item)
+            items.append(item)
+        except ValueError as e:
+            errors[i] = {"error": str(e)}
+            items.append(None)
+    results = score_review_items(items)
+    return "".join(
+        json.dumps(errors.get(i, result)) + "\n" for i, result in enumerate(results)
+    )
+
+
+async def stream_ndjson_scores(request):
+    """Score an NDJSON request body as it arrives, one batch at a time."""
+    buffer, batch = b"", []
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        batch.extend(line for line in lines if line.strip())
+        while len(batch) >= SENTIMENT_BATCH_SIZE:
+            yield await asyncio.to_thread(
+                score_ndjson_lines, batch[:SENTIMENT_BATCH_SIZE]
+            )
+            batch = batch[SENTIMENT_BATCH_SIZE:]
+    if buffer.strip():
+        batch.append(buffer)
+    if batch:
+        yield await asyncio.to_thread(score_ndjson_lines, batch)
+
+
+@app.post("/bonus/analyse_sentiment_batch", tags=["Bonus"])
+async def analyse_sentiment_batch(request: Request):
+    try:
+        # NDJSON bodies are streamed: results are returned while reviews arrive
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            return StreamingResponse(
+                stream_ndjson_scores(request), media_type="application/x-ndjson"
+            )
+        items = await request.json()
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Expected a JSON array of reviews",
+            )
+        results = await asyncio.to_thread(score_review_items, items)
+        return {"results": results}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -36,9 +211,22 @@ async def analyse_sentiment(review: str):
 @app.post("/bonus/classify_product", tags=["Bonus"])
 async def classify_product_image(file: UploadFile):
     try:
-        model = load_product_categorisation_model()
-        product_category = predict_product_category(model, file.file.read())
+        img_bytes = await file.read()
+        digest = content_hash(img_bytes)
+        # Identical uploads skip decoding and inference
+        key = ("category", digest)
+        product_category = result_cache.get(key)
+        if product_category is None:
+            image = await asyncio.to_thread(
+                preprocess_category_image, img_bytes, digest
+            )
+            product_category = await classification_batcher.submit(image)
+            result_cache.put(key, product_category)
         return {"product_category": product_category}
+    except ModelUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -46,11 +234,49 @@ async def classify_product_image(file: UploadFile):
 
 
 @app.post("/bonus/search_similar_products", tags=["Bonus"])
-async def search_similar_products_endpoint(file: UploadFile, number_of_products: int):
+async def search_similar_products_endpoint(
+    file: UploadFile,
+    number_of_products: int = Query(..., ge=1, le=MAX_SIMILAR_PRODUCTS),
+):
     try:
-        similar_products = search_similar_products(file.file.read(), number_of_products)
+        _, index = await asyncio.to_thread(similarity_server.load)
+        if number_of_products > len(index):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"number_of_products must be at most {len(index)}",
+            )
+        img_bytes = await file.read()
+        digest = content_hash(img_bytes)
+        key = ("similar", digest, number_of_products)
+        similar_products = result_cache.get(key)
+        if similar_products is None:
+            image = await asyncio.to_thread(preprocess_search_image, img_bytes, digest)
+            similar_products = await similarity_batcher.submit(
+                (image, number_of_products)
+            )
+            result_cache.put(key, similar_products)
         similar_products_link = [i[0] for i in similar_products]
         return {"similar_products": similar_products_link}
+    except HTTPException:
+        raise
+    except ModelUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@app.post("/bonus/model_stats", tags=["Bonus"])
+async def model_stats():
+    try:
+        return {
+            "models": [server.stats() for server in MODEL_SERVERS],
+            "batching": [batcher.stats() for batcher in BATCHERS],
+            "caches": [cache.stats() for cache in (decoded_image_cache, result_cache)],
+        }
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -102,3 +328,94 @@ async def predict_sales(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         )
+
+
+@app.post("/grpb/inventory_plan", tags=["Demand Forecast"])
+async def inventory_plan(product_id: str = None):
+    try:
+        plan, version = await asyncio.to_thread(get_inventory_plan)
+        if product_id is not None:
+            plan = plan[plan["product_id"] == product_id]
+            if plan.empty:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"No inventory plan for product {product_id}",
+                )
+        columns = [
+            "product_id",
+            "demand_rate",
+            "eoq",
+            "lead_time_demand",
+            "safety_stock",
+            "reorder_point",
+        ]
+        return {
+            "forecast_version": version,
+            "inventory_plan": plan[columns].to_dict(orient="records"),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@app.post("/grpb/optimal_discount", tags=["Pricing Strategies"])
+async def optimal_discount(product_id: str, month: str = None):
+    try:
+        data = load_optimal_discount_table()
+        chosen = data[data["product_id"] == product_id]
+        if month is not None:
+            chosen = chosen[chosen["month"] == month]
+        if chosen.empty:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No pricing data for product {product_id}",
+            )
+        columns = [
+            "month",
+            "actual_price",
+            "PED",
+            "optimal_discount",
+            "optimal_price",
+            "optimal_demand",
+            "optimal_value",
+            "base_value",
+        ]
+        return {
+            "product_id": product_id,
+            "optimal_discounts": chosen[columns].to_dict(orient="records"),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@app.post("/grpb/simulate_promotions", tags=["Pricing Strategies"])
+async def simulate_promotions(request: PromotionRequest):
+    try:
+        plans = [
+            pd.DataFrame(
+                [item.model_dump() for item in plan],
+                columns=["product_id", "month", "discount"],
+            )
+            for plan in request.plans
+        ]
+        summaries = await asyncio.to_thread(
+            simulate_plans,
+            load_optimal_discount_table(),
+            plans,
+            n_scenarios=request.n_scenarios,
+            seed=request.seed,
+        )
+        return {"simulations": summaries}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
@@ -0,0 +1,26 @@
+import os
+
+from tensorflow.keras.models import model_from_json
+
+# Keras model of the product categorisation CNN, saved by training_data.py
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_SIZE = (150, 150)
+
+
+def load_product_categorisation_model(model_dir=MODEL_DIR):
+    """Load the categorisation model from model.json and model.weights.h5."""
+
+    # load cnn model
+    model_path = os.path.join(model_dir, "model.json")
+    json_file = open(model_path, "r")
+    loaded_model_json = json_file.read()
+    json_file.close()
+    loaded_model = model_from_json(loaded_model_json)
+
+    # load weights into new model
+    weights_path = os.path.join(model_dir, "model.weights.h5")
+    loaded_model.load_weights(weights_path)
+    print("Loaded model from disk")
+
+    # Inference only, so the model is not compiled with an optimizer
+    return loaded_model
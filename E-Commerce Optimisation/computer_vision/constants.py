@@ -0,0 +1,8 @@
+# Product categories, in the order of the categorisation model's outputs
+CLASS_NAMES = [
+    "In-Ear",
+    "SmartTelevisions",
+    "Smartphones",
+    "Irons,Steamers&Accessories",
+    "Cables",
+]
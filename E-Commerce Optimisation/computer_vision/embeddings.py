@@ -0,0 +1,261 @@
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import requests
+from dotenv import load_dotenv
+from PIL import Image
+from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
+
+from computer_vision.vector_index import (
+    CATALOG_PATH,
+    EMBEDDINGS_PATH,
+    INDEX_DIR,
+    KNN_PATH,
+    VectorIndex,
+    load_knn_embeddings,
+    normalize,
+    save_embeddings,
+)
+from computer_vision.tflite_model import run_model
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+IMAGE_SIZE = (224, 224)
+EMBEDDING_DIM = 512
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+def load_products():
+    """Load the products that have an image link."""
+    with get_db_connection() as conn:
+        return pd.read_sql_query(
+            """
+            SELECT product_id, product_name, category, img_link
+            FROM products
+            WHERE img_link IS NOT NULL
+            ORDER BY product_id
+            """,
+            conn,
+        )
+
+
+def build_embedding_model(pooling="avg"):
+    """
+    VGG16 feature extractor with global average pooling.
+
+    Averaging the 7x7x512 feature map over its spatial positions gives a 512-d
+    embedding instead of 25,088 flattened values. pooling=None keeps the
+    feature map, which embed_images flattens, to match an index built from the
+    pickled KNN model.
+    """
+    return VGG16(
+        weights="imagenet",
+        include_top=False,
+        pooling=pooling,
+        input_shape=IMAGE_SIZE + (3,),
+    )
+
+
+def preprocess_image(img_bytes):
+    """Decode an image into the 224x224 VGG16 input array."""
+    image = Image.open(io.BytesIO(img_bytes))
+    # Let the JPEG decoder scale large images down while decoding
+    image.draft("RGB", IMAGE_SIZE)
+    image = image.convert("RGB").resize(IMAGE_SIZE)
+    return preprocess_input(np.array(image, dtype=np.float32))
+
+
+def embed_images(model, images):
+    """Embed a batch of preprocessed images in one forward pass; rows have unit length."""
+    embeddings = run_model(model, np.stack(images))
+    return normalize(embeddings.reshape(len(embeddings), -1))
+
+
+def fetch_image(url, session, timeout=10):
+    """Download and preprocess one image; None if it cannot be fetched or decoded."""
+    try:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        return preprocess_image(response.content)
+    except (requests.RequestException, OSError) as e:
+        print(f"Skipping {url}: {e}")
+        return None
+
+
+def embed_catalog(items, model=None, batch_size=64, n_threads=16):
+    """
+    Embed the images of a catalogue.
+
+    Images are downloaded, decoded and resized on a thread pool. The next batch
+    is fetched while the model embeds the current one.
+
+    Parameters:
+    - items (pd.DataFrame): Catalogue rows with an 'img_link' column.
+    - model (keras.Model): Embedding model. Defaults to build_embedding_model().
+    - batch_size (int): Images per forward pass.
+    - n_threads (int): Download and decode threads.
+
+    Returns:
+    - embeddings (np.ndarray): Unit-length embeddings, shape (n, 512).
+    - items (pd.DataFrame): Rows whose image could be embedded, in the same order.
+    """
+    model = model or build_embedding_model()
+    urls = items["img_link"].tolist()
+    batches = [urls[i : i + batch_size] for i in range(0, len(urls), batch_size)]
+    embeddings, kept = [], []
+
+    with requests.Session() as session, ThreadPoolExecutor(n_threads) as executor:
+
+        def submit(batch):
+            return [executor.submit(fetch_image, url, session) for url in batch]
+
+        pending = submit(batches[0]) if batches else []
+        for i in range(len(batches)):
+            images = [future.result() for future in pending]
+            if i + 1 < len(batches):
+                pending = submit(batches[i + 1])
+            ok = [j for j, image in enumerate(images) if image is not None]
+            if ok:
+                embeddings.append(embed_images(model, [images[j] for j in ok]))
+                kept.extend(i * batch_size + j for j in ok)
+            print(f"Embedded {min((i + 1) * batch_size, len(urls))}/{len(urls)} images")
+
+    embeddings = (
+        np.concatenate(embeddings)
+        if embeddings
+        else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    )
+    return embeddings, items.iloc[kept].reset_index(drop=True)
+
+
+def directory_size(path):
+    """Total size in bytes of the files in a directory."""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def query_latency(index, queries, k=5, n_probe=8):
+    """Mean index search latency per query, in milliseconds."""
+    index.search(queries[:1], k, n_probe)
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query[None], k, n_probe)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def migrate(
+    embeddings_path=EMBEDDINGS_PATH,
+    index_dir=INDEX_DIR,
+    batch_size=64,
+    n_threads=16,
+    n_queries=200,
+):
+    """
+    Re-embed every product with pooled embeddings and rebuild the similar product index.
+
+    The old raw VGG16 feature maps and index are measured before the index is
+    replaced, so memory, index size and query latency can be compared.
+
+    Parameters:
+    - embeddings_path (str): Output Parquet file of catalogue embeddings.
+    - index_dir (str): Index directory, rebuilt in place.
+    - batch_size (int): Images per forward pass.
+    - n_threads (int): Download and decode threads.
+    - n_queries (int): Catalogue items used as queries to time the index.
+
+    Returns:
+    - results (pd.DataFrame): Embedding size, memory, storage and query latency before and after.
+    """
+    rng = np.random.default_rng(0)
+    rows = []
+    if os.path.exists(KNN_PATH):
+        old_embeddings, _ = load_knn_embeddings()
+        old = {
+            "embeddings": "raw feature maps",
+            "dim": old_embeddings.shape[1],
+            "memory_mb": old_embeddings.nbytes / 1e6,
+            "storage_mb": (os.path.getsize(KNN_PATH) + os.path.getsize(CATALOG_PATH))
+            / 1e6,
+        }
+        # Only an index still built from the raw feature maps is timed
+        index = (
+            VectorIndex(index_dir)
+            if os.path.exists(os.path.join(index_dir, "meta.json"))
+            else None
+        )
+        if index is not None and index.meta["pca"]:
+            queries = old_embeddings[
+                rng.choice(len(old_embeddings), min(n_queries, len(old_embeddings)))
+            ]
+            old["index_mb"] = directory_size(index_dir) / 1e6
+            old["query_ms"] = query_latency(index, queries)
+        rows.append(old)
+        del old_embeddings
+
+    items = load_products()
+    embeddings, items = embed_catalog(items, batch_size=batch_size, n_threads=n_threads)
+    save_embeddings(items, embeddings, embeddings_path)
+    index = VectorIndex.build(embeddings, items, path=index_dir, pca_dim=None)
+    queries = embeddings[rng.choice(len(embeddings), min(n_queries, len(embeddings)))]
+    rows.append(
+        {
+            "embeddings": "pooled",
+            "dim": embeddings.shape[1],
+            "memory_mb": embeddings.nbytes / 1e6,
+            "storage_mb": os.path.getsize(embeddings_path) / 1e6,
+            "index_mb": directory_size(index_dir) / 1e6,
+            "query_ms": query_latency(index, queries),
+        }
+    )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Re-embed the product catalogue with pooled VGG16 embeddings and rebuild the similar product index."
+    )
+    parser.add_argument(
+        "--embeddings_file",
+        type=str,
+        default=EMBEDDINGS_PATH,
+        help="Path to the output Parquet file of catalogue embeddings.",
+    )
+    parser.add_argument(
+        "--index_dir", type=str, default=INDEX_DIR, help="Index directory."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="Images per forward pass."
+    )
+    parser.add_argument(
+        "--n_threads", type=int, default=16, help="Image download and decode threads."
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    results = migrate(
+        args.embeddings_file, args.index_dir, args.batch_size, args.n_threads
+    )
+    print(results.to_string(index=False))
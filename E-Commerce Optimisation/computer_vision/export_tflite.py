@@ -0,0 +1,285 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import tensorflow as tf
+from tensorflow.keras.applications.vgg16 import preprocess_input
+
+from computer_vision.categorisation_model import load_product_categorisation_model
+from computer_vision.embeddings import IMAGE_SIZE as SEARCH_IMAGE_SIZE
+from computer_vision.embeddings import build_embedding_model
+from computer_vision.tflite_model import (
+    CLASSIFIER_TFLITE_PATH,
+    EMBEDDING_TFLITE_PATH,
+    TFLiteModel,
+    run_model,
+)
+from computer_vision.training_data import DATASET_DIR, load_dataset
+
+
+def load_test_split(dataset_dir=DATASET_DIR):
+    """
+    Load the held-out test split of the TFRecord shards the model was trained from.
+
+    No test image, nor any augmented copy of one, is in the training split.
+
+    Parameters:
+    - dataset_dir (str): Directory of the shards written by training_data.py.
+
+    Returns:
+    - images (np.ndarray): RGB images scaled to [0, 1], shape (n, 150, 150, 3).
+    - labels (np.ndarray): Index of each image's category in CLASS_NAMES.
+    """
+    if not glob.glob(os.path.join(dataset_dir, "test-*.tfrecord")):
+        raise FileNotFoundError(
+            f"No test shards in {dataset_dir}; build them with computer_vision.training_data"
+        )
+    images, labels = [], []
+    for batch_images, batch_labels in load_dataset(
+        "test", dataset_dir, shuffle_buffer=0
+    ):
+        images.append(batch_images.numpy())
+        labels.append(batch_labels.numpy())
+    return np.concatenate(images), np.concatenate(labels)
+
+
+def convert(model, quantization="dynamic", representative_images=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer.
+
+    Parameters:
+    - model (keras.Model): Model to convert.
+    - quantization (str): 'dynamic' (int8 weights, float activations), 'int8'
+      (int8 weights and activations, calibrated on representative_images),
+      'float16' (float16 weights) or 'none'.
+    - representative_images (np.ndarray): Preprocessed model inputs used to calibrate int8 activations.
+
+    Returns:
+    - tflite_model (bytes): The converted model.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+
+        def representative_dataset():
+            for image in representative_images[:200]:
+                yield [image[None].astype(np.float32)]
+
+        # Inputs and outputs stay float; everything in between runs in int8
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def export(model, path, quantization="dynamic", representative_images=None):
+    """Convert a Keras model and write it to path; returns the file size in bytes."""
+    tflite_model = convert(model, quantization, representative_images)
+    with open(path, "wb") as f:
+        f.write(tflite_model)
+    return len(tflite_model)
+
+
+def classifier_parity(keras_model, tflite_model, images, labels):
+    """
+    Compare the TFLite classifier against the Keras model on the held-out images.
+
+    Returns:
+    - parity (dict): Accuracy of each model, the share of images both models put in
+      the same category and the largest difference in a class probability.
+    """
+    keras_probs = np.concatenate(
+        [run_model(keras_model, images[i : i + 64]) for i in range(0, len(images), 64)]
+    )
+    tflite_probs = np.concatenate(
+        [run_model(tflite_model, images[i : i + 64]) for i in range(0, len(images), 64)]
+    )
+    keras_labels = keras_probs.argmax(axis=1)
+    tflite_labels = tflite_probs.argmax(axis=1)
+    return {
+        "keras_accuracy": float(np.mean(keras_labels == labels)),
+        "tflite_accuracy": float(np.mean(tflite_labels == labels)),
+        "agreement": float(np.mean(keras_labels == tflite_labels)),
+        "max_prob_diff": float(np.abs(keras_probs - tflite_probs).max()),
+    }
+
+
+def embedding_parity(keras_model, tflite_model, images):
+    """Mean and minimum cosine similarity between Keras and TFLite embeddings of the same images."""
+    keras_embeddings = np.concatenate(
+        [run_model(keras_model, images[i : i + 16]) for i in range(0, len(images), 16)]
+    )
+    tflite_embeddings = np.concatenate(
+        [run_model(tflite_model, images[i : i + 16]) for i in range(0, len(images), 16)]
+    )
+    keras_embeddings /= np.linalg.norm(keras_embeddings, axis=1, keepdims=True)
+    tflite_embeddings /= np.linalg.norm(tflite_embeddings, axis=1, keepdims=True)
+    cosine = np.sum(keras_embeddings * tflite_embeddings, axis=1)
+    return {
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+    }
+
+
+def benchmark(loader, images, n_runs=50, batch_size=16):
+    """
+    Measure the memory and latency of a model.
+
+    Parameters:
+    - loader (callable): Loads the model; the resident memory it adds is measured.
+    - images (np.ndarray): Preprocessed model inputs.
+    - n_runs (int): Timed runs per measurement.
+    - batch_size (int): Batch size of the throughput measurement.
+
+    Returns:
+    - model: The loaded model.
+    - results (dict): Resident memory added by loading, p50/p95 latency of one image
+      in milliseconds, and images per second at batch_size.
+    """
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    model = loader()
+    run_model(model, images[:1])
+    memory_mb = (process.memory_info().rss - rss) / 1e6
+
+    latencies = []
+    for i in range(n_runs):
+        image = images[i % len(images)][None]
+        start = time.perf_counter()
+        run_model(model, image)
+        latencies.append(time.perf_counter() - start)
+
+    batch = images[:batch_size]
+    run_model(model, batch)
+    start = time.perf_counter()
+    for _ in range(max(1, n_runs // batch_size)):
+        run_model(model, batch)
+    elapsed = time.perf_counter() - start
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return model, {
+        "memory_mb": memory_mb,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "images_per_s": max(1, n_runs // batch_size) * len(batch) / elapsed,
+    }
+
+
+def compare(name, keras_loader, tflite_path, images, model_size_mb):
+    """Benchmark the Keras model and its TFLite export; returns the models and one row per backend."""
+    keras_model, keras_results = benchmark(keras_loader, images)
+    tflite_model, tflite_results = benchmark(lambda: TFLiteModel(tflite_path), images)
+    rows = [
+        {"model": name, "backend": "keras", "size_mb": model_size_mb, **keras_results},
+        {
+            "model": name,
+            "backend": "tflite",
+            "size_mb": os.path.getsize(tflite_path) / 1e6,
+            **tflite_results,
+        },
+    ]
+    return keras_model, tflite_model, rows
+
+
+def keras_size_mb(model):
+    """Size of a Keras model's weights in MB."""
+    return sum(weight.nbytes for weight in model.get_weights()) / 1e6
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Export the computer vision models to quantized TFLite, check parity with the Keras models and benchmark both."
+    )
+    parser.add_argument(
+        "--dataset_dir",
+        type=str,
+        default=DATASET_DIR,
+        help="Directory of the TFRecord shards; the models are compared on the test split.",
+    )
+    parser.add_argument(
+        "--quantization",
+        type=str,
+        choices=["dynamic", "int8", "float16", "none"],
+        default="int8",
+        help="Quantization of the product categorisation model.",
+    )
+    parser.add_argument(
+        "--embedding_quantization",
+        type=str,
+        choices=["dynamic", "int8", "float16", "none"],
+        default="dynamic",
+        help="Quantization of the similar product embedding model.",
+    )
+    parser.add_argument(
+        "--min_agreement",
+        type=float,
+        default=0.98,
+        help="Fail if the models agree on fewer held-out images than this.",
+    )
+    parser.add_argument(
+        "--min_cosine",
+        type=float,
+        default=0.98,
+        help="Fail if the mean cosine similarity of the embeddings is below this.",
+    )
+    parser.add_argument(
+        "--skip_embedding",
+        action="store_true",
+        help="Only export the product categorisation model.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    category_inputs, labels = load_test_split(args.dataset_dir)
+    # int8 activations are calibrated on training images, not the test split
+    calibration_inputs = next(
+        iter(load_dataset("train", args.dataset_dir, batch_size=200))
+    )[0].numpy()
+    classifier = load_product_categorisation_model()
+    export(classifier, CLASSIFIER_TFLITE_PATH, args.quantization, calibration_inputs)
+    keras_model, tflite_model, rows = compare(
+        "product_categorisation",
+        load_product_categorisation_model,
+        CLASSIFIER_TFLITE_PATH,
+        category_inputs,
+        keras_size_mb(classifier),
+    )
+    parity = classifier_parity(keras_model, tflite_model, category_inputs, labels)
+    print(parity)
+    failed = parity["agreement"] < args.min_agreement
+
+    if not args.skip_embedding:
+        # The embedding model takes 224x224 images with VGG16 preprocessing
+        search_inputs, search_calibration_inputs = [
+            preprocess_input(tf.image.resize(inputs * 255.0, SEARCH_IMAGE_SIZE).numpy())
+            for inputs in (category_inputs, calibration_inputs)
+        ]
+        embedding_model = build_embedding_model()
+        export(
+            embedding_model,
+            EMBEDDING_TFLITE_PATH,
+            args.embedding_quantization,
+            search_calibration_inputs,
+        )
+        keras_model, tflite_model, embedding_rows = compare(
+            "similar_products",
+            build_embedding_model,
+            EMBEDDING_TFLITE_PATH,
+            search_inputs,
+            keras_size_mb(embedding_model),
+        )
+        rows += embedding_rows
+        embedding_results = embedding_parity(keras_model, tflite_model, search_inputs)
+        print(embedding_results)
+        failed |= embedding_results["mean_cosine"] < args.min_cosine
+
+    print(pd.DataFrame(rows).to_string(index=False))
+    if failed:
+        raise SystemExit("TFLite models do not match the Keras models")
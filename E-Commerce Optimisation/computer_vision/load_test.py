@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+ENDPOINTS = {
+    "classify": ("/bonus/classify_product", {}),
+    "search": ("/bonus/search_similar_products", {"number_of_products": 5}),
+}
+
+
+async def run_level(client, path, params, image_bytes, concurrency, n_requests):
+    """
+    Send n_requests with concurrency requests in flight at any time.
+
+    Returns:
+    - latencies (np.ndarray): Seconds per successful request.
+    - elapsed (float): Wall-clock seconds for all requests.
+    - n_errors (int): Failed requests.
+    """
+    remaining = iter(range(n_requests))
+    latencies = []
+    n_errors = 0
+
+    async def worker():
+        nonlocal n_errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.post(
+                path,
+                params=params,
+                files={"file": ("image.jpg", image_bytes, "image/jpeg")},
+            )
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                n_errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return np.array(latencies), time.perf_counter() - start, n_errors
+
+
+async def load_test(url, endpoint, image_bytes, concurrency_levels, n_requests):
+    """
+    Measure throughput and latency of a CV endpoint at increasing concurrency.
+
+    Parameters:
+    - url (str): Base URL of the running API.
+    - endpoint (str): 'classify' or 'search'.
+    - image_bytes (bytes): Image uploaded with every request.
+    - concurrency_levels (list): Requests in flight at each level.
+    - n_requests (int): Requests sent per level.
+
+    Returns:
+    - results (pd.DataFrame): Throughput and p50/p99 latency per concurrency level.
+    """
+    path, params = ENDPOINTS[endpoint]
+    limits = httpx.Limits(max_connections=max(concurrency_levels))
+    rows = []
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        # Warm up connections and the server
+        await run_level(client, path, params, image_bytes, 1, 2)
+        for concurrency in concurrency_levels:
+            latencies, elapsed, n_errors = await run_level(
+                client, path, params, image_bytes, concurrency, n_requests
+            )
+            p50, p99 = (
+                np.percentile(latencies, [50, 99]) * 1000
+                if len(latencies)
+                else (np.nan, np.nan)
+            )
+            rows.append(
+                {
+                    "concurrency": concurrency,
+                    "throughput_rps": len(latencies) / elapsed,
+                    "p50_ms": p50,
+                    "p99_ms": p99,
+                    "n_errors": n_errors,
+                }
+            )
+            print(rows[-1])
+        stats = await client.post("/bonus/model_stats")
+        if stats.status_code == 200:
+            print(stats.json())
+    return pd.DataFrame(rows)
+
+
+def plot_results(results, path):
+    """Plot throughput against p99 latency, one point per concurrency level."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.plot(results["throughput_rps"], results["p99_ms"], marker="o")
+    for _, row in results.iterrows():
+        ax.annotate(
+            f"c={row['concurrency']:.0f}", (row["throughput_rps"], row["p99_ms"])
+        )
+    ax.set_xlabel("Throughput (requests/s)")
+    ax.set_ylabel("p99 latency (ms)")
+    ax.set_title("Throughput vs p99 Latency")
+    fig.savefig(path, bbox_inches="tight")
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Load test the computer vision endpoints of the API."
+    )
+    parser.add_argument(
+        "--url", type=str, default="http://localhost:8000", help="Base URL of the API."
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=str,
+        choices=list(ENDPOINTS),
+        default="classify",
+        help="Endpoint to load test.",
+    )
+    parser.add_argument(
+        "--image", type=str, required=True, help="Path to the image to upload."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16, 32, 64],
+        help="Concurrency levels to test.",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Requests per concurrency level."
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default=None,
+        help="Path to the output CSV file to save the results.",
+    )
+    parser.add_argument(
+        "--plot_file",
+        type=str,
+        default=None,
+        help="Path to save the throughput vs p99 latency plot.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    results = asyncio.run(
+        load_test(args.url, args.endpoint, image_bytes, args.concurrency, args.requests)
+    )
+    print(results.to_string(index=False))
+    if args.output_file:
+        results.to_csv(args.output_file, index=False)
+    if args.plot_file:
+        plot_results(results, args.plot_file)
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+# Models exported by export_tflite.py
+CLASSIFIER_TFLITE_PATH = os.path.join(os.path.dirname(__file__), "model.tflite")
+EMBEDDING_TFLITE_PATH = os.path.join(
+    os.path.dirname(__file__), "embedding_model.tflite"
+)
+
+
+class TFLiteModel:
+    """
+    Run a TFLite model with the same batch-in, array-out interface as the Keras models.
+
+    Resizing and reallocating an interpreter's tensors is slow, so batches are
+    zero-padded to the next power of two up to max_batch_size, each with its
+    own interpreter allocated on first use, and the outputs sliced back to the
+    batch. Larger batches are run in chunks of max_batch_size. Quantized inputs
+    and outputs are converted to and from float with the tensor's scale and
+    zero point. An interpreter is not thread-safe, so each instance should be
+    used from one thread, as ModelServer does.
+
+    Parameters:
+    - path (str): Path to the .tflite file.
+    - num_threads (int): Threads used by the interpreter's CPU kernels.
+    - max_batch_size (int): Largest padded batch size.
+    """
+
+    def __init__(self, path, num_threads=None, max_batch_size=16):
+        self.path = path
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = sorted(
+            {min(2**i, max_batch_size) for i in range(max_batch_size.bit_length() + 1)}
+        )
+        # padded batch size -> (interpreter, input details, output details)
+        self.interpreters = {}
+        _, self.input, self.output = self.interpreter(self.batch_sizes[0])
+        self.input_shape = tuple(self.input["shape"][1:])
+
+    def interpreter(self, batch_size):
+        """Interpreter allocated for batches of exactly batch_size images."""
+        if batch_size not in self.interpreters:
+            interpreter = tf.lite.Interpreter(
+                model_path=self.path, num_threads=self.num_threads
+            )
+            input_details = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(
+                input_details["index"], [batch_size, *input_details["shape"][1:]]
+            )
+            interpreter.allocate_tensors()
+            self.interpreters[batch_size] = (
+                interpreter,
+                interpreter.get_input_details()[0],
+                interpreter.get_output_details()[0],
+            )
+        return self.interpreters[batch_size]
+
+    def padded_size(self, n):
+        """Smallest padded batch size that holds n images."""
+        return next(size for size in self.batch_sizes if size >= n)
+
+    def run_batch(self, images):
+        """Run at most max_batch_size images, padded to a fixed batch size."""
+        n = len(images)
+        interpreter, input_details, output_details = self.interpreter(
+            self.padded_size(n)
+        )
+        padded = np.zeros(input_details["shape"], dtype=np.float32)
+        padded[:n] = images
+
+        scale, zero_point = input_details["quantization"]
+        if scale:
+            padded = np.round(padded / scale + zero_point)
+        interpreter.set_tensor(
+            input_details["index"], padded.astype(input_details["dtype"])
+        )
+        interpreter.invoke()
+        outputs = interpreter.get_tensor(output_details["index"])[:n]
+
+        scale, zero_point = output_details["quantization"]
+        if scale:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+    def __call__(self, images):
+        images = np.asarray(images, dtype=np.float32).reshape(-1, *self.input_shape)
+        return np.concatenate(
+            [
+                self.run_batch(images[start : start + self.max_batch_size])
+                for start in range(0, max(len(images), 1), self.max_batch_size)
+            ]
+        )
+
+
+def run_model(model, images):
+    """Run a batch through a Keras or TFLite model and return a numpy array."""
+    if isinstance(model, TFLiteModel):
+        return model(images)
+    return model(np.asarray(images), training=False).numpy()
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from PIL import Image
+
+from computer_vision.vector_index import EMBEDDINGS_PATH
+
+STORE_DIR = "computer_vision/thumbnails"
+MANIFEST_FILE = "manifest.csv"
+THUMBNAIL_SIZE = (300, 300)
+
+
+def fetch(url, session, retries=3, backoff=1.0, timeout=10):
+    """
+    Download a URL, retrying connection errors, timeouts and 429/5xx responses.
+
+    Waits backoff, 2 * backoff, 4 * backoff, ... seconds between attempts.
+    Other HTTP errors (e.g. 404) are raised straight away.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+    response.raise_for_status()
+    return response.content
+
+
+def make_thumbnail(img_bytes, size=THUMBNAIL_SIZE):
+    """Shrink an image to fit within size and encode it as JPEG."""
+    image = Image.open(io.BytesIO(img_bytes))
+    image.draft("RGB", size)
+    image = image.convert("RGB")
+    image.thumbnail(size)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+def manifest_mtime(path=STORE_DIR):
+    """Modification time of a store's manifest, or None if it does not exist."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    return os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+
+
+def make_placeholder(size=THUMBNAIL_SIZE):
+    """Plain grey JPEG shown in place of an image that is not in the store."""
+    image = Image.new("RGB", size, (230, 230, 230))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+class ThumbnailStore:
+    """
+    Content-addressed store of product image thumbnails on local disk.
+
+    Each thumbnail is saved under the SHA-256 hash of its bytes, so identical
+    images shared by several products are stored once. A manifest maps image
+    links to hashes. It is appended to as each download finishes, so an
+    interrupted download resumes where it stopped.
+
+    Parameters:
+    - path (str): Store directory.
+    """
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        self.manifest_path = os.path.join(path, MANIFEST_FILE)
+        # img_link -> content hash
+        self.hashes = {}
+        if os.path.exists(self.manifest_path):
+            manifest = pd.read_csv(self.manifest_path)
+            self.hashes = dict(zip(manifest["img_link"], manifest["sha256"]))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, img_link):
+        return img_link in self.hashes
+
+    def file_path(self, digest):
+        """Path of a thumbnail, sharded by the first two hex digits of its hash."""
+        return os.path.join(self.path, digest[:2], f"{digest}.jpg")
+
+    def get(self, img_link):
+        """Local path of the thumbnail of an image link, or None if it is not stored."""
+        digest = self.hashes.get(img_link)
+        return None if digest is None else self.file_path(digest)
+
+    def put(self, thumbnail):
+        """Write a thumbnail under its content hash and return the hash."""
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self.file_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so an interrupted write never leaves a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        return digest
+
+    def download(
+        self, img_links, n_threads=16, retries=3, backoff=1.0, size=THUMBNAIL_SIZE
+    ):
+        """
+        Download and store thumbnails of the image links not yet in the store.
+
+        Parameters:
+        - img_links (list): Image URLs.
+        - n_threads (int): Concurrent downloads.
+        - retries (int): Retries per image after a transient failure.
+        - backoff (float): Seconds before the first retry, doubled on each retry.
+        - size (tuple): Largest (width, height) of a thumbnail.
+
+        Returns:
+        - summary (dict): Numbers of images already stored, downloaded and failed,
+          and the links that failed.
+        """
+        pending = list(dict.fromkeys(link for link in img_links if link not in self))
+        summary = {
+            "stored": len(set(img_links)) - len(pending),
+            "downloaded": 0,
+            "failed": 0,
+        }
+        failed = []
+
+        def download_one(img_link, session):
+            return self.put(
+                make_thumbnail(fetch(img_link, session, retries, backoff), size)
+            )
+
+        os.makedirs(self.path, exist_ok=True)
+        new_manifest = not os.path.exists(self.manifest_path)
+        with open(
+            self.manifest_path, "a", newline=""
+        ) as manifest, requests.Session() as session:
+            writer = csv.writer(manifest)
+            if new_manifest:
+                writer.writerow(["img_link", "sha256"])
+            with ThreadPoolExecutor(n_threads) as executor:
+                futures = {
+                    executor.submit(download_one, img_link, session): img_link
+                    for img_link in pending
+                }
+                for future in as_completed(futures):
+                    img_link = futures[future]
+                    try:
+                        digest = future.result()
+                    # Any image that cannot be fetched or decoded (e.g. a
+                    # DecompressionBombError) is recorded as failed rather
+                    # than aborting the remaining downloads
+                    except Exception as e:
+                        print(f"Failed {img_link}: {e}")
+                        failed.append(img_link)
+                        continue
+                    self.hashes[img_link] = digest
+                    writer.writerow([img_link, digest])
+                    manifest.flush()
+                    summary["downloaded"] += 1
+        summary["failed"] = len(failed)
+        summary["failed_links"] = failed
+        return summary
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Download thumbnails of the catalogue images into the local thumbnail store."
+    )
+    parser.add_argument(
+        "--embeddings_file",
+        type=str,
+        default=EMBEDDINGS_PATH,
+        help="Parquet file of catalogue embeddings whose img_link column is downloaded.",
+    )
+    parser.add_argument(
+        "--store_dir", type=str, default=STORE_DIR, help="Thumbnail store directory."
+    )
+    parser.add_argument(
+        "--n_threads", type=int, default=16, help="Concurrent downloads."
+    )
+    parser.add_argument("--retries", type=int, default=3, help="Retries per image.")
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    img_links = pd.read_parquet(args.embeddings_file, columns=["img_link"])["img_link"]
+    store = ThumbnailStore(args.store_dir)
+    summary = store.download(
+        img_links.dropna().tolist(), n_threads=args.n_threads, retries=args.retries
+    )
+    print({key: value for key, value in summary.items() if key != "failed_links"})
@@ -0,0 +1,371 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from PIL import Image
+from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.layers import Conv2D, Dense, Dropout, Flatten, MaxPooling2D
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from computer_vision.constants import CLASS_NAMES
+
+IMAGE_SIZE = (150, 150)
+DATASET_DIR = "computer_vision/training_data"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Random transformations used to balance the classes, as in computer_vision.ipynb
+AUGMENTATION = dict(
+    rotation_range=40,
+    width_shift_range=0.2,
+    height_shift_range=0.2,
+    shear_range=0.2,
+    zoom_range=0.2,
+    horizontal_flip=True,
+    brightness_range=(0.5, 1.5),
+    fill_mode="nearest",
+)
+
+
+def assign_split(path, test_fraction=0.1, val_fraction=0.2):
+    """
+    Assign an image to 'train', 'val' or 'test' from a hash of its file name.
+
+    The split of an image never changes when images are added, and augmented
+    copies are only made of training images, so no variant of a test image
+    is trained on.
+    """
+    digest = hashlib.md5(os.path.basename(path).encode()).hexdigest()
+    u = int(digest[:8], 16) / 0xFFFFFFFF
+    if u < test_fraction:
+        return "test"
+    if u < test_fraction + val_fraction * (1 - test_fraction):
+        return "val"
+    return "train"
+
+
+def list_images(image_dir, test_fraction=0.1, val_fraction=0.2):
+    """
+    List the images of each category folder and assign them to splits.
+
+    Parameters:
+    - image_dir (str): Directory with one subfolder of images per category.
+    - test_fraction (float): Share of images held out for testing.
+    - val_fraction (float): Share of the remaining images used for validation.
+
+    Returns:
+    - images (pd.DataFrame): 'path', 'label' (index in CLASS_NAMES) and 'split'.
+    """
+    rows = []
+    for label, class_name in enumerate(CLASS_NAMES):
+        folder = os.path.join(image_dir, class_name)
+        for file in sorted(os.listdir(folder)):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(folder, file)
+                split = assign_split(path, test_fraction, val_fraction)
+                rows.append((path, label, split))
+    return pd.DataFrame(rows, columns=["path", "label", "split"])
+
+
+def plan_shards(images, target_count=2000, n_shards=16, seed=0):
+    """
+    Decide how many augmented copies of each training image to make and group images into shards.
+
+    Each class is brought up to about target_count training images. Images are
+    shuffled before being dealt to shards, so every shard mixes all classes.
+
+    Parameters:
+    - images (pd.DataFrame): Output of list_images.
+    - target_count (int): Training images per class after augmentation.
+    - n_shards (int): Training shards; validation and test get proportionally fewer.
+    - seed (int): Random seed.
+
+    Returns:
+    - tasks (list): (split, shard, n_shards_in_split, rows, seed) per shard, where rows
+      are (path, label, n_copies) tuples.
+    """
+    rng = np.random.default_rng(seed)
+    images = images.copy()
+    images["n_copies"] = 0
+    train = images["split"] == "train"
+    for label, n in images[train].groupby("label").size().items():
+        rows = images.index[train & (images["label"] == label)]
+        n_extra = max(0, target_count - n)
+        # Spread the extra images evenly, the remainder on random images
+        copies = np.full(n, n_extra // n)
+        copies[rng.choice(n, n_extra % n, replace=False)] += 1
+        images.loc[rows, "n_copies"] = copies
+
+    tasks = []
+    for split, split_images in images.groupby("split"):
+        n_images = len(split_images) + split_images["n_copies"].sum()
+        n_split_shards = max(
+            1, round(n_shards * n_images / (target_count * len(CLASS_NAMES)))
+        )
+        order = rng.permutation(len(split_images))
+        rows = list(split_images[["path", "label", "n_copies"]].itertuples(index=False))
+        for shard in range(n_split_shards):
+            shard_rows = [tuple(rows[i]) for i in order[shard::n_split_shards]]
+            tasks.append((split, shard, n_split_shards, shard_rows, seed + len(tasks)))
+    return tasks
+
+
+def encode_example(image, label):
+    """Serialise one JPEG-encoded image and its label as a tf.train.Example."""
+    output = io.BytesIO()
+    Image.fromarray(image).save(output, format="JPEG", quality=95)
+    feature = {
+        "image": tf.train.Feature(
+            bytes_list=tf.train.BytesList(value=[output.getvalue()])
+        ),
+        "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+    }
+    return tf.train.Example(
+        features=tf.train.Features(feature=feature)
+    ).SerializeToString()
+
+
+def write_shard(task, output_dir):
+    """
+    Write the images of one shard and their augmented copies to a TFRecord file.
+
+    Images are read, augmented and written one at a time, so a worker only holds
+    one image in memory.
+
+    Returns:
+    - split (str): Split of the shard.
+    - n_examples (int): Examples written.
+    """
+    split, shard, n_split_shards, rows, seed = task
+    np.random.seed(seed)  # ImageDataGenerator draws from the global generator
+    datagen = ImageDataGenerator(**AUGMENTATION)
+    path = os.path.join(
+        output_dir, f"{split}-{shard:05d}-of-{n_split_shards:05d}.tfrecord"
+    )
+    n_examples = 0
+    with tf.io.TFRecordWriter(path) as writer:
+        for image_path, label, n_copies in rows:
+            image = Image.open(image_path).convert("RGB").resize(IMAGE_SIZE)
+            image = np.asarray(image, dtype=np.float32)
+            writer.write(encode_example(image.astype(np.uint8), label))
+            for _ in range(n_copies):
+                augmented = datagen.random_transform(image)
+                augmented = np.clip(augmented, 0, 255).astype(np.uint8)
+                writer.write(encode_example(augmented, label))
+            n_examples += 1 + n_copies
+    return split, n_examples
+
+
+def _write_shard(args):
+    return write_shard(*args)
+
+
+def build_dataset(
+    image_dir,
+    output_dir=DATASET_DIR,
+    target_count=2000,
+    n_shards=16,
+    n_workers=None,
+    seed=0,
+):
+    """
+    Augment the category images in parallel and write them to sharded TFRecord files.
+
+    Parameters:
+    - image_dir (str): Directory with one subfolder of images per category.
+    - output_dir (str): Output directory of the shards.
+    - target_count (int): Training images per class after augmentation.
+    - n_shards (int): Number of training shards.
+    - n_workers (int): Worker processes. Defaults to the number of CPUs.
+    - seed (int): Random seed.
+
+    Returns:
+    - counts (dict): Examples written per split.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Shards of a previous build would otherwise be read with the new ones
+    for file in os.listdir(output_dir):
+        if file.endswith(".tfrecord"):
+            os.remove(os.path.join(output_dir, file))
+    tasks = plan_shards(list_images(image_dir), target_count, n_shards, seed)
+    counts = {}
+    # Spawned workers do not inherit the parent's TensorFlow state
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers or os.cpu_count()) as pool:
+        for split, n_examples in pool.imap_unordered(
+            _write_shard, [(task, output_dir) for task in tasks]
+        ):
+            counts[split] = counts.get(split, 0) + n_examples
+    with open(os.path.join(output_dir, "meta.json"), "w") as f:
+        json.dump({"counts": counts, "class_names": CLASS_NAMES}, f)
+    return counts
+
+
+def parse_example(serialized):
+    """Decode one example into a normalised image and its label."""
+    features = tf.io.parse_single_example(
+        serialized,
+        {
+            "image": tf.io.FixedLenFeature([], tf.string),
+            "label": tf.io.FixedLenFeature([], tf.int64),
+        },
+    )
+    image = tf.io.decode_jpeg(features["image"], channels=3)
+    image = tf.cast(tf.reshape(image, IMAGE_SIZE + (3,)), tf.float32) / 255.0
+    return image, tf.cast(features["label"], tf.int32)
+
+
+def load_dataset(
+    split, dataset_dir=DATASET_DIR, batch_size=128, shuffle_buffer=4096, seed=0
+):
+    """
+    Stream a split from its TFRecord shards.
+
+    Shards are read in parallel and examples decoded on all cores while the
+    model trains on the previous batch. Only the shuffle buffer and a few
+    batches are held in memory, however large the dataset.
+
+    Parameters:
+    - split (str): 'train', 'val' or 'test'.
+    - dataset_dir (str): Directory of the shards.
+    - batch_size (int): Examples per batch.
+    - shuffle_buffer (int): Examples shuffled at a time; 0 keeps file order.
+    - seed (int): Shuffle seed.
+
+    Returns:
+    - dataset (tf.data.Dataset): Batches of (images, labels).
+    """
+    files = tf.data.Dataset.list_files(
+        os.path.join(dataset_dir, f"{split}-*.tfrecord"),
+        shuffle=shuffle_buffer > 0,
+        seed=seed,
+    )
+    dataset = files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=False,
+    )
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+    dataset = dataset.map(parse_example, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def build_model():
+    """Product categorisation CNN, as trained in computer_vision.ipynb."""
+    model = Sequential(
+        [
+            Conv2D(
+                filters=32,
+                kernel_size=3,
+                activation="relu",
+                input_shape=IMAGE_SIZE + (3,),
+            ),
+            MaxPooling2D(pool_size=2),
+            Dropout(0.2),
+            Flatten(),
+            Dense(32, activation="relu"),
+            Dense(len(CLASS_NAMES), activation="softmax"),
+        ]
+    )
+    model.compile(
+        optimizer="adam",
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    return model
+
+
+def train(
+    dataset_dir=DATASET_DIR, model_dir="computer_vision", epochs=20, batch_size=128
+):
+    """
+    Train the categorisation model on the streamed shards and save it where the app loads it.
+
+    Parameters:
+    - dataset_dir (str): Directory of the shards.
+    - model_dir (str): Directory to save model.json and model.weights.h5 to.
+    - epochs (int): Maximum epochs; training stops early when validation loss stops improving.
+    - batch_size (int): Examples per batch.
+
+    Returns:
+    - test_metrics (dict): Loss and accuracy on the test split.
+    """
+    model = build_model()
+    model.fit(
+        load_dataset("train", dataset_dir, batch_size),
+        validation_data=load_dataset("val", dataset_dir, batch_size, shuffle_buffer=0),
+        epochs=epochs,
+        callbacks=[EarlyStopping(monitor="val_loss", patience=3)],
+    )
+    test_metrics = model.evaluate(
+        load_dataset("test", dataset_dir, batch_size, shuffle_buffer=0),
+        return_dict=True,
+    )
+    with open(os.path.join(model_dir, "model.json"), "w") as f:
+        f.write(model.to_json())
+    model.save_weights(os.path.join(model_dir, "model.weights.h5"))
+    return test_metrics
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Build sharded, augmented training data for the product categorisation model and train it."
+    )
+    parser.add_argument(
+        "--image_dir",
+        type=str,
+        default=None,
+        help="Directory with one subfolder of images per category. Builds the shards when given.",
+    )
+    parser.add_argument(
+        "--dataset_dir", type=str, default=DATASET_DIR, help="Directory of the shards."
+    )
+    parser.add_argument(
+        "--target_count",
+        type=int,
+        default=2000,
+        help="Training images per class after augmentation.",
+    )
+    parser.add_argument(
+        "--n_shards", type=int, default=16, help="Number of training shards."
+    )
+    parser.add_argument(
+        "--n_workers", type=int, default=None, help="Augmentation worker processes."
+    )
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=20,
+        help="Training epochs; 0 only builds the shards.",
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="computer_vision",
+        help="Directory to save the trained model to.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    if args.image_dir:
+        print(
+            build_dataset(
+                args.image_dir,
+                args.dataset_dir,
+                args.target_count,
+                args.n_shards,
+                args.n_workers,
+            )
+        )
+    if args.epochs:
+        print(train(args.dataset_dir, args.model_dir, args.epochs))
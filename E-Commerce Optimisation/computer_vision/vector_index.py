@@ -0,0 +1,399 @@
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+INDEX_DIR = "computer_vision/vector_index"
+KNN_PATH = "computer_vision/knn_pickle_file"
+CATALOG_PATH = "computer_vision/amazon_embeddings.csv"
+EMBEDDINGS_PATH = "computer_vision/catalog_embeddings.parquet"
+
+VECTORS_FILE = "vectors.f32"
+ITEMS_FILE = "items.csv"
+META_FILE = "meta.json"
+
+
+def normalize(x):
+    """Scale rows to unit length so inner products are cosine similarities."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def fit_projection(x, n_components, max_rows=5000, n_iter=2, seed=0):
+    """
+    Fit a PCA-style projection onto the top singular directions of the embeddings.
+
+    The embeddings are not centred, so inner products of projected vectors
+    approximate the cosine similarities of the original unit vectors.
+
+    Parameters:
+    - x (np.ndarray): Unit-length embeddings.
+    - n_components (int): Dimensions kept.
+    - max_rows (int): Rows sampled to fit the projection.
+    - n_iter (int): Power iterations of the randomized SVD.
+    - seed (int): Random seed.
+
+    Returns:
+    - components (np.ndarray): Projection, shape (d, n_components).
+    """
+    rng = np.random.default_rng(seed)
+    if len(x) > max_rows:
+        x = x[rng.choice(len(x), max_rows, replace=False)]
+    n_components = min(n_components, *x.shape)
+
+    # Range of x from a few oversampled random projections, refined by power
+    # iterations; far cheaper than a full SVD of 25,088-dim VGG16 features
+    q = x @ rng.standard_normal((x.shape[1], n_components + 10), dtype=np.float32)
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(x @ (x.T @ q))
+    q, _ = np.linalg.qr(q)
+    _, _, vt = np.linalg.svd(q.T @ x, full_matrices=False)
+    return vt[:n_components].T.astype(np.float32)
+
+
+def kmeans(x, n_clusters, n_iter=20, seed=0):
+    """Spherical k-means on unit vectors; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)]
+    for _ in range(n_iter):
+        assignments = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, x)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters with random points
+        sums[empty] = x[rng.choice(len(x), empty.sum())]
+        centroids = normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """
+    Inverted-file (IVF) index of image embeddings with cosine similarity.
+
+    Vectors are stored as float32 in a memory-mapped file, optionally reduced
+    with PCA. Queries only scan the n_probe lists whose centroids are closest to
+    the query. New catalogue images can be appended without rebuilding; their
+    vectors go to the nearest existing list.
+
+    Parameters:
+    - path (str): Index directory.
+    """
+
+    def __init__(self, path=INDEX_DIR):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.items = pd.read_csv(os.path.join(path, ITEMS_FILE))
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.assignments = np.load(os.path.join(path, "assignments.npy"))
+        if self.meta["pca"]:
+            self.components = np.load(os.path.join(path, "pca_components.npy"))
+        self._map_vectors()
+        self._build_lists()
+
+    @property
+    def dim(self):
+        return self.meta["dim"]
+
+    @property
+    def input_dim(self):
+        """Dimensions of the raw embeddings the index was built from."""
+        return self.components.shape[0] if self.meta["pca"] else self.dim
+
+    def __len__(self):
+        return self.meta["n"]
+
+    def _map_vectors(self):
+        self.vectors = np.memmap(
+            os.path.join(self.path, VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(self.meta["n"], self.dim),
+        )
+
+    def _build_lists(self):
+        """Group row numbers by list so each list is one contiguous slice."""
+        self.list_rows = np.argsort(self.assignments, kind="stable")
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.list_offsets = np.r_[0, np.cumsum(counts)]
+
+    def transform(self, embeddings):
+        """Map raw embeddings into the index space: unit length, then projected if enabled."""
+        x = normalize(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        )
+        if self.meta["pca"]:
+            x = x @ self.components
+        return x
+
+    @classmethod
+    def build(
+        cls, embeddings, items, path=INDEX_DIR, n_lists=None, pca_dim=512, seed=0
+    ):
+        """
+        Build an index and write it to path.
+
+        Parameters:
+        - embeddings (np.ndarray): Raw embeddings, one row per item.
+        - items (pd.DataFrame): Item details (e.g. product_id, img_link) in the same order.
+        - path (str): Index directory.
+        - n_lists (int): Number of inverted lists. Defaults to about sqrt(n).
+        - pca_dim (int): Dimensions kept by PCA, or None to store full embeddings.
+        - seed (int): Random seed for PCA sampling and k-means.
+
+        Returns:
+        - index (VectorIndex): The built index.
+        """
+        os.makedirs(path, exist_ok=True)
+        x = normalize(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        )
+        pca = pca_dim is not None and pca_dim < x.shape[1]
+        if pca:
+            components = fit_projection(x, pca_dim, seed=seed)
+            np.save(os.path.join(path, "pca_components.npy"), components)
+            x = x @ components
+        elif os.path.exists(os.path.join(path, "pca_components.npy")):
+            os.remove(os.path.join(path, "pca_components.npy"))
+
+        n_lists = n_lists or max(1, int(np.sqrt(len(x))))
+        centroids = kmeans(x, min(n_lists, len(x)), seed=seed)
+        assignments = np.argmax(x @ centroids.T, axis=1).astype(np.int32)
+
+        x.tofile(os.path.join(path, VECTORS_FILE))
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "assignments.npy"), assignments)
+        items.reset_index(drop=True).to_csv(os.path.join(path, ITEMS_FILE), index=False)
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(
+                {"n": len(x), "dim": x.shape[1], "pca": bool(pca), "metric": "cosine"},
+                f,
+            )
+        return cls(path)
+
+    def add(self, embeddings, items):
+        """
+        Append new items to the index without rebuilding it.
+
+        Parameters:
+        - embeddings (np.ndarray): Raw embeddings of the new items.
+        - items (pd.DataFrame): Details of the new items, same columns as the index items.
+        """
+        x = self.transform(embeddings)
+        assignments = np.argmax(x @ self.centroids.T, axis=1).astype(np.int32)
+        with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+            x.tofile(f)
+        self.assignments = np.concatenate([self.assignments, assignments])
+        np.save(os.path.join(self.path, "assignments.npy"), self.assignments)
+        self.items = pd.concat([self.items, items], ignore_index=True)
+        self.items.to_csv(os.path.join(self.path, ITEMS_FILE), index=False)
+        self.meta["n"] += len(x)
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(self.meta, f)
+        self._map_vectors()
+        self._build_lists()
+
+    def search(self, embeddings, k=5, n_probe=8):
+        """
+        Find the k nearest items of each query.
+
+        Parameters:
+        - embeddings (np.ndarray): Raw query embeddings.
+        - k (int): Number of neighbours.
+        - n_probe (int): Number of lists scanned per query.
+
+        Returns:
+        - distances (np.ndarray): Cosine distances, shape (queries, k), NaN-padded.
+        - indices (np.ndarray): Item rows, shape (queries, k), -1-padded.
+        """
+        queries = self.transform(embeddings)
+        n_probe = min(n_probe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :n_probe]
+
+        distances = np.full((len(queries), k), np.nan, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate(
+                [
+                    self.list_rows[self.list_offsets[j] : self.list_offsets[j + 1]]
+                    for j in lists
+                ]
+            )
+            top = min(k, len(rows))
+            if top == 0:
+                continue
+            rows.sort()  # Sequential reads from the memory map
+            sims = self.vectors[rows] @ query
+            best = np.argpartition(-sims, top - 1)[:top]
+            best = best[np.argsort(-sims[best])]
+            distances[i, :top] = 1 - sims[best]
+            indices[i, :top] = rows[best]
+        return distances, indices
+
+
+def exact_search(vectors, queries, k=5):
+    """Brute-force cosine k-nearest neighbours, the baseline for recall."""
+    sims = normalize(queries) @ normalize(vectors).T
+    indices = np.argsort(-sims, axis=1)[:, :k]
+    return 1 - np.take_along_axis(sims, indices, axis=1), indices
+
+
+def benchmark(index, embeddings, queries, k=5, n_probes=(1, 2, 4, 8, 16, 32)):
+    """
+    Compare recall@k and latency of the index against exact search.
+
+    Parameters:
+    - index (VectorIndex): Index built from embeddings.
+    - embeddings (np.ndarray): Raw embeddings the index was built from, in index order.
+    - queries (np.ndarray): Raw query embeddings.
+    - k (int): Number of neighbours.
+    - n_probes (list): n_probe values to test.
+
+    Returns:
+    - results (pd.DataFrame): 'method', 'n_probe', 'recall_at_k' and 'latency_ms' per query.
+    """
+    start = time.perf_counter()
+    _, truth = exact_search(embeddings, queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = [
+        {"method": "exact", "n_probe": None, "recall_at_k": 1.0, "latency_ms": exact_ms}
+    ]
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        _, found = index.search(queries, k, n_probe)
+        latency = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        rows.append(
+            {
+                "method": "ivf",
+                "n_probe": n_probe,
+                "recall_at_k": recall,
+                "latency_ms": latency,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def load_knn_embeddings(knn_path=KNN_PATH, catalog_path=CATALOG_PATH):
+    """
+    Recover the embeddings and catalogue rows behind the pickled KNN model.
+
+    The embeddings column of the catalogue CSV was saved as truncated text, so the
+    vectors are read from the data the NearestNeighbors model was fitted on.
+    """
+    with open(knn_path, "rb") as f:
+        knn_model = pickle.load(f)
+    catalog = pd.read_csv(catalog_path).drop(columns="embedding")
+    return np.asarray(knn_model._fit_X, dtype=np.float32), catalog
+
+
+def save_embeddings(items, embeddings, path=EMBEDDINGS_PATH):
+    """
+    Save catalogue embeddings to a Parquet file.
+
+    Embeddings are stored as a fixed-size list column of float32 next to the item
+    columns, so they are read back as one contiguous array.
+
+    Parameters:
+    - items (pd.DataFrame): Item details (e.g. product_id, img_link), one row per embedding.
+    - embeddings (np.ndarray): Embeddings, shape (n, dim).
+    - path (str): Output file.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    table = pa.Table.from_pandas(items.reset_index(drop=True), preserve_index=False)
+    column = pa.FixedSizeListArray.from_arrays(
+        pa.array(embeddings.ravel()), embeddings.shape[1]
+    )
+    pq.write_table(table.append_column("embedding", column), path)
+
+
+def load_embeddings(path=EMBEDDINGS_PATH):
+    """
+    Load catalogue embeddings saved with save_embeddings.
+
+    Returns:
+    - embeddings (np.ndarray): Embeddings, shape (n, dim).
+    - items (pd.DataFrame): Item details in the same order.
+    """
+    table = pq.read_table(path)
+    column = table.column("embedding").combine_chunks()
+    embeddings = column.flatten().to_numpy().reshape(len(column), column.type.list_size)
+    items = table.drop_columns("embedding").to_pandas()
+    return embeddings, items
+
+
+def load_or_build_index(
+    path=INDEX_DIR, embeddings_path=EMBEDDINGS_PATH, knn_path=KNN_PATH, **kwargs
+):
+    """
+    Load the index, building it the first time.
+
+    The index is built from the saved catalogue embeddings. Until they have been
+    computed with python -m computer_vision.embeddings, it is built from the
+    flattened VGG16 features of the pickled KNN model instead; index.input_dim
+    tells which embedding model the index expects.
+    """
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        if os.path.exists(embeddings_path):
+            embeddings, items = load_embeddings(embeddings_path)
+        elif os.path.exists(knn_path):
+            embeddings, items = load_knn_embeddings(knn_path)
+        else:
+            raise FileNotFoundError(
+                f"Neither {embeddings_path} nor {knn_path} found; run python -m computer_vision.embeddings"
+            )
+        return VectorIndex.build(embeddings, items, path=path, **kwargs)
+    return VectorIndex(path)
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Build the similar product index and benchmark it against exact search."
+    )
+    parser.add_argument(
+        "--index_dir", type=str, default=INDEX_DIR, help="Index directory."
+    )
+    parser.add_argument(
+        "--embeddings_file",
+        type=str,
+        default=EMBEDDINGS_PATH,
+        help="Parquet file of catalogue embeddings.",
+    )
+    parser.add_argument(
+        "--pca_dim",
+        type=int,
+        default=0,
+        help="Dimensions kept by PCA; 0 stores full embeddings.",
+    )
+    parser.add_argument(
+        "--n_lists", type=int, default=None, help="Number of inverted lists."
+    )
+    parser.add_argument(
+        "--n_queries", type=int, default=200, help="Catalogue items used as queries."
+    )
+    parser.add_argument("--k", type=int, default=5, help="Number of neighbours.")
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    embeddings, catalog = load_embeddings(args.embeddings_file)
+    index = VectorIndex.build(
+        embeddings,
+        catalog,
+        path=args.index_dir,
+        n_lists=args.n_lists,
+        pca_dim=args.pca_dim or None,
+    )
+    rng = np.random.default_rng(0)
+    queries = embeddings[
+        rng.choice(len(embeddings), min(args.n_queries, len(embeddings)), replace=False)
+    ]
+    print(benchmark(index, embeddings, queries, k=args.k).to_string(index=False))
@@ -13,6 +13,7 @@ CREATE TABLE IF NOT EXISTS products (
 
 -- Create the 'ratings' table
 CREATE TABLE IF NOT EXISTS ratings (
+    review_id SERIAL PRIMARY KEY,
     product_id VARCHAR(50) REFERENCES products(product_id) ON DELETE CASCADE,
     average_rating FLOAT,
     review_title VARCHAR(1000),
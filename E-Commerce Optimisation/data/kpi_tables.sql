@@ -0,0 +1,155 @@
+-- Shipping KPI tables read by the Supply Chain Efficiency tab. They are kept up
+-- to date from new 'shipping_history' rows by the trigger below; run
+-- SELECT rebuild_shipping_kpis(); after deleting or updating history rows.
+
+-- Create the 'shipping_product_kpis' table
+CREATE TABLE IF NOT EXISTS shipping_product_kpis (
+    product_id VARCHAR(50) PRIMARY KEY,
+    returned_count BIGINT NOT NULL DEFAULT 0,
+    cancelled_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- Create the 'shipping_step_durations' table (sum and count, so means can be updated incrementally)
+CREATE TABLE IF NOT EXISTS shipping_step_durations (
+    status VARCHAR(255),
+    fulfilment_service_level VARCHAR(255),
+    total_days BIGINT NOT NULL DEFAULT 0,
+    n_days BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (status, fulfilment_service_level)
+);
+
+-- Create the 'kpi_refresh' table
+CREATE TABLE IF NOT EXISTS kpi_refresh (
+    name VARCHAR(50) PRIMARY KEY,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+-- Add (direction = 1) or subtract (direction = -1) the step durations of shipments
+-- that went through every step in order. ids = NULL covers all shipments; rows
+-- listed in excluded_ids/excluded_statuses are left out, which gives the totals as
+-- they were before those rows were inserted.
+CREATE OR REPLACE FUNCTION add_shipping_step_totals(
+    ids INT[], excluded_ids INT[], excluded_statuses VARCHAR[], direction INT
+) RETURNS VOID AS $$
+    WITH steps AS (
+        SELECT * FROM (
+            VALUES
+                ('Pending', 0),
+                ('Packed', 1),
+                ('At logistics facility', 2),
+                ('Shipping', 3),
+                ('Delivered to buyer', 4)
+        ) AS t(status, step)
+    ),
+    excluded AS (
+        SELECT * FROM unnest(excluded_ids, excluded_statuses) AS e(shipping_id, status)
+    ),
+    history AS (
+        SELECT h.shipping_id, h.status, h.update_date, st.step
+        FROM shipping_history AS h
+        LEFT JOIN steps AS st ON h.status = st.status
+        WHERE (ids IS NULL OR h.shipping_id = ANY(ids))
+        AND NOT EXISTS (
+            SELECT 1 FROM excluded AS e
+            WHERE e.shipping_id = h.shipping_id AND e.status = h.status
+        )
+    ),
+    ordered AS (
+        SELECT
+            shipping_id, status, step,
+            ROW_NUMBER() OVER w - 1 AS step_position,
+            update_date - LAG(update_date) OVER w AS days_from_previous
+        FROM history
+        WINDOW w AS (PARTITION BY shipping_id ORDER BY update_date, step)
+    ),
+    valid AS (
+        SELECT shipping_id
+        FROM ordered
+        GROUP BY shipping_id
+        HAVING COUNT(*) = 5 AND BOOL_AND(COALESCE(step = step_position, FALSE))
+    ),
+    totals AS (
+        SELECT
+            o.status,
+            s.fulfilment || ' + ' || s.ship_service_level AS fulfilment_service_level,
+            SUM(o.days_from_previous) AS total_days,
+            COUNT(o.days_from_previous) AS n_days
+        FROM ordered AS o
+        JOIN valid AS v ON o.shipping_id = v.shipping_id
+        JOIN shipping_status AS s ON o.shipping_id = s.shipping_id
+        WHERE o.step > 0
+        AND s.fulfilment IS NOT NULL
+        AND s.ship_service_level IS NOT NULL
+        GROUP BY 1, 2
+    )
+    INSERT INTO shipping_step_durations (status, fulfilment_service_level, total_days, n_days)
+    SELECT status, fulfilment_service_level, direction * total_days, direction * n_days
+    FROM totals
+    ON CONFLICT (status, fulfilment_service_level) DO UPDATE SET
+        total_days = shipping_step_durations.total_days + EXCLUDED.total_days,
+        n_days = shipping_step_durations.n_days + EXCLUDED.n_days;
+$$ LANGUAGE SQL;
+
+-- Apply the rows inserted by one statement to the KPI tables
+CREATE OR REPLACE FUNCTION refresh_shipping_kpis() RETURNS TRIGGER AS $$
+DECLARE
+    new_ids INT[];
+    new_statuses VARCHAR[];
+BEGIN
+    INSERT INTO shipping_product_kpis (product_id, returned_count, cancelled_count)
+    SELECT
+        s.product_id,
+        COUNT(*) FILTER (WHERE n.status = 'Returned'),
+        COUNT(*) FILTER (WHERE n.status = 'Cancelled')
+    FROM new_rows AS n
+    JOIN shipping_status AS s ON n.shipping_id = s.shipping_id
+    WHERE n.status IN ('Returned', 'Cancelled') AND s.product_id IS NOT NULL
+    GROUP BY s.product_id
+    ON CONFLICT (product_id) DO UPDATE SET
+        returned_count = shipping_product_kpis.returned_count + EXCLUDED.returned_count,
+        cancelled_count = shipping_product_kpis.cancelled_count + EXCLUDED.cancelled_count;
+
+    -- Replace the contribution of every shipment that received new rows
+    SELECT ARRAY_AGG(shipping_id), ARRAY_AGG(status) INTO new_ids, new_statuses
+    FROM new_rows;
+    IF new_ids IS NOT NULL THEN
+        PERFORM add_shipping_step_totals(new_ids, new_ids, new_statuses, -1);
+        PERFORM add_shipping_step_totals(new_ids, NULL, NULL, 1);
+    END IF;
+
+    INSERT INTO kpi_refresh (name, updated_at) VALUES ('shipping', NOW())
+    ON CONFLICT (name) DO UPDATE SET updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute the KPI tables from all of 'shipping_history'
+CREATE OR REPLACE FUNCTION rebuild_shipping_kpis() RETURNS VOID AS $$
+BEGIN
+    TRUNCATE shipping_product_kpis, shipping_step_durations;
+
+    INSERT INTO shipping_product_kpis (product_id, returned_count, cancelled_count)
+    SELECT
+        s.product_id,
+        COUNT(*) FILTER (WHERE h.status = 'Returned'),
+        COUNT(*) FILTER (WHERE h.status = 'Cancelled')
+    FROM shipping_history AS h
+    JOIN shipping_status AS s ON h.shipping_id = s.shipping_id
+    WHERE h.status IN ('Returned', 'Cancelled') AND s.product_id IS NOT NULL
+    GROUP BY s.product_id;
+
+    PERFORM add_shipping_step_totals(NULL, NULL, NULL, 1);
+
+    INSERT INTO kpi_refresh (name, updated_at) VALUES ('shipping', NOW())
+    ON CONFLICT (name) DO UPDATE SET updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS shipping_history_kpis ON shipping_history;
+CREATE TRIGGER shipping_history_kpis
+AFTER INSERT ON shipping_history
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION refresh_shipping_kpis();
+
+-- Build the KPI tables from the data loaded by init.sql
+SELECT rebuild_shipping_kpis();
@@ -0,0 +1,12 @@
+-- VADER compound scores of 'ratings' reviews, written by
+-- sentiment_analysis/score_reviews.py.
+
+-- Give reviews a primary key on databases created before 'ratings' had one
+ALTER TABLE ratings ADD COLUMN IF NOT EXISTS review_id SERIAL PRIMARY KEY;
+
+-- Create the 'review_sentiment' table
+CREATE TABLE IF NOT EXISTS review_sentiment (
+    review_id INTEGER PRIMARY KEY REFERENCES ratings(review_id) ON DELETE CASCADE,
+    compound FLOAT NOT NULL,
+    scored_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,33 @@
+-- Topics of negative reviews, written by sentiment_analysis/topic_model.py.
+
+-- 'ratings.review_id' is added to existing databases by review_sentiment.sql
+
+-- Create the 'topic_terms' table: the top words of each topic of the current model
+CREATE TABLE IF NOT EXISTS topic_terms (
+    topic INTEGER PRIMARY KEY,
+    top_words TEXT NOT NULL
+);
+
+-- Create the 'review_topics' table: the topic distribution of each negative
+-- review. A 'ratings' row holds several comma-separated reviews; review_index
+-- is the position of the review in the row
+CREATE TABLE IF NOT EXISTS review_topics (
+    review_id INTEGER REFERENCES ratings(review_id) ON DELETE CASCADE,
+    review_index INTEGER,
+    product_id VARCHAR(50) REFERENCES products(product_id) ON DELETE CASCADE,
+    topic INTEGER,
+    weight FLOAT NOT NULL,
+    PRIMARY KEY (review_id, review_index, topic)
+);
+
+CREATE INDEX IF NOT EXISTS review_topics_product_id_idx ON review_topics(product_id);
+
+-- Create the 'product_topic_summary' table: how many of a product's negative
+-- reviews are mainly about each topic, read by the Sentiment Analysis tab
+CREATE TABLE IF NOT EXISTS product_topic_summary (
+    product_id VARCHAR(50) REFERENCES products(product_id) ON DELETE CASCADE,
+    topic INTEGER,
+    n_reviews INTEGER NOT NULL,
+    share FLOAT NOT NULL,
+    PRIMARY KEY (product_id, topic)
+);
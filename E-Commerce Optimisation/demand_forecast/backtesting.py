@@ -0,0 +1,353 @@
+import argparse
+import hashlib
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import psutil
+
+from demand_forecast.demand_forecasting import feature_engineering
+
+DEFAULT_LGB_PARAMS = {
+    "objective": "regression",
+    "metric": "mae",
+    "bagging_fraction": 0.5,
+    "feature_fraction": 0.1,
+    "lambda_l1": 0.0,
+    "lambda_l2": 3.0,
+    "max_depth": 9,
+    "min_child_weight": 50.110469118530524,
+    "min_split_gain": 0.001,
+    "num_leaves": 35,
+    "verbose": -1,
+}
+
+
+def smape(preds, target):
+    """
+    Symmetric mean absolute percentage error, ignoring points where both values are 0.
+
+    Parameters:
+    - preds (np.ndarray): Predicted sales.
+    - target (np.ndarray): Actual sales.
+
+    Returns:
+    - smape_val (float): SMAPE in percent.
+    """
+    n = len(preds)
+    masked_arr = ~((preds == 0) & (target == 0))
+    preds, target = preds[masked_arr], target[masked_arr]
+    num = np.abs(preds - target)
+    denom = np.abs(preds) + np.abs(target)
+    smape_val = (200 * np.sum(num / denom)) / n
+    return smape_val
+
+
+def rolling_origin_cutoffs(dates, n_cutoffs=3, horizon=30, step=None):
+    """
+    Generate evenly spaced forecast origins that each leave a full horizon of actuals.
+
+    Parameters:
+    - dates (pd.Series): Dates of the sales history.
+    - n_cutoffs (int): Number of forecast origins.
+    - horizon (int): Number of days forecast after each origin.
+    - step (int): Days between consecutive origins. Defaults to the horizon.
+
+    Returns:
+    - cutoffs (list): List of pd.Timestamp origins, oldest first.
+    """
+    step = step or horizon
+    last_date = pd.to_datetime(dates).max()
+    last_cutoff = last_date - pd.Timedelta(days=horizon)
+    return [
+        last_cutoff - pd.Timedelta(days=step * i) for i in reversed(range(n_cutoffs))
+    ]
+
+
+def _data_digest(sales_df):
+    """Short content hash of the sales history, used to key the feature cache."""
+    row_hashes = pd.util.hash_pandas_object(sales_df, index=False).values
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:12]
+
+
+def build_cutoff_features(sales_df, cutoff, horizon, cache_dir=None, digest=None):
+    """
+    Build (or load from cache) the feature matrix for one forecast origin.
+
+    Sales after the cutoff are hidden before feature engineering so that lag and
+    rolling features for the horizon only see history up to the cutoff.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Sales history with 'date', 'product_id' and 'sales' columns.
+    - cutoff (pd.Timestamp): Last date treated as known history.
+    - horizon (int): Number of days to forecast after the cutoff.
+    - cache_dir (str): Directory for cached feature matrices. No caching if None.
+    - digest (str): Content hash of sales_df; computed if not given.
+
+    Returns:
+    - features (pd.DataFrame): Engineered features, with 'actual_sales' holding the raw horizon sales.
+    """
+    cutoff = pd.Timestamp(cutoff)
+    cache_path = None
+    if cache_dir is not None:
+        digest = digest or _data_digest(sales_df)
+        cache_path = os.path.join(
+            cache_dir, f"features_{digest}_{cutoff:%Y%m%d}_{horizon}.pkl"
+        )
+        if os.path.exists(cache_path):
+            return pd.read_pickle(cache_path)
+
+    df = sales_df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    df = df[df["date"] <= cutoff + pd.Timedelta(days=horizon)]
+    df = df.sort_values(["product_id", "date"]).reset_index(drop=True)
+    actual_sales = df["sales"].where(df["date"] > cutoff)
+    df["sales"] = df["sales"].where(df["date"] <= cutoff)
+
+    # Seed the noise added to lag features so cached and fresh runs agree
+    np.random.seed(int(cutoff.strftime("%Y%m%d")))
+    features = feature_engineering(df)
+    features["actual_sales"] = actual_sales.values
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        features.to_pickle(cache_path)
+    return features
+
+
+def run_cutoff(sales_df, cutoff, horizon, params, num_boost_round, cache_dir, digest):
+    """
+    Train on history up to one cutoff and forecast the following horizon.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Sales history with 'date', 'product_id' and 'sales' columns.
+    - cutoff (pd.Timestamp): Forecast origin.
+    - horizon (int): Number of days to forecast.
+    - params (dict): LightGBM parameters.
+    - num_boost_round (int): Number of boosting rounds.
+    - cache_dir (str): Directory for cached feature matrices.
+    - digest (str): Content hash of sales_df.
+
+    Returns:
+    - predictions (pd.DataFrame): 'cutoff', 'date', 'product_id', 'actual' and 'forecast' columns.
+    - run_stats (dict): Wall time, peak memory and throughput of the run.
+    """
+    # Memory is read from the OS, so LightGBM's native allocations are counted
+    # and timing carries no tracing overhead
+    start_rss = psutil.Process().memory_info().rss
+    start = time.perf_counter()
+
+    features = build_cutoff_features(sales_df, cutoff, horizon, cache_dir, digest)
+    feature_time = time.perf_counter() - start
+
+    cols = [
+        col
+        for col in features.columns
+        if col not in ["date", "sales", "year", "actual_sales"]
+    ]
+    train = features.loc[~features["sales"].isna()]
+    test = features.loc[features["sales"].isna() & ~features["actual_sales"].isna()]
+
+    model = lgb.train(
+        params,
+        lgb.Dataset(data=train[cols], label=train["sales"], feature_name=cols),
+        num_boost_round=num_boost_round,
+    )
+    preds = np.expm1(model.predict(test[cols]))
+
+    wall_time = time.perf_counter() - start
+    # ru_maxrss is the peak of the whole process, in kilobytes on Linux; each
+    # cutoff runs in a fresh worker process, so it is the peak of this run
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    predictions = pd.DataFrame(
+        {
+            "cutoff": pd.Timestamp(cutoff),
+            "date": test["date"].values,
+            "product_id": test["product_id"].values,
+            "actual": test["actual_sales"].values,
+            "forecast": preds,
+        }
+    )
+    n_rows = len(train) + len(test)
+    run_stats = {
+        "cutoff": pd.Timestamp(cutoff),
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "feature_seconds": feature_time,
+        "wall_seconds": wall_time,
+        "rows_per_second": n_rows / wall_time if wall_time > 0 else np.nan,
+        "max_rss_mb": peak_rss / 1024**2,
+        "rss_growth_mb": max(0, peak_rss - start_rss) / 1024**2,
+    }
+    return predictions, run_stats
+
+
+def score_forecasts(predictions):
+    """
+    Score forecasts per product and overall for every cutoff.
+
+    Parameters:
+    - predictions (pd.DataFrame): Output of run_cutoff, possibly for several cutoffs.
+
+    Returns:
+    - per_product (pd.DataFrame): SMAPE, MAE and RMSE per cutoff and product.
+    - overall (pd.DataFrame): SMAPE, MAE and RMSE per cutoff.
+    """
+    df = predictions.copy()
+    err = df["forecast"] - df["actual"]
+    denom = df["forecast"].abs() + df["actual"].abs()
+    # Same convention as smape(): points where both are 0 count as zero error
+    df["smape_term"] = np.where(
+        denom == 0, 0.0, 200 * err.abs() / denom.where(denom != 0, 1)
+    )
+    df["abs_err"] = err.abs()
+    df["sq_err"] = err**2
+
+    def _aggregate(keys):
+        scores = df.groupby(keys).agg(
+            smape=("smape_term", "mean"),
+            mae=("abs_err", "mean"),
+            mse=("sq_err", "mean"),
+            n=("abs_err", "size"),
+        )
+        scores["rmse"] = np.sqrt(scores.pop("mse"))
+        return scores.reset_index()
+
+    return _aggregate(["cutoff", "product_id"]), _aggregate(["cutoff"])
+
+
+def backtest(
+    sales_df,
+    cutoffs,
+    horizon=30,
+    params=None,
+    num_boost_round=1000,
+    n_jobs=None,
+    cache_dir=None,
+):
+    """
+    Run a rolling-origin backtest with one process per cutoff.
+
+    Each cutoff runs in a fresh worker process, so its peak memory is its own,
+    and LightGBM gets num_threads = cpu_count // n_jobs so the workers together
+    do not oversubscribe the CPUs.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Sales history with 'date', 'product_id' and 'sales' columns.
+    - cutoffs (list): Forecast origins.
+    - horizon (int): Number of days forecast after each origin.
+    - params (dict): LightGBM parameters. Defaults to DEFAULT_LGB_PARAMS.
+    - num_boost_round (int): Number of boosting rounds.
+    - n_jobs (int): Number of worker processes. Defaults to the number of cutoffs, up to the number of CPUs.
+    - cache_dir (str): Directory for cached feature matrices.
+
+    Returns:
+    - per_product (pd.DataFrame): Accuracy per cutoff and product.
+    - overall (pd.DataFrame): Accuracy per cutoff, joined with the run's cost statistics.
+    """
+    n_cpus = os.cpu_count() or 1
+    n_jobs = n_jobs or min(len(cutoffs), n_cpus)
+    params = {
+        **DEFAULT_LGB_PARAMS,
+        "num_threads": max(1, n_cpus // n_jobs),
+        **(params or {}),
+    }
+    digest = _data_digest(sales_df)
+
+    with ProcessPoolExecutor(max_workers=n_jobs, max_tasks_per_child=1) as executor:
+        futures = [
+            executor.submit(
+                run_cutoff,
+                sales_df,
+                cutoff,
+                horizon,
+                params,
+                num_boost_round,
+                cache_dir,
+                digest,
+            )
+            for cutoff in cutoffs
+        ]
+        results = [future.result() for future in futures]
+
+    predictions = pd.concat([preds for preds, _ in results], ignore_index=True)
+    run_stats = pd.DataFrame([stats for _, stats in results])
+
+    per_product, overall = score_forecasts(predictions)
+    overall = overall.merge(run_stats, on="cutoff", how="left")
+    return per_product, overall
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Rolling-origin backtest of the LightGBM demand forecasting model."
+    )
+    parser.add_argument(
+        "--sales_data",
+        type=str,
+        required=True,
+        help="Path to a CSV file with date, product_id and sales columns.",
+    )
+    parser.add_argument(
+        "--n_cutoffs", type=int, default=3, help="Number of forecast origins."
+    )
+    parser.add_argument(
+        "--horizon", type=int, default=30, help="Days forecast after each origin."
+    )
+    parser.add_argument(
+        "--step", type=int, default=None, help="Days between forecast origins."
+    )
+    parser.add_argument(
+        "--num_boost_round", type=int, default=1000, help="LightGBM boosting rounds."
+    )
+    parser.add_argument(
+        "--params",
+        type=str,
+        default=None,
+        help="JSON string of LightGBM parameters overriding the defaults.",
+    )
+    parser.add_argument(
+        "--n_jobs", type=int, default=None, help="Number of worker processes."
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default="demand_forecast/.feature_cache",
+        help="Directory for cached feature matrices.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Directory to save per-product and overall results.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    sales_df = pd.read_csv(args.sales_data)
+    cutoffs = rolling_origin_cutoffs(
+        sales_df["date"], args.n_cutoffs, args.horizon, args.step
+    )
+    per_product, overall = backtest(
+        sales_df,
+        cutoffs,
+        horizon=args.horizon,
+        params=json.loads(args.params) if args.params else None,
+        num_boost_round=args.num_boost_round,
+        n_jobs=args.n_jobs,
+        cache_dir=args.cache_dir,
+    )
+
+    # Save the results to CSV files
+    os.makedirs(args.output_dir, exist_ok=True)
+    per_product.to_csv(os.path.join(args.output_dir, "per_product.csv"), index=False)
+    overall.to_csv(os.path.join(args.output_dir, "overall.csv"), index=False)
+    print(overall.to_string(index=False))
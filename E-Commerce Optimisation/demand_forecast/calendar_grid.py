@@ -0,0 +1,195 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def encode_calendar(sales_df, start=None, end=None):
+    """
+    Encode products and dates of a sales frame as integer grid coordinates.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Data with 'date' and 'product_id' columns.
+    - start (str): First date of the calendar. Defaults to the earliest sale.
+    - end (str): Last date of the calendar. Defaults to the latest sale.
+
+    Returns:
+    - products (pd.Index): Sorted unique product IDs (grid rows).
+    - dates (pd.DatetimeIndex): Daily calendar (grid columns).
+    - row_codes (np.ndarray): Grid row of each input row.
+    - day_offsets (np.ndarray): Grid column of each input row, -1 if outside the calendar.
+    """
+    sale_dates = pd.to_datetime(sales_df["date"]).values.astype("datetime64[D]")
+    start = np.datetime64(pd.Timestamp(start or sale_dates.min()).date(), "D")
+    end = np.datetime64(pd.Timestamp(end or sale_dates.max()).date(), "D")
+    dates = pd.date_range(start, end, freq="D")
+
+    product_codes = pd.Categorical(sales_df["product_id"])
+    products = pd.Index(product_codes.categories, name="product_id")
+
+    day_offsets = (sale_dates - start).astype(np.int64)
+    day_offsets[(day_offsets < 0) | (day_offsets >= len(dates))] = -1
+    return products, dates, product_codes.codes.astype(np.int64), day_offsets
+
+
+def forward_fill_rows(values):
+    """Forward-fill NaNs along each row of a 2D array."""
+    observed = ~np.isnan(values)
+    idx = np.where(observed, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+def grid_frame(products, dates, columns):
+    """
+    Lay out products x dates arrays as a long frame ordered by product then date.
+
+    Parameters:
+    - products (pd.Index): Grid rows.
+    - dates (pd.DatetimeIndex): Grid columns.
+    - columns (dict): Column name to 2D (products x dates) array, or 1D per-product array.
+
+    Returns:
+    - grid (pd.DataFrame): One row per product and date.
+    """
+    n_products, n_dates = len(products), len(dates)
+    grid = pd.DataFrame(
+        {
+            "date": np.tile(dates.values, n_products),
+            "product_id": pd.Categorical.from_codes(
+                np.repeat(np.arange(n_products), n_dates), categories=products
+            ),
+        }
+    )
+    for name, values in columns.items():
+        values = values.toarray() if sparse.issparse(values) else np.asarray(values)
+        grid[name] = values.ravel() if values.ndim == 2 else np.repeat(values, n_dates)
+    return grid
+
+
+def build_calendar_grid(
+    sales_df,
+    sum_cols=("sales",),
+    ffill_cols=(),
+    static_cols=(),
+    start=None,
+    end=None,
+    dense=True,
+):
+    """
+    Build the full product x date grid with sales scattered onto it.
+
+    Replaces building the grid with itertools.product and a left merge. Summed
+    columns are 0 on days without sales, forward-filled columns carry each
+    product's last observed value, and static columns repeat each product's
+    first non-null value.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Data with 'date' and 'product_id' columns.
+    - sum_cols (list): Columns summed per product and date, e.g. sales.
+    - ffill_cols (list): Columns forward-filled per product, e.g. discount_percentage.
+    - static_cols (list): Per-product attributes, e.g. category.
+    - start (str): First date of the calendar.
+    - end (str): Last date of the calendar.
+    - dense (bool): If False, return sparse matrices instead of the long frame.
+
+    Returns:
+    - grid (pd.DataFrame): One row per product and date, if dense is True.
+    - (matrices, products, dates) (tuple): Column name to sparse products x dates matrix, if dense is False.
+    """
+    products, dates, rows, cols = encode_calendar(sales_df, start, end)
+    keep = cols >= 0
+    rows, cols = rows[keep], cols[keep]
+    shape = (len(products), len(dates))
+
+    matrices = {}
+    for col in sum_cols:
+        values = sales_df[col].to_numpy(dtype=np.float64)[keep]
+        matrices[col] = sparse.coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+
+    if not dense:
+        return matrices, products, dates
+
+    columns = dict(matrices)
+    for col in ffill_cols:
+        values = np.full(shape, np.nan)
+        # Last write wins for duplicate product/date rows
+        values[rows, cols] = sales_df[col].to_numpy(dtype=np.float64)[keep]
+        columns[col] = forward_fill_rows(values)
+
+    for col in static_cols:
+        first = (
+            sales_df.dropna(subset=[col])
+            .drop_duplicates("product_id")
+            .set_index("product_id")[col]
+        )
+        columns[col] = first.reindex(products).values
+
+    return grid_frame(products, dates, columns)
+
+
+def _grid_digest(sales_df, **kwargs):
+    """Content hash of the inputs, used to invalidate a persisted grid."""
+    row_hashes = pd.util.hash_pandas_object(sales_df, index=False).values
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(repr(sorted(kwargs.items())).encode())
+    return digest.hexdigest()
+
+
+def save_calendar_grid(grid, path):
+    """
+    Persist a grid as Parquet, one partition per month.
+
+    Parameters:
+    - grid (pd.DataFrame): Output of build_calendar_grid.
+    - path (str): Dataset directory; replaced if it exists.
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    grid = grid.assign(month=grid["date"].dt.strftime("%Y-%m"))
+    grid.to_parquet(path, partition_cols=["month"], index=False)
+
+
+def load_calendar_grid(path, months=None):
+    """
+    Load a persisted grid, optionally only some months.
+
+    Parameters:
+    - path (str): Dataset directory written by save_calendar_grid.
+    - months (list): 'YYYY-MM' partitions to read. Reads all if None.
+
+    Returns:
+    - grid (pd.DataFrame): One row per product and date, ordered by product then date.
+    """
+    filters = [("month", "in", list(months))] if months else None
+    grid = pd.read_parquet(path, filters=filters).drop(columns="month")
+    return grid.sort_values(["product_id", "date"], ignore_index=True)
+
+
+def cached_calendar_grid(sales_df, path, months=None, **kwargs):
+    """
+    Return the grid for sales_df, rebuilding the Parquet cache only when the inputs change.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Data with 'date' and 'product_id' columns.
+    - path (str): Dataset directory of the cache.
+    - months (list): 'YYYY-MM' partitions to return. Returns all if None.
+    - **kwargs: Passed to build_calendar_grid.
+
+    Returns:
+    - grid (pd.DataFrame): One row per product and date.
+    """
+    digest = _grid_digest(sales_df, **kwargs)
+    digest_file = os.path.join(path, "_digest")
+    if os.path.exists(digest_file):
+        with open(digest_file) as f:
+            if f.read() == digest:
+                return load_calendar_grid(path, months)
+
+    save_calendar_grid(build_calendar_grid(sales_df, **kwargs), path)
+    with open(digest_file, "w") as f:
+        f.write(digest)
+    return load_calendar_grid(path, months)
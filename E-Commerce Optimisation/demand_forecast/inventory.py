@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+FORECAST_PATH = "demand_forecast/forecast.csv"
+
+# Per-product lead times, plus a catalogue-wide row (is_overall) used as the
+# fallback for products without shipments
+LEAD_TIME_QUERY = """
+    WITH shipments AS (
+        SELECT
+            s.product_id,
+            MAX(h.update_date) - MIN(h.update_date) AS lead_time
+        FROM
+            shipping_history AS h
+        JOIN
+            shipping_status AS s
+        ON
+            h.shipping_id = s.shipping_id
+        GROUP BY
+            h.shipping_id, s.product_id
+    )
+    SELECT
+        product_id,
+        GROUPING(product_id) = 1 AS is_overall,
+        AVG(lead_time) AS avg_lead_time,
+        MAX(lead_time) AS max_lead_time,
+        STDDEV_POP(lead_time) AS std_lead_time,
+        COUNT(*) AS n_shipments
+    FROM
+        shipments
+    GROUP BY
+        GROUPING SETS ((product_id), ())
+"""
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+def forecast_version(forecast_path=FORECAST_PATH):
+    """
+    Identify a forecast file by the hash of its contents.
+
+    Parameters:
+    - forecast_path (str): Path to the forecast CSV file.
+
+    Returns:
+    - version (str): Short content hash of the file.
+    """
+    digest = hashlib.sha1()
+    with open(forecast_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def load_inventory_inputs(conn):
+    """
+    Load product prices and lead-time statistics from the database.
+
+    Parameters:
+    - conn: Open database connection.
+
+    Returns:
+    - prices (pd.DataFrame): 'product_id' and 'actual_price' columns.
+    - lead_times (pd.DataFrame): Lead-time statistics per product, plus an 'is_overall' row.
+    """
+    prices = pd.read_sql_query("SELECT product_id, actual_price FROM products", conn)
+    lead_times = pd.read_sql_query(LEAD_TIME_QUERY, conn)
+    return prices, lead_times
+
+
+def compute_inventory_plan(
+    forecast, prices, lead_times, holding_rate=0.10, ordering_rate=0.30
+):
+    """
+    Compute EOQ, safety stock and reorder point for every forecast product at once.
+
+    Uses the same formulas as the demand forecasting notebook: holding and ordering
+    costs are fixed fractions of the product price, lead-time demand uses the
+    average daily forecast and safety stock covers the maximum daily forecast over
+    the gap between the maximum and average lead time.
+
+    Parameters:
+    - forecast (pd.DataFrame): Daily forecast with 'product' and 'sales' columns.
+    - prices (pd.DataFrame): 'product_id' and 'actual_price' columns.
+    - lead_times (pd.DataFrame): Output of load_inventory_inputs.
+    - holding_rate (float): Holding cost per unit as a fraction of price.
+    - ordering_rate (float): Ordering cost per order as a fraction of price.
+
+    Returns:
+    - plan (pd.DataFrame): One row per product with demand, cost and stock level columns.
+    """
+    plan = (
+        forecast.groupby("product")["sales"]
+        .agg(demand_rate="mean", max_daily_demand="max", demand_std="std")
+        .rename_axis("product_id")
+        .reset_index()
+    )
+    plan = plan.merge(prices, on="product_id", how="left")
+
+    # Fall back to the catalogue-wide lead times for products without shipments
+    is_overall = lead_times["is_overall"].astype(bool)
+    overall = lead_times[is_overall].iloc[0]
+    lead_cols = ["avg_lead_time", "max_lead_time", "std_lead_time"]
+    plan = plan.merge(
+        lead_times[~is_overall][["product_id"] + lead_cols],
+        on="product_id",
+        how="left",
+    )
+    for col in lead_cols:
+        plan[col] = plan[col].astype(float).fillna(float(overall[col]))
+
+    price = plan["actual_price"].astype(float)
+    plan["holding_cost"] = holding_rate * price
+    plan["ordering_cost"] = ordering_rate * price
+    plan["eoq"] = np.round(
+        np.sqrt(2 * plan["demand_rate"] * plan["ordering_cost"] / plan["holding_cost"])
+    )
+    plan["lead_time_demand"] = np.round(plan["demand_rate"] * plan["avg_lead_time"], 1)
+    plan["safety_stock"] = np.round(
+        plan["max_daily_demand"] * (plan["max_lead_time"] - plan["avg_lead_time"]), 1
+    )
+    plan["reorder_point"] = np.round(plan["lead_time_demand"] + plan["safety_stock"])
+    return plan
+
+
+@lru_cache(maxsize=4)
+def _inventory_plan_for_version(forecast_path, version):
+    """Compute the plan for one forecast version; cached across calls."""
+    forecast = pd.read_csv(forecast_path)
+    conn = get_db_connection()
+    try:
+        prices, lead_times = load_inventory_inputs(conn)
+    finally:
+        conn.close()
+    return compute_inventory_plan(forecast, prices, lead_times)
+
+
+def get_inventory_plan(forecast_path=FORECAST_PATH):
+    """
+    Return the inventory plan for the current forecast, recomputing only when the forecast changes.
+
+    Parameters:
+    - forecast_path (str): Path to the forecast CSV file.
+
+    Returns:
+    - plan (pd.DataFrame): Output of compute_inventory_plan.
+    - version (str): Version of the forecast the plan was computed from.
+    """
+    version = forecast_version(forecast_path)
+    return _inventory_plan_for_version(forecast_path, version), version
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Compute EOQ, safety stock and reorder points for all forecast products."
+    )
+    parser.add_argument(
+        "--forecast_file",
+        type=str,
+        default=FORECAST_PATH,
+        help="Path to the forecast CSV file.",
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        required=True,
+        help="Path to the output CSV file to save the inventory plan.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    plan, version = get_inventory_plan(args.forecast_file)
+    plan.assign(forecast_version=version).to_csv(args.output_file, index=False)
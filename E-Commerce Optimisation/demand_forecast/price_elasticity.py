@@ -0,0 +1,468 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from scipy import sparse
+from sqlalchemy import create_engine, text
+
+from demand_forecast.calendar_grid import build_calendar_grid
+from demand_forecast.inventory import FORECAST_PATH
+from tabs.pricing_optimizer import PRICING_DATA_PATH
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+STATE_PATH = "pricing-strategies/ped_state.npz"
+PED_RESULTS_PATH = "pricing-strategies/ped_results_by_product.csv"
+
+# Two-month intervals used as seasonal regressors, as in price_elasticity.ipynb;
+# Jan-Feb is the baseline
+INTERVALS = ["Jan-Feb", "Mar-Apr", "May-Jun", "Jul-Aug", "Sep-Oct", "Nov-Dec"]
+FEATURES = ["const", "log_discount"] + [f"interval_{i}" for i in INTERVALS[1:]]
+PED_COLUMN = FEATURES.index("log_discount")
+
+SALES_QUERY = """
+    SELECT
+        o.date, o.product_id, SUM(o.quantity) AS sales,
+        AVG(o.discount_percentage) AS discount_percentage, p.category
+    FROM
+        online_sales o
+    LEFT JOIN
+        products p
+    ON
+        o.product_id = p.product_id
+    WHERE
+        o.date >= :since
+    GROUP BY
+        o.date, o.product_id, p.category
+"""
+
+
+def create_db_engine():
+    """Create the database engine."""
+    return create_engine(
+        f"postgresql://{user}:{postgres_password}@{host}:{postgres_port_no}/{database}"
+    )
+
+
+def load_sales(engine, since="1900-01-01"):
+    """Load daily sales and discounts per product from the given date on."""
+    with engine.connect() as connection:
+        return pd.read_sql(text(SALES_QUERY), connection, params={"since": since})
+
+
+def load_products(engine):
+    """Load the product details build_forecast_with_ped adds to the forecast."""
+    with engine.connect() as connection:
+        return pd.read_sql(
+            text(
+                "SELECT product_id, product_name, category, actual_price FROM products"
+            ),
+            connection,
+        )
+
+
+def weekly_observations(sales_df, start=None, last_discount=np.nan):
+    """
+    Aggregate daily sales into complete weeks per product.
+
+    The discount is the same for every product on a given day, so the weekly
+    discount is the mean of the daily average discount, forward-filled over days
+    without transactions. A trailing partial week is left for the next refresh.
+
+    Parameters:
+    - sales_df (pd.DataFrame): Daily 'date', 'product_id', 'sales' and 'discount_percentage'.
+    - start (str): First day of the first week. Defaults to the earliest sale.
+    - last_discount (float): Discount in effect before start, for forward filling.
+
+    Returns:
+    - products (pd.Index): Product of each row of weekly_sales.
+    - week_starts (pd.DatetimeIndex): First day of each complete week.
+    - weekly_sales (np.ndarray): Products x weeks sales.
+    - weekly_discount (np.ndarray): Mean discount per week.
+    """
+    matrices, products, dates = build_calendar_grid(
+        sales_df, sum_cols=["sales"], start=start, dense=False
+    )
+    n_weeks = len(dates) // 7
+    days = n_weeks * 7
+
+    daily_discount = (
+        sales_df.assign(date=pd.to_datetime(sales_df["date"]))
+        .groupby("date")["discount_percentage"]
+        .mean()
+        .reindex(dates)
+        .ffill()
+        .fillna(last_discount)
+        .values[:days]
+    )
+    week_of_day = np.arange(days) // 7
+    weekly_discount = (
+        np.bincount(week_of_day, weights=daily_discount, minlength=n_weeks) / 7
+    )
+
+    # Sum days into weeks with a sparse days x weeks indicator, staying sparse
+    # until the (much smaller) weekly matrix
+    to_weeks = sparse.csr_matrix(
+        (np.ones(days), (np.arange(days), week_of_day)), shape=(days, n_weeks)
+    )
+    weekly_sales = (matrices["sales"][:, :days] @ to_weeks).toarray()
+    return products, dates[:days:7], weekly_sales, weekly_discount
+
+
+def design_matrix(week_starts, weekly_discount):
+    """
+    Log-log design matrix shared by all products: constant, log discount and interval dummies.
+
+    Parameters:
+    - week_starts (pd.DatetimeIndex): First day of each week.
+    - weekly_discount (np.ndarray): Discount per week.
+
+    Returns:
+    - X (np.ndarray): Weeks x features design matrix, columns as in FEATURES.
+    - valid (np.ndarray): False for weeks without a positive discount.
+    """
+    interval = (week_starts.month.values - 1) // 2
+    X = np.zeros((len(week_starts), len(FEATURES)))
+    X[:, 0] = 1
+    valid = np.nan_to_num(weekly_discount) > 0
+    X[valid, PED_COLUMN] = np.log(weekly_discount[valid])
+    for i in range(1, len(INTERVALS)):
+        X[:, PED_COLUMN + i] = interval == i
+    return X, valid
+
+
+def sufficient_statistics(
+    products, week_starts, weekly_sales, weekly_discount, seen=()
+):
+    """
+    Per-product sufficient statistics of the log-log regression.
+
+    Each product only contributes weeks from its first sale on. Statistics for
+    disjoint periods can be added together, which is what makes refreshes incremental.
+
+    Parameters:
+    - products (pd.Index): Product of each row of weekly_sales.
+    - week_starts, weekly_sales, weekly_discount: Output of weekly_observations.
+    - seen (list): Products already selling before these weeks; all their weeks count.
+
+    Returns:
+    - stats (dict): 'product_id', 'xtx' (p x k x k), 'xty' (p x k), 'yty', 'sum_y' and 'n'.
+    """
+    X, valid = design_matrix(week_starts, weekly_discount)
+    y = np.log1p(weekly_sales)
+
+    first_week = np.argmax(weekly_sales > 0, axis=1)
+    first_week[~(weekly_sales > 0).any(axis=1)] = weekly_sales.shape[1]
+    first_week[pd.Index(products).isin(seen)] = 0
+    mask = (np.arange(weekly_sales.shape[1]) >= first_week[:, None]) & valid
+    mask = mask.astype(np.float64)
+
+    return {
+        "product_id": np.asarray(products, dtype=object),
+        "xtx": np.einsum("pw,wi,wj->pij", mask, X, X, optimize=True),
+        "xty": (mask * y) @ X,
+        "yty": (mask * y**2).sum(axis=1),
+        "sum_y": (mask * y).sum(axis=1),
+        "n": mask.sum(axis=1),
+    }
+
+
+def merge_statistics(old, new):
+    """Add the statistics of two periods, aligning products by id."""
+    if old is None:
+        return new
+    ids = pd.Index(old["product_id"]).union(pd.Index(new["product_id"]))
+    merged = {"product_id": np.asarray(ids, dtype=object)}
+    for key in ["xtx", "xty", "yty", "sum_y", "n"]:
+        total = np.zeros((len(ids),) + old[key].shape[1:])
+        for stats in (old, new):
+            total[ids.get_indexer(stats["product_id"])] += stats[key]
+        merged[key] = total
+    return merged
+
+
+def pool_statistics(stats, groups):
+    """
+    Sum statistics over products in the same group, e.g. category.
+
+    Parameters:
+    - stats (dict): Per-product statistics.
+    - groups (np.ndarray): Group of each product.
+
+    Returns:
+    - pooled (dict): Per-group statistics, with group labels in 'product_id'.
+    - codes (np.ndarray): Row of pooled for each product.
+    """
+    codes, labels = pd.factorize(pd.Series(groups).fillna("Unknown"))
+    pooled = {"product_id": np.asarray(labels, dtype=object)}
+    for key in ["xtx", "xty", "yty", "sum_y", "n"]:
+        total = np.zeros((len(labels),) + stats[key].shape[1:])
+        np.add.at(total, codes, stats[key])
+        pooled[key] = total
+    return pooled, codes
+
+
+def solve_statistics(stats):
+    """
+    Solve every group's least squares problem at once from its normal equations.
+
+    Parameters:
+    - stats (dict): Per-group statistics.
+
+    Returns:
+    - beta (np.ndarray): Coefficients, groups x features.
+    - se (np.ndarray): Standard errors, groups x features.
+    - r2 (np.ndarray): R^2 per group.
+    - dof (np.ndarray): Residual degrees of freedom per group.
+    """
+    # pinv handles rank-deficient groups, e.g. a product seen in one interval only
+    xtx_inv = np.linalg.pinv(stats["xtx"], hermitian=True)
+    beta = np.einsum("gij,gj->gi", xtx_inv, stats["xty"])
+
+    rank = np.linalg.matrix_rank(stats["xtx"], hermitian=True)
+    dof = stats["n"] - rank
+    rss = np.maximum(stats["yty"] - np.einsum("gi,gi->g", beta, stats["xty"]), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = np.where(dof > 0, rss / dof, np.nan)
+        tss = stats["yty"] - stats["sum_y"] ** 2 / stats["n"]
+        r2 = np.where(tss > 0, 1 - rss / tss, np.nan)
+    se = np.sqrt(sigma2[:, None] * np.diagonal(xtx_inv, axis1=1, axis2=2))
+    return beta, se, r2, dof
+
+
+def estimate_ped(stats, categories, min_dof=10, min_r2=0.5):
+    """
+    Estimate PED per product, falling back to category pooling for sparse products.
+
+    Products with fewer than min_dof residual degrees of freedom use the pooled
+    fit of their category. As in price_elasticity.ipynb, estimates from fits with
+    R^2 below min_r2 are replaced by -1 (unit elasticity).
+
+    Parameters:
+    - stats (dict): Per-product statistics.
+    - categories (pd.Series): Category of each product, indexed by product_id.
+    - min_dof (int): Minimum residual degrees of freedom for a product-level fit.
+    - min_r2 (float): Minimum R^2 for an estimate to be used.
+
+    Returns:
+    - ped_results (pd.DataFrame): 'product_id', 'category', 'PED', 'PED_se', 'R^2', 'n_obs' and 'source'.
+    """
+    product_category = categories.reindex(stats["product_id"]).values
+    beta, se, r2, dof = solve_statistics(stats)
+
+    pooled, codes = pool_statistics(stats, product_category)
+    cat_beta, cat_se, cat_r2, _ = solve_statistics(pooled)
+
+    use_product = dof >= min_dof
+    ped = np.where(use_product, beta[:, PED_COLUMN], cat_beta[codes, PED_COLUMN])
+    ped_se = np.where(use_product, se[:, PED_COLUMN], cat_se[codes, PED_COLUMN])
+    fit_r2 = np.where(use_product, r2, cat_r2[codes])
+
+    unreliable = ~(fit_r2 >= min_r2)
+    return pd.DataFrame(
+        {
+            "product_id": stats["product_id"],
+            "category": product_category,
+            "PED": np.where(unreliable, -1.0, ped),
+            "PED_se": np.where(unreliable, np.nan, ped_se),
+            "R^2": fit_r2,
+            "n_obs": stats["n"].astype(int),
+            "source": np.where(use_product, "product", "category"),
+        }
+    )
+
+
+def save_state(path, stats, next_week_start, last_discount, categories):
+    """Persist statistics and the refresh watermark."""
+    np.savez(
+        path,
+        next_week_start=str(next_week_start.date()),
+        last_discount=last_discount,
+        category_ids=np.asarray(categories.index, dtype=str),
+        category_values=np.asarray(categories.fillna("Unknown").values, dtype=str),
+        **{
+            key: np.asarray(value, dtype=str) if key == "product_id" else value
+            for key, value in stats.items()
+        },
+    )
+
+
+def load_state(path):
+    """Load persisted statistics, or None if there are none yet."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as state:
+        stats = {
+            key: state[key] for key in ["product_id", "xtx", "xty", "yty", "sum_y", "n"]
+        }
+        stats["product_id"] = stats["product_id"].astype(object)
+        categories = pd.Series(state["category_values"], index=state["category_ids"])
+        return {
+            "stats": stats,
+            "next_week_start": pd.Timestamp(str(state["next_week_start"])),
+            "last_discount": float(state["last_discount"]),
+            "categories": categories,
+        }
+
+
+def refresh_ped(engine, state_path=STATE_PATH, full_refresh=False, **kwargs):
+    """
+    Update PED estimates with the complete weeks of sales since the last refresh.
+
+    Parameters:
+    - engine: SQLAlchemy engine.
+    - state_path (str): Path of the persisted statistics.
+    - full_refresh (bool): Ignore persisted statistics and refit from all sales.
+    - **kwargs: Passed to estimate_ped.
+
+    Returns:
+    - ped_results (pd.DataFrame): Output of estimate_ped.
+    """
+    state = None if full_refresh else load_state(state_path)
+    since = state["next_week_start"] if state else pd.Timestamp("1900-01-01")
+    sales_df = load_sales(engine, since=since.date())
+
+    categories = state["categories"] if state else pd.Series(dtype=str)
+    stats = state["stats"] if state else None
+    next_week_start = since
+    last_discount = state["last_discount"] if state else np.nan
+
+    if not sales_df.empty:
+        start = since if state else None
+        products, week_starts, weekly_sales, weekly_discount = weekly_observations(
+            sales_df, start=start, last_discount=last_discount
+        )
+        if len(week_starts) and stats is not None:
+            # Products without sales in the new weeks still observe zero sales
+            seen = pd.Index(stats["product_id"])
+            all_products = products.union(seen)
+            padded = np.zeros((len(all_products), len(week_starts)))
+            padded[all_products.get_indexer(products)] = weekly_sales
+            products, weekly_sales = all_products, padded
+        if len(week_starts):
+            new_stats = sufficient_statistics(
+                products,
+                week_starts,
+                weekly_sales,
+                weekly_discount,
+                seen=stats["product_id"] if stats is not None else (),
+            )
+            stats = merge_statistics(stats, new_stats)
+            next_week_start = week_starts[-1] + pd.Timedelta(days=7)
+            last_discount = float(weekly_discount[-1])
+
+        new_categories = (
+            sales_df.dropna(subset=["category"])
+            .drop_duplicates("product_id")
+            .set_index("product_id")["category"]
+        )
+        categories = new_categories.combine_first(categories)
+
+    if stats is None:
+        raise ValueError("No complete week of sales to estimate elasticities from.")
+
+    save_state(state_path, stats, next_week_start, last_discount, categories)
+    return estimate_ped(stats, categories, **kwargs)
+
+
+def build_forecast_with_ped(forecast, products, ped_results):
+    """
+    Combine the monthly forecast, product details and per-product PED for the pricing tab.
+
+    Parameters:
+    - forecast (pd.DataFrame): Daily forecast with 'date', 'product' and 'sales'.
+    - products (pd.DataFrame): Products with 'product_id', 'product_name', 'category' and 'actual_price'.
+    - ped_results (pd.DataFrame): Output of estimate_ped.
+
+    Returns:
+    - monthly_forecast (pd.DataFrame): Same layout as forecast_with_ped.csv, plus 'PED_se'.
+    """
+    forecast = forecast.assign(month=pd.to_datetime(forecast["date"]).dt.to_period("M"))
+    monthly_forecast = (
+        forecast.groupby(["product", "month"])["sales"]
+        .sum()
+        .reset_index()
+        .rename(columns={"product": "product_id"})
+    )
+    monthly_forecast = monthly_forecast.merge(
+        products[["product_id", "product_name", "category", "actual_price"]],
+        on="product_id",
+        how="left",
+    )
+    monthly_forecast = monthly_forecast.merge(
+        ped_results[["product_id", "PED", "PED_se"]], on="product_id", how="left"
+    )
+    monthly_forecast["base_cat"] = monthly_forecast["category"].str.split("|").str[0]
+    monthly_forecast["month"] = monthly_forecast["month"].dt.strftime("%B")
+    columns = ["month", "sales", "product_id", "product_name", "category"]
+    columns += ["actual_price", "PED", "base_cat", "PED_se"]
+    return monthly_forecast[columns]
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Estimate price elasticity of demand for every product."
+    )
+    parser.add_argument(
+        "--state_file",
+        type=str,
+        default=STATE_PATH,
+        help="Path of the persisted regression statistics.",
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default=PED_RESULTS_PATH,
+        help="Path to the output CSV file to save PED estimates.",
+    )
+    parser.add_argument(
+        "--forecast_file",
+        type=str,
+        default=FORECAST_PATH,
+        help="Path to the daily demand forecast CSV file.",
+    )
+    parser.add_argument(
+        "--forecast_with_ped_file",
+        type=str,
+        default=PRICING_DATA_PATH,
+        help="Path to the output CSV file combining the monthly forecast with PED, read by the pricing optimizer.",
+    )
+    parser.add_argument(
+        "--full_refresh",
+        action="store_true",
+        help="Refit from all sales instead of only the weeks since the last refresh.",
+    )
+    parser.add_argument(
+        "--min_dof",
+        type=int,
+        default=10,
+        help="Minimum residual degrees of freedom for a product-level estimate.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    engine = create_db_engine()
+    ped_results = refresh_ped(
+        engine,
+        state_path=args.state_file,
+        full_refresh=args.full_refresh,
+        min_dof=args.min_dof,
+    )
+    ped_results.to_csv(args.output_file, index=False)
+    print(ped_results["source"].value_counts().to_string())
+
+    forecast_with_ped = build_forecast_with_ped(
+        pd.read_csv(args.forecast_file), load_products(engine), ped_results
+    )
+    forecast_with_ped.to_csv(args.forecast_with_ped_file, index=False)
+    engine.dispose()
@@ -20,15 +20,15 @@ def main():
     )
 
     # Load data
-    actual_data, forecast_data, products = load_data()
-    data_tab2 = load_data_tab2()
+    actual_store, forecast_store, products = load_data()
+    pricing_index = load_data_tab2()
     data_tab3 = load_data_tab3()
 
     # Display content for tab1
-    display_tab1(tab1, actual_data, forecast_data, products)
+    display_tab1(tab1, actual_store, forecast_store, products)
 
     # Display content for tab2
-    display_tab2(tab2, data_tab2)
+    display_tab2(tab2, pricing_index)
 
     display_tab3(tab3, data_tab3)
 
@@ -0,0 +1,346 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from scipy import sparse
+from sqlalchemy import create_engine, text
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+MATRIX_PATH = "personalized_email/user_item_matrix.npz"
+
+# Sales are read in transaction order; transaction_id grows with the sale date
+SALES_QUERY = """
+    SELECT cust_id, transaction_id, product_id, quantity
+    FROM online_sales
+    WHERE transaction_id > :after
+"""
+
+
+def create_db_engine():
+    """Create a database engine."""
+    return create_engine(
+        f"postgresql://{user}:{postgres_password}@{host}:{postgres_port_no}/{database}"
+    )
+
+
+def top_k(values, k):
+    """Positions of the k largest values, largest first, ties broken by position."""
+    if len(values) > k:
+        candidates = np.argpartition(-values, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((candidates, -values[candidates]))]
+
+
+class UserItemMatrix:
+    """
+    Sparse customer x product matrix of quantities bought, for user-based collaborative filtering.
+
+    Customers and products are mapped to dense row and column numbers in the
+    order they are first seen, and quantities are kept in a CSR matrix, so new
+    sales add rows, columns and entries without rebuilding the matrix.
+    Similarities are cosine similarities: sparse dot products of L2-normalized
+    rows, computed only against the customers who bought one of the same
+    products. The top neighbours of every customer can be precomputed with
+    precompute_neighbours(); customers with sales since then are queried live.
+
+    Parameters:
+    - matrix (sparse.csr_matrix): Quantities, shape (customers, products).
+    - cust_ids (list): Customer of each row.
+    - product_ids (list): Product of each column.
+    - last_transaction_id (int): Latest transaction in the matrix.
+    """
+
+    def __init__(self, matrix, cust_ids, product_ids, last_transaction_id=0):
+        self.matrix = matrix.tocsr()
+        self.cust_ids = list(cust_ids)
+        self.product_ids = list(product_ids)
+        self.user_index = {cust_id: i for i, cust_id in enumerate(self.cust_ids)}
+        self.product_index = {
+            product_id: i for i, product_id in enumerate(self.product_ids)
+        }
+        self.last_transaction_id = int(last_transaction_id)
+        # Precomputed top neighbours (-1 padded) and whether each row changed since
+        self.neighbours = None
+        self.neighbour_similarities = None
+        self.stale = np.ones(len(self.cust_ids), dtype=bool)
+        self._normalized = None
+        self._item_users = None
+        self.lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __contains__(self, cust_id):
+        return cust_id in self.user_index
+
+    @classmethod
+    def from_sales(cls, sales):
+        """Build the matrix from sales with cust_id, transaction_id, product_id and quantity."""
+        matrix = cls(
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            [],
+            [],
+            last_transaction_id=-1,
+        )
+        matrix.update(sales)
+        return matrix
+
+    @classmethod
+    def load(cls, path=MATRIX_PATH):
+        """Load a matrix saved by save(), with its precomputed neighbours if any."""
+        with np.load(path, allow_pickle=False) as arrays:
+            matrix = cls(
+                sparse.csr_matrix(
+                    (arrays["data"], arrays["indices"], arrays["indptr"]),
+                    shape=tuple(arrays["shape"]),
+                ),
+                arrays["cust_ids"].tolist(),
+                arrays["product_ids"].tolist(),
+                int(arrays["last_transaction_id"]),
+            )
+            if "neighbours" in arrays:
+                matrix.neighbours = arrays["neighbours"]
+                matrix.neighbour_similarities = arrays["neighbour_similarities"]
+                matrix.stale = arrays["stale"]
+        return matrix
+
+    def save(self, path=MATRIX_PATH):
+        """Save the matrix, id mappings and precomputed neighbours to an .npz file."""
+        arrays = {
+            "data": self.matrix.data,
+            "indices": self.matrix.indices,
+            "indptr": self.matrix.indptr,
+            "shape": np.array(self.matrix.shape),
+            "cust_ids": np.array(self.cust_ids),
+            "product_ids": np.array(self.product_ids, dtype=str),
+            "last_transaction_id": np.array(self.last_transaction_id),
+        }
+        if self.neighbours is not None:
+            arrays["neighbours"] = self.neighbours
+            arrays["neighbour_similarities"] = self.neighbour_similarities
+            arrays["stale"] = self.stale
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write then rename, so the app never loads a partial matrix
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def update(self, sales):
+        """
+        Add sales newer than last_transaction_id.
+
+        New customers and products get the next row and column numbers. The
+        precomputed neighbours of every customer whose similarities changed,
+        i.e. who bought a product also bought by a customer in the sales, are
+        marked stale.
+
+        Parameters:
+        - sales (pd.DataFrame): Sales with cust_id, transaction_id, product_id and quantity.
+
+        Returns:
+        - n_sales (int): Sales added.
+        """
+        with self.lock:
+            sales = sales[sales["transaction_id"] > self.last_transaction_id]
+            if sales.empty:
+                return 0
+            for cust_id in sales["cust_id"].unique().tolist():
+                if cust_id not in self.user_index:
+                    self.user_index[cust_id] = len(self.cust_ids)
+                    self.cust_ids.append(cust_id)
+            for product_id in sales["product_id"].unique().tolist():
+                if product_id not in self.product_index:
+                    self.product_index[product_id] = len(self.product_ids)
+                    self.product_ids.append(product_id)
+
+            shape = (len(self.cust_ids), len(self.product_ids))
+            rows = sales["cust_id"].map(self.user_index).to_numpy()
+            delta = sparse.csr_matrix(
+                (
+                    sales["quantity"].fillna(0).to_numpy(dtype=np.float32),
+                    (rows, sales["product_id"].map(self.product_index).to_numpy()),
+                ),
+                shape=shape,
+            )
+            matrix = self.matrix.copy()
+            matrix.resize(shape)
+            self.matrix = (matrix + delta).tocsr()
+
+            # A customer's similarities change with the sales of anyone who
+            # shares a product with them
+            touched = self.matrix[np.unique(rows)].indices
+            stale = np.ones(shape[0], dtype=bool)
+            stale[: len(self.stale)] = self.stale
+            stale[self.matrix.T.tocsr()[np.unique(touched)].indices] = True
+            self.stale = stale
+            self.last_transaction_id = int(sales["transaction_id"].max())
+            self._normalized = None
+            self._item_users = None
+        return len(sales)
+
+    def normalized(self):
+        """
+        Rows scaled to unit length, so their dot products are cosine similarities.
+
+        Returns:
+        - normalized (sparse.csr_matrix): Normalized rows, customers x products.
+        - item_users (sparse.csr_matrix): Its transpose, products x customers.
+        """
+        with self.lock:
+            if self._normalized is None:
+                norms = np.sqrt(
+                    np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel()
+                )
+                scale = (1 / np.maximum(norms, 1e-12)).astype(np.float32)
+                normalized = (sparse.diags(scale) @ self.matrix).tocsr()
+                self._item_users = normalized.T.tocsr()
+                self._normalized = normalized
+            return self._normalized, self._item_users
+
+    def similar_users(self, cust_id, k=10):
+        """
+        Customers most similar to a customer by cosine similarity of the quantities bought.
+
+        Only customers who bought at least one of the same products can be
+        similar, so just their rows are touched. Precomputed neighbours are
+        used unless the customer has bought something since.
+
+        Returns:
+        - neighbours (list): (cust_id, similarity) pairs, most similar first.
+        """
+        row = self.user_index[cust_id]
+        if (
+            self.neighbours is not None
+            and not self.stale[row]
+            and k <= self.neighbours.shape[1]
+        ):
+            neighbours = self.neighbours[row, :k]
+            similarities = self.neighbour_similarities[row, :k]
+        else:
+            normalized, item_users = self.normalized()
+            # Dot products with every customer who bought one of the same products
+            similarities = (normalized[row] @ item_users).tocsr()
+            keep = similarities.indices != row
+            candidates = similarities.indices[keep]
+            scores = similarities.data[keep]
+            best = top_k(scores, k)
+            neighbours, similarities = candidates[best], scores[best]
+        return [
+            (self.cust_ids[neighbour], float(similarity))
+            for neighbour, similarity in zip(neighbours, similarities)
+            if neighbour >= 0
+        ]
+
+    def precompute_neighbours(self, k=10, batch_size=1024):
+        """
+        Find the top k neighbours of every customer, batch_size customers at a time.
+
+        Each batch is one sparse product of its normalized rows with all rows,
+        so memory stays at batch_size rows of similarities.
+        """
+        normalized, item_users = self.normalized()
+        n_users = normalized.shape[0]
+        neighbours = np.full((n_users, k), -1, dtype=np.int32)
+        similarities = np.zeros((n_users, k), dtype=np.float32)
+        for start in range(0, n_users, batch_size):
+            end = min(start + batch_size, n_users)
+            batch = (normalized[start:end] @ item_users).tocsr()
+            for i in range(end - start):
+                row_start, row_end = batch.indptr[i], batch.indptr[i + 1]
+                candidates = batch.indices[row_start:row_end]
+                scores = batch.data[row_start:row_end]
+                keep = candidates != start + i
+                candidates, scores = candidates[keep], scores[keep]
+                best = top_k(scores, k)
+                neighbours[start + i, : len(best)] = candidates[best]
+                similarities[start + i, : len(best)] = scores[best]
+        self.neighbours = neighbours
+        self.neighbour_similarities = similarities
+        self.stale = np.zeros(n_users, dtype=bool)
+
+    def recommend(self, cust_id, n_neighbours=10, top_n=3):
+        """
+        Products bought most by a customer's neighbours that the customer has not bought.
+
+        Returns:
+        - product_ids (list): Up to top_n products, highest total quantity first.
+        """
+        neighbours = [
+            self.user_index[neighbour]
+            for neighbour, _ in self.similar_users(cust_id, n_neighbours)
+        ]
+        if not neighbours:
+            return []
+        scores = np.asarray(self.matrix[neighbours].sum(axis=0)).ravel()
+        row = self.user_index[cust_id]
+        scores[
+            self.matrix.indices[self.matrix.indptr[row] : self.matrix.indptr[row + 1]]
+        ] = 0
+        candidates = np.flatnonzero(scores > 0)
+        best = top_k(scores[candidates], top_n)
+        return [self.product_ids[product] for product in candidates[best]]
+
+
+def load_sales(engine, after_transaction_id=-1):
+    """Sales with transaction_id > after_transaction_id."""
+    return pd.read_sql(
+        text(SALES_QUERY), engine, params={"after": after_transaction_id}
+    )
+
+
+def load_user_item_matrix(path=MATRIX_PATH, engine=None, rebuild=False):
+    """Load the saved matrix and add the sales since, or build it from all sales if it has not been saved."""
+    engine = engine or create_db_engine()
+    if os.path.exists(path) and not rebuild:
+        matrix = UserItemMatrix.load(path)
+        matrix.update(load_sales(engine, matrix.last_transaction_id))
+        return matrix
+    return UserItemMatrix.from_sales(load_sales(engine))
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Update the user-item matrix of the email recommender with new sales and precompute every customer's nearest neighbours."
+    )
+    parser.add_argument(
+        "--matrix_file", type=str, default=MATRIX_PATH, help="Matrix file."
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="Neighbours precomputed per customer."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=1024, help="Customers per batch."
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Build the matrix from all sales instead of updating the saved one.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    matrix = load_user_item_matrix(args.matrix_file, rebuild=args.rebuild)
+    print(
+        f"{matrix.shape[0]} customers x {matrix.shape[1]} products, "
+        f"{matrix.matrix.nnz} entries ({time.perf_counter() - start:.1f}s)"
+    )
+    start = time.perf_counter()
+    matrix.precompute_neighbours(args.k, args.batch_size)
+    matrix.save(args.matrix_file)
+    print(f"Precomputed neighbours in {time.perf_counter() - start:.1f}s")
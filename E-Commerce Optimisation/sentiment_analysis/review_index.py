@@ -0,0 +1,461 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+from tabs.nlp_resources import lemmatize, make_vader_analyzer, stopwords_keeping_not
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+INDEX_PATH = "sentiment_analysis/review_index.npz"
+FIELDS = ("review_title", "review_content")
+
+# Longest n-gram indexed; longer phrases are matched from their n-grams
+MAX_N = 3
+
+# Compound scores at or beyond +/- this are positive or negative, as in the tab
+SENTIMENT_THRESHOLD = 0.05
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+REVIEWS_QUERY = """
+    SELECT r.review_id, r.product_id, p.product_name, p.category,
+        r.review_title, r.review_content
+    FROM ratings AS r
+    LEFT JOIN products AS p
+    ON r.product_id = p.product_id
+"""
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+def tokenize(text):
+    """
+    Lemmas of the words of a text with their character spans.
+
+    Words are lowercased and lemmatized, stopwords other than "not" are
+    dropped, and negated contractions ("isn't", "don't") become "not", as the
+    notebook's cleaning expands them.
+
+    Returns:
+    - tokens (list): (lemma, start, end) of each kept word.
+    """
+    stop_words = stopwords_keeping_not("english")
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if word.endswith("n't"):
+            word = "not"
+        elif word in stop_words:
+            continue
+        tokens.append((lemmatize(word), match.start(), match.end()))
+    return tokens
+
+
+def ngrams(lemmas, max_n=MAX_N):
+    """Every n-gram of a token list for n = 1..max_n, as space-joined strings."""
+    return [
+        " ".join(lemmas[i : i + n])
+        for n in range(1, max_n + 1)
+        for i in range(len(lemmas) - n + 1)
+    ]
+
+
+def find_phrase(lemmas, phrase):
+    """Position of the first occurrence of phrase in lemmas, or -1."""
+    n = len(phrase)
+    for i in range(len(lemmas) - n + 1):
+        if lemmas[i : i + n] == phrase:
+            return i
+    return -1
+
+
+def split_reviews(ratings):
+    """
+    One row per individual review of the ratings rows.
+
+    Each review_title and review_content holds comma-separated reviews. The
+    reviews are sorted by category and product, so the reviews of a product or
+    a category form a contiguous range in the index.
+
+    Returns:
+    - reviews (pd.DataFrame): review_id, field (index into FIELDS), product_id,
+      product_name, category (base category) and text.
+    """
+    parts = []
+    for field, column in enumerate(FIELDS):
+        part = ratings[["review_id", "product_id", "product_name"]].assign(
+            field=field,
+            category=ratings["category"].fillna("").str.split("|").str[0],
+            text=ratings[column].fillna("").str.split(","),
+        )
+        parts.append(part.explode("text"))
+    reviews = pd.concat(parts)
+    reviews["text"] = reviews["text"].str.strip()
+    reviews = reviews[reviews["text"] != ""]
+    reviews["product_name"] = (
+        reviews["product_name"].fillna(reviews["product_id"]).str.replace("\n", " ")
+    )
+    return reviews.sort_values(
+        ["category", "product_id", "review_id", "field"], kind="stable"
+    ).reset_index(drop=True)
+
+
+def pack_strings(strings):
+    """Newline-joined UTF-8 bytes of strings, far smaller than a fixed-width numpy string array."""
+    return np.frombuffer("\n".join(strings).encode(), dtype=np.uint8)
+
+
+def unpack_strings(data):
+    """Strings packed by pack_strings()."""
+    return data.tobytes().decode().split("\n")
+
+
+def csr_offsets(group_codes, n_groups):
+    """Start of each group's range in an array sorted by group, plus the end."""
+    return np.concatenate(
+        [[0], np.cumsum(np.bincount(group_codes, minlength=n_groups))]
+    ).astype(np.int64)
+
+
+class ReviewIndex:
+    """
+    Inverted index of review n-grams, with the reviews needed to show matches.
+
+    Reviews are tokenized with tokenize() and every n-gram up to MAX_N words is
+    indexed. Posting lists of review numbers are stored back to back in one
+    uint32 array with an offset per term (CSR), and the n-grams of each review
+    likewise, so a search is a dictionary lookup and a slice and a top n-gram
+    count is a np.unique over the slice of a product's or category's reviews.
+
+    Use build() to index reviews and load() to read a saved index.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.max_n = int(arrays["max_n"])
+        self.terms = unpack_strings(arrays["terms"])
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.term_n = arrays["term_n"]
+        self.postings_indptr = arrays["postings_indptr"]
+        self.postings = arrays["postings"]
+        self.doc_indptr = arrays["doc_indptr"]
+        self.doc_terms = arrays["doc_terms"]
+        self.review_id = arrays["review_id"]
+        self.field = arrays["field"]
+        self.compound = arrays["compound"]
+        self.doc_product = arrays["doc_product"]
+        self.text_indptr = arrays["text_indptr"]
+        self.text_data = arrays["text_data"]
+        self.product_ids = arrays["product_ids"]
+        self.product_names = unpack_strings(arrays["product_names"])
+        self.product_indptr = arrays["product_indptr"]
+        self.categories = arrays["categories"]
+        self.category_indptr = arrays["category_indptr"]
+        self.product_codes = {
+            product_id: i for i, product_id in enumerate(self.product_ids.tolist())
+        }
+        self.category_codes = {
+            category: i for i, category in enumerate(self.categories.tolist())
+        }
+
+    def __len__(self):
+        return len(self.review_id)
+
+    @classmethod
+    def build(cls, ratings, max_n=MAX_N):
+        """
+        Index the reviews of ratings rows.
+
+        Parameters:
+        - ratings (pd.DataFrame): review_id, product_id, product_name, category,
+          review_title and review_content of each ratings row.
+        - max_n (int): Longest n-gram indexed.
+
+        Returns:
+        - index (ReviewIndex): The index.
+        """
+        reviews = split_reviews(ratings)
+        texts = reviews["text"].tolist()
+        analyzer = make_vader_analyzer()
+
+        term_ids = {}
+        doc_terms, doc_lengths = [], []
+        for text in texts:
+            lemmas = [lemma for lemma, _, _ in tokenize(text)]
+            ids = {
+                term_ids.setdefault(term, len(term_ids))
+                for term in ngrams(lemmas, max_n)
+            }
+            doc_terms.extend(sorted(ids))
+            doc_lengths.append(len(ids))
+        doc_terms = np.array(doc_terms, dtype=np.uint32)
+        doc_lengths = np.array(doc_lengths, dtype=np.int64)
+        terms = list(term_ids)
+
+        # Invert review -> terms into term -> reviews. A stable sort keeps each
+        # posting list in review order
+        doc_of_entry = np.repeat(np.arange(len(texts), dtype=np.uint32), doc_lengths)
+        order = np.argsort(doc_terms, kind="stable")
+
+        # Codes in order of appearance, so each product's and category's
+        # reviews are the range between consecutive offsets
+        product_codes, product_ids = pd.factorize(reviews["product_id"])
+        category_codes, categories = pd.factorize(reviews["category"])
+        products = reviews.drop_duplicates("product_id").set_index("product_id")
+        encoded = [text.encode() for text in texts]
+        return cls(
+            {
+                "max_n": np.array(max_n),
+                "terms": pack_strings(terms),
+                "term_n": np.array(
+                    [term.count(" ") + 1 for term in terms], dtype=np.uint8
+                ),
+                "postings_indptr": csr_offsets(doc_terms, len(terms)),
+                "postings": doc_of_entry[order],
+                "doc_indptr": np.concatenate([[0], np.cumsum(doc_lengths)]),
+                "doc_terms": doc_terms,
+                "review_id": reviews["review_id"].to_numpy(dtype=np.int32),
+                "field": reviews["field"].to_numpy(dtype=np.int8),
+                "compound": np.array(
+                    [analyzer.polarity_scores(text)["compound"] for text in texts],
+                    dtype=np.float32,
+                ),
+                "doc_product": product_codes.astype(np.int32),
+                "text_indptr": np.concatenate(
+                    [[0], np.cumsum([len(text) for text in encoded])]
+                ).astype(np.int64),
+                "text_data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                "product_ids": product_ids.to_numpy(dtype=str),
+                "product_names": pack_strings(
+                    products.loc[product_ids, "product_name"]
+                ),
+                "product_indptr": csr_offsets(product_codes, len(product_ids)),
+                "categories": categories.to_numpy(dtype=str),
+                "category_indptr": csr_offsets(category_codes, len(categories)),
+            }
+        )
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """Load an index saved by save()."""
+        with np.load(path) as arrays:
+            return cls(dict(arrays))
+
+    def save(self, path=INDEX_PATH):
+        """Save the index arrays to an .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write then rename, so a running app never loads a partial index
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **self.arrays)
+        os.replace(tmp_path, path)
+
+    def text(self, doc):
+        """Original text of a review."""
+        start, end = self.text_indptr[doc], self.text_indptr[doc + 1]
+        return self.text_data[start:end].tobytes().decode()
+
+    def term_postings(self, term):
+        """Reviews containing an n-gram, in review order."""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.uint32)
+        start, end = self.postings_indptr[term_id], self.postings_indptr[term_id + 1]
+        return self.postings[start:end]
+
+    def match(self, query):
+        """
+        Reviews containing a keyword or phrase.
+
+        The query is tokenized like the reviews. Phrases up to MAX_N words are
+        looked up directly; longer ones intersect the posting lists of their
+        n-grams and the candidates are then checked for the whole phrase.
+        """
+        phrase = [lemma for lemma, _, _ in tokenize(query)]
+        if not phrase:
+            return np.empty(0, dtype=np.uint32)
+        if len(phrase) <= self.max_n:
+            return self.term_postings(" ".join(phrase))
+
+        grams = [
+            " ".join(phrase[i : i + self.max_n])
+            for i in range(len(phrase) - self.max_n + 1)
+        ]
+        candidates = min((self.term_postings(gram) for gram in grams), key=len)
+        for gram in grams:
+            candidates = np.intersect1d(
+                candidates, self.term_postings(gram), assume_unique=True
+            )
+        return np.array(
+            [
+                doc
+                for doc in candidates
+                if find_phrase(
+                    [lemma for lemma, _, _ in tokenize(self.text(doc))], phrase
+                )
+                >= 0
+            ],
+            dtype=np.uint32,
+        )
+
+    def search(self, query, limit=20, width=40):
+        """
+        Keyword in context: the reviews containing a keyword or phrase, around the match.
+
+        Parameters:
+        - query (str): Keyword or phrase.
+        - limit (int): Most reviews returned.
+        - width (int): Characters of context either side of the match.
+
+        Returns:
+        - results (pd.DataFrame): review_id, product_id, field, left context,
+          match, right context and compound score of each review.
+        """
+        phrase = [lemma for lemma, _, _ in tokenize(query)]
+        rows = []
+        for doc in self.match(query)[:limit]:
+            text = self.text(doc)
+            tokens = tokenize(text)
+            position = find_phrase([lemma for lemma, _, _ in tokens], phrase)
+            start = tokens[position][1]
+            end = tokens[position + len(phrase) - 1][2]
+            rows.append(
+                {
+                    "review_id": int(self.review_id[doc]),
+                    "product_id": self.product_ids[self.doc_product[doc]],
+                    "field": FIELDS[self.field[doc]],
+                    "left": text[max(0, start - width) : start],
+                    "match": text[start:end],
+                    "right": text[end : end + width],
+                    "compound": float(self.compound[doc]),
+                }
+            )
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "review_id",
+                "product_id",
+                "field",
+                "left",
+                "match",
+                "right",
+                "compound",
+            ],
+        )
+
+    def sentiment_breakdown(self, query):
+        """Numbers of positive, neutral and negative reviews containing a keyword or phrase, and their mean score."""
+        compound = self.compound[self.match(query)]
+        positive = int(np.sum(compound >= SENTIMENT_THRESHOLD))
+        negative = int(np.sum(compound <= -SENTIMENT_THRESHOLD))
+        return {
+            "reviews": len(compound),
+            "positive": positive,
+            "neutral": len(compound) - positive - negative,
+            "negative": negative,
+            "mean_compound": float(compound.mean()) if len(compound) else 0.0,
+        }
+
+    def top_ngrams(self, n=2, product_id=None, category=None, k=10):
+        """
+        Most common n-grams, counted once per review, of a product, a category or all reviews.
+
+        Parameters:
+        - n (int): Words per n-gram.
+        - product_id (str): Only count this product's reviews.
+        - category (str): Only count this base category's reviews.
+        - k (int): Most n-grams returned.
+
+        Returns:
+        - top (pd.DataFrame): ngram and number of reviews containing it, most common first.
+        """
+        start, end = 0, len(self)
+        if product_id is not None:
+            code = self.product_codes.get(product_id)
+            if code is None:
+                return pd.DataFrame(columns=["ngram", "reviews"])
+            start, end = self.product_indptr[code], self.product_indptr[code + 1]
+        elif category is not None:
+            code = self.category_codes.get(category)
+            if code is None:
+                return pd.DataFrame(columns=["ngram", "reviews"])
+            start, end = self.category_indptr[code], self.category_indptr[code + 1]
+
+        term_ids, counts = np.unique(
+            self.doc_terms[self.doc_indptr[start] : self.doc_indptr[end]],
+            return_counts=True,
+        )
+        keep = self.term_n[term_ids] == n
+        term_ids, counts = term_ids[keep], counts[keep]
+        # Most common first, ties broken by term id so results are stable
+        top = np.lexsort((term_ids, -counts))[:k]
+        return pd.DataFrame(
+            {
+                "ngram": [self.terms[term_id] for term_id in term_ids[top]],
+                "reviews": counts[top],
+            }
+        )
+
+
+def load_ratings():
+    """Ratings rows with their products' names and categories."""
+    with get_db_connection() as conn:
+        return pd.read_sql_query(REVIEWS_QUERY, conn)
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Build the keyword and n-gram search index of the reviews in the ratings table."
+    )
+    parser.add_argument(
+        "--index_file", type=str, default=INDEX_PATH, help="Index file to write."
+    )
+    parser.add_argument(
+        "--max_n", type=int, default=MAX_N, help="Longest n-gram indexed."
+    )
+    parser.add_argument(
+        "--query",
+        type=str,
+        default=None,
+        help="Search the new index for this keyword or phrase.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = ReviewIndex.build(load_ratings(), args.max_n)
+    index.save(args.index_file)
+    print(
+        f"Indexed {len(index)} reviews, {len(index.terms)} n-grams in "
+        f"{time.perf_counter() - start:.1f}s ({os.path.getsize(args.index_file) / 1e6:.1f} MB)"
+    )
+
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query)
+        breakdown = index.sentiment_breakdown(args.query)
+        print(f"Searched in {(time.perf_counter() - start) * 1000:.1f}ms")
+        print(breakdown)
+        print(results.to_string(index=False))
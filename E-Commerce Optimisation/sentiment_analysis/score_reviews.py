@@ -0,0 +1,153 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from sentiment_analysis.scoring import get_vader_scores, load_vader
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+# Reviews in the range that have not been scored yet, so a rerun skips finished
+# ranges with an index lookup
+UNSCORED_QUERY = """
+    SELECT r.review_id, r.review_content
+    FROM ratings AS r
+    LEFT JOIN review_sentiment AS s
+    ON r.review_id = s.review_id
+    WHERE r.review_id >= %s AND r.review_id < %s AND s.review_id IS NULL
+"""
+RANGE_QUERY = """
+    SELECT review_id, review_content
+    FROM ratings
+    WHERE review_id >= %s AND review_id < %s
+"""
+UPSERT_QUERY = """
+    INSERT INTO review_sentiment (review_id, compound)
+    VALUES %s
+    ON CONFLICT (review_id) DO UPDATE
+    SET compound = EXCLUDED.compound, scored_at = now()
+"""
+
+# One connection per worker process, opened by init_worker
+_conn = None
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+def init_worker():
+    """Open the worker's connection and build its analyzer once."""
+    global _conn
+    _conn = get_db_connection()
+    load_vader()
+
+
+def score_range(start, end, rescore=False):
+    """
+    Score the reviews with start <= review_id < end and write them to review_sentiment.
+
+    The range is committed as one transaction, so it is either fully scored or
+    picked up again by the next run.
+
+    Returns:
+    - n_scored (int): Reviews scored.
+    """
+    with _conn, _conn.cursor() as cur:
+        cur.execute(RANGE_QUERY if rescore else UNSCORED_QUERY, (start, end))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        scores = get_vader_scores([content for _, content in rows])
+        execute_values(
+            cur,
+            UPSERT_QUERY,
+            [(review_id, score) for (review_id, _), score in zip(rows, scores)],
+            page_size=1000,
+        )
+    return len(rows)
+
+
+def score_reviews(chunk_size=10_000, n_workers=None, rescore=False):
+    """
+    Score every review in the ratings table across a process pool.
+
+    The review_id range is split into chunks of chunk_size ids, scored in
+    parallel. Reviews already in review_sentiment are skipped unless rescore is
+    set, so an interrupted run resumes where it stopped.
+
+    Parameters:
+    - chunk_size (int): review_ids per chunk.
+    - n_workers (int): Worker processes. Defaults to the number of CPUs.
+    - rescore (bool): Score reviews again even if they already have a score.
+
+    Returns:
+    - n_scored (int): Reviews scored.
+    """
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT MIN(review_id), MAX(review_id) FROM ratings")
+        min_id, max_id = cur.fetchone()
+    conn.close()
+    if min_id is None:
+        return 0
+
+    ranges = [
+        (start, min(start + chunk_size, max_id + 1))
+        for start in range(min_id, max_id + 1, chunk_size)
+    ]
+    n_scored = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=n_workers or os.cpu_count(), initializer=init_worker
+    ) as executor:
+        futures = [
+            executor.submit(score_range, start, end, rescore) for start, end in ranges
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            n_scored += future.result()
+            elapsed = time.perf_counter() - started
+            print(
+                f"{i}/{len(ranges)} ranges, {n_scored} reviews scored, "
+                f"{n_scored / elapsed:.0f} reviews/s"
+            )
+    return n_scored
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Score the sentiment of every review in the ratings table and save it to review_sentiment."
+    )
+    parser.add_argument(
+        "--chunk_size", type=int, default=10_000, help="review_ids per chunk."
+    )
+    parser.add_argument("--n_workers", type=int, default=None, help="Worker processes.")
+    parser.add_argument(
+        "--rescore",
+        action="store_true",
+        help="Score reviews again even if they already have a score.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    print(
+        f"Scored {score_reviews(args.chunk_size, args.n_workers, args.rescore)} reviews"
+    )
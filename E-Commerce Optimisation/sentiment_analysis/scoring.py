@@ -0,0 +1,32 @@
+from functools import lru_cache
+
+from tabs.nlp_resources import make_vader_analyzer
+
+
+@lru_cache(maxsize=None)
+def load_vader():
+    """Build the VADER analyzer once per process; it only reads its lexicon, so it is shared."""
+    analyzer = make_vader_analyzer()
+    return analyzer
+
+
+def get_vader_score(text: str, vader_model):
+    score = vader_model.polarity_scores(text).get("compound")
+    return score
+
+
+def get_vader_scores(texts, vader_model=None):
+    """Compound scores of a batch of texts; missing texts score 0."""
+    vader_model = vader_model or load_vader()
+    return [
+        vader_model.polarity_scores(text)["compound"] if text else 0.0 for text in texts
+    ]
+
+
+def sentiment_label(score, threshold=0.5):
+    """Positive, Negative or Neutral from a compound score."""
+    if score >= threshold:
+        return "Positive"
+    elif score <= -threshold:
+        return "Negative"
+    return "Neutral"
@@ -0,0 +1,493 @@
+import argparse
+import json
+import os
+import re
+import string
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from gensim.corpora import Dictionary
+from gensim.models import CoherenceModel, LdaModel, LdaMulticore
+from psycopg2.extras import execute_values
+
+from sentiment_analysis.scoring import get_vader_scores
+from tabs.nlp_resources import english_words, lemmatize, stopwords_keeping_not
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+MODEL_DIR = "sentiment_analysis/topic_model"
+
+# Compound score below which an individual review counts as negative, as in
+# the notebook. review_title holds the short reviews, review_content the long ones
+NEGATIVE_THRESHOLDS = {"review_title": -0.3, "review_content": -0.25}
+
+# Words left out of the topics since they appear across all negative reviews
+STOPLIST = {"not", "good"}
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+REVIEWS_QUERY = """
+    SELECT review_id, product_id, {column} AS text
+    FROM ratings
+    WHERE review_id > %s
+    ORDER BY review_id
+"""
+TOPIC_TERMS_UPSERT = """
+    INSERT INTO topic_terms (topic, top_words)
+    VALUES %s
+    ON CONFLICT (topic) DO UPDATE SET top_words = EXCLUDED.top_words
+"""
+REVIEW_TOPICS_UPSERT = """
+    INSERT INTO review_topics (review_id, review_index, product_id, topic, weight)
+    VALUES %s
+    ON CONFLICT (review_id, review_index, topic) DO UPDATE SET weight = EXCLUDED.weight
+"""
+# Each review counts towards its most likely topic
+PRODUCT_SUMMARY_QUERY = """
+    DELETE FROM product_topic_summary WHERE product_id = ANY(%(product_ids)s);
+    INSERT INTO product_topic_summary (product_id, topic, n_reviews, share)
+    SELECT
+        product_id,
+        topic,
+        COUNT(*),
+        COUNT(*)::FLOAT / SUM(COUNT(*)) OVER (PARTITION BY product_id)
+    FROM (
+        SELECT DISTINCT ON (review_id, review_index) product_id, topic
+        FROM review_topics
+        WHERE product_id = ANY(%(product_ids)s)
+        ORDER BY review_id, review_index, weight DESC
+    ) AS dominant
+    GROUP BY product_id, topic;
+"""
+
+# Corpus shared by the grid workers, set once per process by init_grid_worker
+_grid_data = None
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+def clean(doc):
+    """
+    Tokens of a review, cleaned as in the sentiment notebook.
+
+    Contractions are expanded and links removed. Stopwords (except "not"),
+    words that are not English and punctuation are dropped, and the remaining
+    words are lemmatized. Words in STOPLIST are dropped last.
+    """
+    import contractions
+
+    stop_words = stopwords_keeping_not("english")
+    words = english_words()
+    text = URL_PATTERN.sub("", contractions.fix(doc)).lower()
+    kept = " ".join(
+        word for word in text.split() if word not in stop_words and word in words
+    )
+    lemmas = (lemmatize(word) for word in kept.translate(PUNCTUATION).split())
+    return [lemma for lemma in lemmas if lemma not in STOPLIST]
+
+
+def load_reviews(conn, column="review_title", after_review_id=0):
+    """Ratings rows with review_id > after_review_id, with the column modelled as 'text'."""
+    if column not in NEGATIVE_THRESHOLDS:
+        raise ValueError(f"column must be one of {list(NEGATIVE_THRESHOLDS)}")
+    return pd.read_sql_query(
+        REVIEWS_QUERY.format(column=column), conn, params=(after_review_id,)
+    )
+
+
+def negative_documents(reviews, threshold):
+    """
+    Split ratings rows into individual reviews and keep the negative ones.
+
+    Parameters:
+    - reviews (pd.DataFrame): Rows with review_id, product_id and text, the
+      text holding comma-separated reviews.
+    - threshold (float): Reviews with a compound score below this are kept.
+
+    Returns:
+    - docs (pd.DataFrame): review_id, review_index (position of the review in
+      its row), product_id and tokens of each negative review with any tokens
+      left after cleaning.
+    """
+    docs = reviews.assign(review=reviews["text"].fillna("").str.split(","))
+    docs = docs.explode("review")
+    docs["review_index"] = docs.groupby("review_id").cumcount()
+    docs = docs[docs["review"].str.strip() != ""]
+    docs = docs[
+        pd.Series(get_vader_scores(docs["review"].tolist()), index=docs.index)
+        < threshold
+    ]
+    docs = docs.assign(tokens=docs["review"].map(clean))
+    docs = docs[docs["tokens"].map(len) > 0]
+    return docs[["review_id", "review_index", "product_id", "tokens"]].reset_index(
+        drop=True
+    )
+
+
+def init_grid_worker(dictionary, corpus, texts):
+    """Keep the corpus in the worker, so it is sent once rather than with every candidate."""
+    global _grid_data
+    _grid_data = (dictionary, corpus, texts)
+
+
+def candidate_path(model_dir, num_topics, passes):
+    """Where fit_candidate saves the model of one grid setting."""
+    return os.path.join(model_dir, f"lda_{num_topics}_{passes}.model")
+
+
+def fit_candidate(num_topics, passes, model_dir, workers=1, random_state=0):
+    """
+    Train LDA with one grid setting, score its c_v coherence and save it to model_dir.
+
+    Only the scores are sent back to the parent process, which loads the
+    most coherent model alone instead of receiving every pickled model.
+
+    Returns:
+    - num_topics (int), passes (int) and coherence (float).
+    """
+    dictionary, corpus, texts = _grid_data
+    model = LdaMulticore(
+        corpus=corpus,
+        id2word=dictionary,
+        num_topics=num_topics,
+        passes=passes,
+        workers=workers,
+        random_state=random_state,
+    )
+    coherence = CoherenceModel(
+        model=model,
+        texts=texts,
+        dictionary=dictionary,
+        coherence="c_v",
+        processes=1,
+    ).get_coherence()
+    model.save(candidate_path(model_dir, num_topics, passes))
+    return num_topics, passes, coherence
+
+
+def coherence_grid(
+    dictionary,
+    corpus,
+    texts,
+    topic_range=range(2, 10),
+    passes_list=(10, 20),
+    n_workers=None,
+    workers_per_model=1,
+    random_state=0,
+):
+    """
+    Train LDA over a grid of topic counts and passes in parallel and keep the most coherent model.
+
+    Each candidate is trained with LdaMulticore in its own process of a pool,
+    so n_workers * workers_per_model should not exceed the number of CPUs.
+    Candidates are saved to a temporary directory and only the most coherent
+    one is loaded.
+
+    Parameters:
+    - dictionary (Dictionary): Vocabulary of the corpus.
+    - corpus (list): Bag-of-words documents.
+    - texts (list): Tokens of the documents, used for coherence.
+    - topic_range (iterable): Numbers of topics to try.
+    - passes_list (iterable): Numbers of passes to try.
+    - n_workers (int): Candidates trained at once. Defaults to the number of CPUs.
+    - workers_per_model (int): LdaMulticore workers per candidate.
+    - random_state (int): Seed of every candidate.
+
+    Returns:
+    - results (pd.DataFrame): num_topics, passes and coherence of each candidate,
+      most coherent first.
+    - best_model (LdaMulticore): The most coherent model.
+    """
+    grid = list(product(topic_range, passes_list))
+    n_workers = n_workers or max(1, os.cpu_count() // workers_per_model)
+    rows = []
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as model_dir:
+        with ProcessPoolExecutor(
+            max_workers=min(n_workers, len(grid)),
+            initializer=init_grid_worker,
+            initargs=(dictionary, corpus, texts),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    fit_candidate,
+                    num_topics,
+                    passes,
+                    model_dir,
+                    workers_per_model,
+                    random_state,
+                )
+                for num_topics, passes in grid
+            ]
+            for i, future in enumerate(as_completed(futures), 1):
+                num_topics, passes, coherence = future.result()
+                rows.append(
+                    {"num_topics": num_topics, "passes": passes, "coherence": coherence}
+                )
+                print(
+                    f"{i}/{len(grid)} candidates, {num_topics} topics, {passes} passes: "
+                    f"coherence {coherence:.4f} ({time.perf_counter() - started:.0f}s)"
+                )
+        results = pd.DataFrame(rows).sort_values("coherence", ascending=False)
+        best = results.iloc[0]
+        best_model = LdaMulticore.load(
+            candidate_path(model_dir, int(best["num_topics"]), int(best["passes"]))
+        )
+    return results.reset_index(drop=True), best_model
+
+
+class TopicModel:
+    """
+    LDA model of negative reviews, with its dictionary and training state.
+
+    Parameters:
+    - lda (LdaModel): Trained model.
+    - dictionary (Dictionary): Vocabulary of the model.
+    - meta (dict): column and threshold the reviews were selected with, the
+      last review_id modelled and the grid setting of the model.
+    """
+
+    def __init__(self, lda, dictionary, meta):
+        self.lda = lda
+        self.dictionary = dictionary
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path=MODEL_DIR):
+        """Load a model saved by save()."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(
+            LdaModel.load(os.path.join(path, "lda.model")),
+            Dictionary.load(os.path.join(path, "dictionary")),
+            meta,
+        )
+
+    def save(self, path=MODEL_DIR):
+        """Save the model, dictionary and meta to the model directory."""
+        os.makedirs(path, exist_ok=True)
+        self.lda.save(os.path.join(path, "lda.model"))
+        self.dictionary.save(os.path.join(path, "dictionary"))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def top_words(self, num_words=5):
+        """Comma-separated top words of each topic."""
+        return {
+            topic: ", ".join(word for word, _ in terms)
+            for topic, terms in self.lda.show_topics(
+                num_topics=-1, num_words=num_words, formatted=False
+            )
+        }
+
+    def distributions(self, token_docs, minimum_probability=0.01):
+        """(topic, weight) pairs of each document, leaving out weights below minimum_probability."""
+        return [
+            self.lda.get_document_topics(
+                self.dictionary.doc2bow(tokens),
+                minimum_probability=minimum_probability,
+            )
+            for tokens in token_docs
+        ]
+
+
+def write_topics(conn, model, docs, replace=False):
+    """
+    Save the topic distributions of documents and refresh the summaries of their products.
+
+    Parameters:
+    - conn: Database connection.
+    - model (TopicModel): Model the documents are scored with.
+    - docs (pd.DataFrame): Output of negative_documents().
+    - replace (bool): Clear the topic tables and write the model's topics first,
+      after retraining.
+    """
+    rows = [
+        (int(review_id), int(review_index), product_id, int(topic), float(weight))
+        for review_id, review_index, product_id, distribution in zip(
+            docs["review_id"],
+            docs["review_index"],
+            docs["product_id"],
+            model.distributions(docs["tokens"]),
+        )
+        for topic, weight in distribution
+    ]
+    with conn, conn.cursor() as cur:
+        if replace:
+            cur.execute("TRUNCATE review_topics, product_topic_summary, topic_terms")
+            execute_values(cur, TOPIC_TERMS_UPSERT, list(model.top_words().items()))
+        execute_values(cur, REVIEW_TOPICS_UPSERT, rows, page_size=1000)
+        cur.execute(
+            PRODUCT_SUMMARY_QUERY, {"product_ids": docs["product_id"].unique().tolist()}
+        )
+
+
+def train(
+    column="review_title",
+    topic_range=range(2, 10),
+    passes_list=(10, 20),
+    n_workers=None,
+    workers_per_model=1,
+    path=MODEL_DIR,
+):
+    """
+    Train the topic model on every negative review and precompute the topic tables.
+
+    Returns:
+    - results (pd.DataFrame): Coherence of each grid candidate, also saved to
+      grid.csv in the model directory.
+    """
+    with get_db_connection() as conn:
+        reviews = load_reviews(conn, column)
+    conn.close()
+    threshold = NEGATIVE_THRESHOLDS[column]
+    docs = negative_documents(reviews, threshold)
+    print(f"{len(docs)} negative reviews in {len(reviews)} rows")
+
+    texts = docs["tokens"].tolist()
+    dictionary = Dictionary(texts)
+    dictionary.filter_extremes(no_below=2, no_above=0.5)
+    corpus = [dictionary.doc2bow(tokens) for tokens in texts]
+    results, lda = coherence_grid(
+        dictionary,
+        corpus,
+        texts,
+        topic_range,
+        passes_list,
+        n_workers,
+        workers_per_model,
+    )
+    best = results.iloc[0]
+    model = TopicModel(
+        lda,
+        dictionary,
+        {
+            "column": column,
+            "threshold": threshold,
+            "last_review_id": int(reviews["review_id"].max()) if len(reviews) else 0,
+            "num_topics": int(best["num_topics"]),
+            "passes": int(best["passes"]),
+            "coherence": float(best["coherence"]),
+        },
+    )
+    model.save(path)
+    results.to_csv(os.path.join(path, "grid.csv"), index=False)
+
+    conn = get_db_connection()
+    try:
+        write_topics(conn, model, docs, replace=True)
+    finally:
+        conn.close()
+    return results
+
+
+def update(path=MODEL_DIR):
+    """
+    Add reviews written since the model was last trained or updated.
+
+    The new negative reviews are scored with the saved model, which is left
+    unchanged so that they are comparable with the stored distributions, and
+    their products' summaries are refreshed. Words not in the dictionary are
+    ignored; retrain with train() once the topics of new reviews have drifted.
+
+    Returns:
+    - n_docs (int): Negative reviews added.
+    """
+    model = TopicModel.load(path)
+    conn = get_db_connection()
+    try:
+        with conn:
+            reviews = load_reviews(
+                conn, model.meta["column"], model.meta["last_review_id"]
+            )
+        if reviews.empty:
+            return 0
+        docs = negative_documents(reviews, model.meta["threshold"])
+        if len(docs):
+            write_topics(conn, model, docs)
+    finally:
+        conn.close()
+    model.meta["last_review_id"] = int(reviews["review_id"].max())
+    model.save(path)
+    return len(docs)
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Train the topic model of negative reviews, or update it with new reviews, and precompute the per-product topic summaries."
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Score new reviews with the saved model instead of training a new one.",
+    )
+    parser.add_argument(
+        "--column",
+        type=str,
+        choices=list(NEGATIVE_THRESHOLDS),
+        default="review_title",
+        help="Reviews to model: review_title (short) or review_content (long).",
+    )
+    parser.add_argument(
+        "--min_topics", type=int, default=2, help="Fewest topics in the grid."
+    )
+    parser.add_argument(
+        "--max_topics", type=int, default=9, help="Most topics in the grid."
+    )
+    parser.add_argument(
+        "--passes",
+        type=int,
+        nargs="+",
+        default=[10, 20],
+        help="Numbers of passes in the grid.",
+    )
+    parser.add_argument(
+        "--n_workers", type=int, default=None, help="Candidates trained at once."
+    )
+    parser.add_argument(
+        "--workers_per_model",
+        type=int,
+        default=1,
+        help="LdaMulticore workers per candidate.",
+    )
+    parser.add_argument(
+        "--model_dir", type=str, default=MODEL_DIR, help="Model directory."
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    if args.update:
+        print(f"Added {update(args.model_dir)} negative reviews")
+    else:
+        results = train(
+            args.column,
+            range(args.min_topics, args.max_topics + 1),
+            args.passes,
+            args.n_workers,
+            args.workers_per_model,
+            args.model_dir,
+        )
+        print(results.to_string(index=False))
@@ -1,16 +1,37 @@
-import io
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pickle
 import os
 import psycopg2
 from io import StringIO
-from PIL import Image
-from tensorflow.keras.models import Model, model_from_json, load_model
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input
+from tensorflow.keras.models import load_model
+from tensorflow.keras.applications.vgg16 import preprocess_input
 from sklearn.neighbors import NearestNeighbors
+from tabs.model_server import ModelServer, ModelUnavailableError
+from tabs.image_cache import LRUCache, content_hash, decode_image
+from computer_vision.vector_index import load_or_build_index
+from computer_vision.categorisation_model import (
+    IMAGE_SIZE as CATEGORY_IMAGE_SIZE,
+    load_product_categorisation_model,
+)
+from computer_vision.embeddings import (
+    EMBEDDING_DIM,
+    IMAGE_SIZE as SEARCH_IMAGE_SIZE,
+    build_embedding_model,
+    embed_images,
+)
+from computer_vision.constants import CLASS_NAMES
+from computer_vision.thumbnail_store import (
+    ThumbnailStore,
+    make_placeholder,
+    manifest_mtime,
+)
+from computer_vision.tflite_model import (
+    CLASSIFIER_TFLITE_PATH,
+    EMBEDDING_TFLITE_PATH,
+    TFLiteModel,
+    run_model,
+)
 
 postgres_password = os.getenv("POSTGRES_PASSWORD")
 postgres_port_no = os.getenv("POSTGRES_PORT")
@@ -18,6 +39,10 @@ host = os.getenv("POSTGRES_HOST")
 database = os.getenv("POSTGRES_DB")
 user = os.getenv("POSTGRES_USER")
 
+# Inference backend of both models: "keras", or "tflite" for the quantized
+# models exported by computer_vision/export_tflite.py
+CV_BACKEND = os.getenv("CV_BACKEND", "keras")
+
 
 def get_db_connection():
     """Get a database connection."""
@@ -39,73 +64,167 @@ def load_df():
     return df
 
 
-def load_product_categorisation_model():
+def load_tflite_categorisation_model():
+    """Load the quantized TFLite export of the categorisation model."""
+    return TFLiteModel(CLASSIFIER_TFLITE_PATH)
 
-    # load cnn model
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    model_path = os.path.join(parent_dir, "computer_vision", "model.json")
-    json_file = open(model_path, "r")
-    loaded_model_json = json_file.read()
-    json_file.close()
-    loaded_model = model_from_json(loaded_model_json)
 
-    # load weights into new model
-    weights_path = os.path.join(parent_dir, "computer_vision", "model.weights.h5")
-    loaded_model.load_weights(weights_path)
-    print("Loaded model from disk")
+def warm_product_categorisation_model(loaded_model):
+    """Run a dummy batch so the first request does not pay for graph tracing."""
+    run_model(loaded_model, np.zeros((1, 150, 150, 3), dtype=np.float32))
 
-    loaded_model.compile(
-        loss="sparse_categorical_crossentropy", optimizer=Adam(), metrics=["accuracy"]
-    )
 
-    return loaded_model
+# Uploads decoded to both model input sizes, and model results, keyed by the
+# upload's content hash so identical uploads skip decoding and inference
+decoded_image_cache = LRUCache("decoded_images", maxsize=64)
+result_cache = LRUCache("results", maxsize=1024)
+
+
+def decode_upload(img_bytes, digest=None):
+    """Decode an upload once into the input sizes of both models, cached by content hash."""
+    digest = digest or content_hash(img_bytes)
+    images = decoded_image_cache.get(digest)
+    if images is None:
+        images = decode_image(img_bytes, [CATEGORY_IMAGE_SIZE, SEARCH_IMAGE_SIZE])
+        decoded_image_cache.put(digest, images)
+    return images
+
+
+def preprocess_category_image(img_bytes, digest=None):
+    """Decode an image into the normalised 150x150 array the categorisation model expects."""
+    image = decode_upload(img_bytes, digest)[CATEGORY_IMAGE_SIZE]
+    return image.astype(np.float32) / 255.0  # Normalize
+
+
+def predict_product_categories(loaded_model, images):
+    """Predict the category of a batch of preprocessed images in one forward pass."""
+    predictions = run_model(loaded_model, np.stack(images))
+    pred_labels = np.argmax(predictions, axis=1)
+    return [CLASS_NAMES[label] for label in pred_labels]
 
 
 def predict_product_category(loaded_model, img_bytes):
-    image = Image.open(io.BytesIO(img_bytes)).convert("RGB").resize((150, 150))
-    image = np.array(image) / 255.0  # Convert to numpy array and normalize
-    image = np.expand_dims(image, axis=0)
-
-    class_names = [
-        "In-Ear",
-        "SmartTelevisions",
-        "Smartphones",
-        "Irons,Steamers&Accessories",
-        "Cables",
+    image = preprocess_category_image(img_bytes)
+    return predict_product_categories(loaded_model, [image])[0]
+
+
+def load_similarity_search():
+    """Load the embedding model and the vector index used to search similar products."""
+    # load vector index, built from the saved catalogue embeddings on first use
+    index = load_or_build_index()
+
+    # load embedding model, 512-d pooled VGG16 features as used for the catalogue
+    if index.input_dim != EMBEDDING_DIM:
+        # Index built from the KNN model's flattened features until the
+        # catalogue embeddings are computed
+        embedding_model = build_embedding_model(pooling=None)
+    elif CV_BACKEND == "tflite":
+        embedding_model = TFLiteModel(EMBEDDING_TFLITE_PATH)
+    else:
+        embedding_model = build_embedding_model()
+    return embedding_model, index
+
+
+def warm_similarity_search(resources):
+    """Run a dummy batch through the embedding model."""
+    embedding_model = resources[0]
+    run_model(embedding_model, np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+
+def preprocess_search_image(img_bytes, digest=None):
+    """Decode an image into the 224x224 VGG16 input array."""
+    image = decode_upload(img_bytes, digest)[SEARCH_IMAGE_SIZE]
+    return preprocess_input(image.astype(np.float32))
+
+
+def find_similar_products_batch(resources, requests):
+    """
+    Find similar products for a batch of (preprocessed image, k) requests.
+
+    Embeds all images in one forward pass and queries the index once with the largest k.
+    Each k is clamped to [0, len(index)], so one bad request cannot change the
+    results of the others in its batch.
+    """
+    embedding_model, index = resources
+    embeddings = embed_images(embedding_model, [image for image, _ in requests])
+    requests = [(image, min(max(int(k), 0), len(index))) for image, k in requests]
+    max_k = max(1, max(k for _, k in requests))
+    distances, indices = index.search(embeddings, k=max_k)
+    img_links = index.items["img_link"].values
+    return [
+        [
+            (img_links[idx], dist)
+            for idx, dist in zip(indices[i][:k], distances[i][:k])
+            if idx >= 0
+        ]
+        for i, (_, k) in enumerate(requests)
     ]
 
-    predictions = loaded_model.predict(image)
-    pred_labels = np.argmax(predictions, axis=1)
-    cat = class_names[pred_labels[0]]
-    return cat
+
+def find_similar_products(resources, img_bytes, k=5):
+    image = preprocess_search_image(img_bytes)
+    return find_similar_products_batch(resources, [(image, k)])[0]
+
+
+# Each model is loaded once per process and serves requests from its own thread
+classification_server = ModelServer(
+    "product_categorisation",
+    (
+        load_tflite_categorisation_model
+        if CV_BACKEND == "tflite"
+        else load_product_categorisation_model
+    ),
+    warm_product_categorisation_model,
+)
+similarity_server = ModelServer(
+    "similar_products", load_similarity_search, warm_similarity_search
+)
+
+
+def classify_product(img_bytes):
+    """Predict the category of an upload, reusing the result for identical uploads."""
+    digest = content_hash(img_bytes)
+    key = ("category", digest)
+    product_category = result_cache.get(key)
+    if product_category is None:
+        image = preprocess_category_image(img_bytes, digest)
+        product_category = classification_server.call(
+            predict_product_categories, [image]
+        )[0]
+        result_cache.put(key, product_category)
+    return product_category
 
 
 def search_similar_products(img_bytes, k=5):
-    df = pd.read_csv("computer_vision/amazon_embeddings.csv")
-    # df = load_df()
-    # load KNN model
-    knn_model = pickle.load(open("computer_vision/knn_pickle_file", "rb"))
-
-    # load embedding model
-    base_model = VGG16(weights="imagenet", include_top=False)
-    embedding_model = Model(inputs=base_model.input, outputs=base_model.output)
-
-    # load input image and generate embedding
-
-    input_img = Image.open(io.BytesIO(img_bytes)).convert("RGB").resize((224, 224))
-    img_array = np.array(input_img)[np.newaxis, ...]  # Add batch dimension
-    img_array = preprocess_input(img_array)
-    input_embedding = embedding_model.predict(img_array)
-    input_embedding = input_embedding.flatten()
-    # input_embedding.flatten()
-    distances, indices = knn_model.kneighbors([input_embedding])
-    # distances, indices = knn_model.predict([input_embedding])
-    similar_images = [
-        (df.iloc[idx]["img_link"], dist) for idx, dist in zip(indices[0], distances[0])
-    ]
+    """Find the k most similar products to an upload, reusing the result for identical uploads."""
+    digest = content_hash(img_bytes)
+    key = ("similar", digest, k)
+    similar_products = result_cache.get(key)
+    if similar_products is None:
+        image = preprocess_search_image(img_bytes, digest)
+        similar_products = similarity_server.call(
+            find_similar_products_batch, [(image, k)]
+        )[0]
+        result_cache.put(key, similar_products)
+    return similar_products
+
+
+@st.cache_resource(max_entries=1)
+def load_thumbnail_store(mtime):
+    """
+    Load the local thumbnail store of catalogue images.
+
+    Parameters:
+    - mtime (float): Modification time of the manifest, so the store is
+      reloaded once a download has added thumbnails.
+    """
+    return ThumbnailStore()
+
 
-    return similar_images
+@st.cache_resource
+def load_placeholder():
+    """Placeholder shown for images not in the thumbnail store."""
+    return make_placeholder()
 
 
 def display_computer_vision_tab(tab):
@@ -130,13 +249,17 @@ def display_computer_vision_tab(tab):
         bytes_data = uploaded_file.getvalue()
         tab.image(bytes_data, width=300)
 
-        # Load model and predict product category
-        model = load_product_categorisation_model()
-        product_category = predict_product_category(model, bytes_data)
-        tab.write(
-            f"Predicted product category: <span style='color: green;'>**{product_category}**</span>",
-            unsafe_allow_html=True,
-        )
+        # Predict product category with the model loaded once per process;
+        # reruns with the same upload are served from the result cache
+        try:
+            product_category = classify_product(bytes_data)
+        except ModelUnavailableError:
+            tab.info("The product categorisation model is not available.")
+        else:
+            tab.write(
+                f"Predicted product category: <span style='color: green;'>**{product_category}**</span>",
+                unsafe_allow_html=True,
+            )
 
     tab.title("Search for Similar Products")
     uploaded_file = tab.file_uploader("Choose a file", key=2)
@@ -144,7 +267,16 @@ def display_computer_vision_tab(tab):
         # To read file as bytes:
         bytes_data = uploaded_file.getvalue()
         tab.image(bytes_data, width=300)
-        similar_images = search_similar_products(bytes_data, k=5)
+        try:
+            similar_images = search_similar_products(bytes_data, k=5)
+        except ModelUnavailableError:
+            tab.info(
+                "Similar product search is not available: the vector index or the embedding model could not be loaded."
+            )
+            return
         tab.write("Similar images:")
+        # Thumbnails are served from the local store only; images it does not
+        # hold yet are shown as a placeholder rather than fetched remotely
+        thumbnail_store = load_thumbnail_store(manifest_mtime())
         for img_link, dist in similar_images:
-            tab.image(img_link, width=300)
+            tab.image(thumbnail_store.get(img_link) or load_placeholder(), width=300)
@@ -1,15 +1,13 @@
 import pandas as pd
 import os
-import nltk
 import numpy as np
 from h2ogpte import H2OGPTE
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
+from tabs.nlp_resources import stem, stopword_set
+from personalized_email.user_item_matrix import MATRIX_PATH, UserItemMatrix
 from IPython.display import Markdown
 import streamlit as st
 
@@ -24,9 +22,6 @@ host = os.getenv("POSTGRES_HOST")
 database = os.getenv("POSTGRES_DB")
 user = os.getenv("POSTGRES_USER")
 
-# Download NLTK resources
-nltk.download("stopwords")
-
 #### Connect to PostgreSQL database and load relevant table ####
 engine = create_engine(
     f"postgresql://{user}:{postgres_password}@{host}:{postgres_port_no}/{database}"
@@ -39,70 +34,35 @@ df = pd.merge(online_sales, products, on="product_id", how="left")
 
 
 ##### Product Recommendations #####
-def user_based_recommendation(cust_id, df, top_n=3):
-    # Check if the cust_id exists in the DataFrame
-    if cust_id not in df["cust_id"].unique():
-        print(f"User ID {cust_id} not found in the dataset.")
-        return []
-
-    # 1. Create the User-Item Matrix
-    user_item_matrix = df.pivot_table(
-        index="cust_id",
-        columns="product_id",
-        values="quantity",
-        aggfunc="sum",
-        fill_value=0,
-    )
-
-    # 2. Compute User Similarity Matrix using Cosine Similarity
-    # Cosine similarity returns values between 0 and 1
-    similarity_matrix = cosine_similarity(user_item_matrix)
-
-    # Convert the similarity matrix to a DataFrame for easier handling
-    similarity_df = pd.DataFrame(
-        similarity_matrix, index=user_item_matrix.index, columns=user_item_matrix.index
-    )
+@st.cache_resource
+def load_user_item_matrix():
+    """User-item matrix saved by personalized_email/user_item_matrix.py, or built from online_sales."""
+    if os.path.exists(MATRIX_PATH):
+        return UserItemMatrix.load(MATRIX_PATH)
+    return UserItemMatrix.from_sales(online_sales)
 
-    # 3. Find Similar Users
-    # Get similarity scores for the target user
-    user_similarities = similarity_df[cust_id].sort_values(ascending=False)
 
-    # Exclude the target user from the similarity scores
-    user_similarities = user_similarities.drop(labels=[cust_id])
-
-    # Select top similar users (you can adjust the number, e.g., top 10)
-    top_similar_users = user_similarities.head(10).index.tolist()
+def user_based_recommendation(cust_id, df, top_n=3):
+    # Sparse user-item matrix shared across calls; sales in df that it does not
+    # have yet are added incrementally
+    user_item_matrix = load_user_item_matrix()
+    user_item_matrix.update(df)
 
-    if not top_similar_users:
-        print(f"No similar users found for User ID {cust_id}.")
+    # Check if the cust_id exists in the matrix
+    if cust_id not in user_item_matrix:
+        print(f"User ID {cust_id} not found in the dataset.")
         return []
 
-    # 4. Aggregate Products from Similar Users
-    # Select the purchase data of similar users
-    similar_users_data = df[df["cust_id"].isin(top_similar_users)]
-
-    # Aggregate the quantities for each product from similar users
-    product_scores = similar_users_data.groupby("product_id")["quantity"].sum()
-
-    # 5. Exclude Products Already Purchased by the Target User
-    # Get the list of products already purchased by the target user
-    user_purchased_products = df[df["cust_id"] == cust_id]["product_id"].unique()
-
-    # Remove these products from the recommendation candidates
-    product_scores = product_scores.drop(
-        labels=user_purchased_products, errors="ignore"
+    # Top 10 users by cosine similarity of the quantities bought, excluding the
+    # target user, and the products they bought most that the target user has not
+    recommended_products = user_item_matrix.recommend(
+        cust_id, n_neighbours=10, top_n=top_n
     )
 
-    if product_scores.empty:
+    if not recommended_products:
         print(f"No new products to recommend for User ID {cust_id}.")
         return []
 
-    # 6. Sort the products based on the aggregated scores in descending order
-    sorted_products = product_scores.sort_values(ascending=False)
-
-    # 7. Select the Top N Products
-    recommended_products = sorted_products.head(top_n).index.tolist()
-
     # Print the recommended products with their names
     recommended_product_names = products[
         products["product_id"].isin(recommended_products)
@@ -113,12 +73,11 @@ def user_based_recommendation(cust_id, df, top_n=3):
 
 # Define a function to preprocess text
 def preprocess_text(text):
-    stop_words = set(stopwords.words("english"))
-    stemmer = PorterStemmer()
+    stop_words = stopword_set("english")
 
     # Tokenize, remove stop words, and apply stemming
     tokens = text.split()
-    tokens = [stemmer.stem(word) for word in tokens if word.lower() not in stop_words]
+    tokens = [stem(word) for word in tokens if word.lower() not in stop_words]
 
     return " ".join(tokens)
 
@@ -1,17 +1,144 @@
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import nltk
+import os
 
-nltk.download("vader_lexicon")
+import pandas as pd
+import psycopg2
+import streamlit as st
+from dotenv import load_dotenv
 
+from sentiment_analysis.review_index import INDEX_PATH, ReviewIndex
+from sentiment_analysis.scoring import get_vader_score, load_vader
 
-def load_vader():
-    analyzer = SentimentIntensityAnalyzer()
-    return analyzer
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
 
-def get_vader_score(text: str, vader_model):
-    score = vader_model.polarity_scores(text).get("compound")
-    return score
+PRODUCT_TOPICS_QUERY = """
+    SELECT p.product_id, p.product_name, s.topic, t.top_words, s.n_reviews, s.share
+    FROM product_topic_summary AS s
+    JOIN topic_terms AS t ON s.topic = t.topic
+    JOIN products AS p ON s.product_id = p.product_id
+    ORDER BY p.product_name, s.share DESC
+"""
+
+
+def get_db_connection():
+    """Get a database connection."""
+    return psycopg2.connect(
+        host=host,
+        database=database,
+        user=user,
+        password=postgres_password,
+        port=postgres_port_no,
+    )
+
+
+@st.cache_resource
+def load_review_index():
+    """Review search index built by sentiment_analysis/review_index.py, or None if it has not been built."""
+    if not os.path.exists(INDEX_PATH):
+        return None
+    return ReviewIndex.load(INDEX_PATH)
+
+
+def display_review_search(tab):
+    """Display keyword in context search and the most common phrases of the reviews."""
+    tab.subheader("Search Reviews")
+    index = load_review_index()
+    if index is None:
+        tab.info(
+            "No review index yet. Run `python -m sentiment_analysis.review_index` to build it."
+        )
+        return
+
+    keyword = tab.text_input("Keyword or phrase", key="review_keyword")
+    if keyword:
+        breakdown = index.sentiment_breakdown(keyword)
+        columns = tab.columns(4)
+        columns[0].metric("Reviews", breakdown["reviews"])
+        columns[1].metric("Positive", breakdown["positive"])
+        columns[2].metric("Neutral", breakdown["neutral"])
+        columns[3].metric("Negative", breakdown["negative"])
+        results = index.search(keyword)
+        if results.empty:
+            tab.write(f"No reviews found containing the keyword '{keyword}'.")
+        else:
+            tab.dataframe(results, hide_index=True)
+
+    tab.subheader("Top Phrases")
+    scope = tab.radio(
+        "Count phrases in",
+        ["All Reviews", "Category", "Product"],
+        horizontal=True,
+        key="phrase_scope",
+    )
+    n = tab.slider("Words per phrase", 1, index.max_n, 2, key="phrase_words")
+    if scope == "Category":
+        category = tab.selectbox(
+            "Select a category", index.categories, key="phrase_category"
+        )
+        top = index.top_ngrams(n, category=category)
+    elif scope == "Product":
+        product_names = dict(zip(index.product_ids, index.product_names))
+        product_id = tab.selectbox(
+            "Select a product",
+            index.product_ids,
+            format_func=lambda product_id: product_names[product_id],
+            key="phrase_product",
+        )
+        top = index.top_ngrams(n, product_id=product_id)
+    else:
+        top = index.top_ngrams(n)
+    tab.dataframe(
+        top.rename(columns={"ngram": "Phrase", "reviews": "Reviews"}),
+        hide_index=True,
+    )
+
+
+@st.cache_data(ttl=3600)
+def load_product_topics():
+    """Per-product topic summaries precomputed by sentiment_analysis/topic_model.py."""
+    with get_db_connection() as conn:
+        return pd.read_sql_query(PRODUCT_TOPICS_QUERY, conn)
+
+
+def display_product_topics(tab):
+    """Display the common issues in a product's negative reviews."""
+    tab.subheader("Common Issues by Product")
+    try:
+        product_topics = load_product_topics()
+    except psycopg2.Error:
+        product_topics = pd.DataFrame()
+    if product_topics.empty:
+        tab.info(
+            "No topic summaries yet. Run `python -m sentiment_analysis.topic_model` to compute them."
+        )
+        return
+
+    product_names = product_topics.drop_duplicates("product_id").set_index(
+        "product_id"
+    )["product_name"]
+    product_id = tab.selectbox(
+        "Select a product",
+        product_names.index,
+        format_func=lambda product_id: product_names[product_id],
+        key="topic_product",
+    )
+    summary = product_topics[product_topics["product_id"] == product_id]
+    tab.dataframe(
+        summary[["top_words", "n_reviews", "share"]].rename(
+            columns={
+                "top_words": "Topic",
+                "n_reviews": "Negative Reviews",
+                "share": "Share",
+            }
+        ),
+        hide_index=True,
+    )
 
 
 def display_sentiment_analysis_tab(tab):
@@ -44,3 +171,7 @@ def display_sentiment_analysis_tab(tab):
                 )
         else:
             tab.write("Please enter some text for analysis.")
+
+    display_review_search(tab)
+
+    display_product_topics(tab)
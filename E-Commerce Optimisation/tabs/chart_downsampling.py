@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+# Plotly charts in the app render at roughly this width; one point per pixel is
+# the most a line chart can show
+DEFAULT_WIDTH_PX = 800
+
+
+def _as_float(x):
+    """Convert datetime or numeric values to float64 for area computations."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Select points with Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, in every bucket in between, the point
+    forming the largest triangle with the previously kept point and the average
+    of the next bucket, which preserves the visual shape of the line.
+
+    Parameters:
+    - x (np.ndarray): Sorted x values (numeric or datetime).
+    - y (np.ndarray): y values.
+    - n_out (int): Number of points to keep.
+
+    Returns:
+    - indices (np.ndarray): Positions of the kept points, in order.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = stop, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[prev] - avg_x) * (y[start:stop] - y[prev])
+            - (x[prev] - x[start:stop]) * (avg_y - y[prev])
+        )
+        prev = start + int(np.nanargmax(area)) if np.any(~np.isnan(area)) else start
+        indices[i + 1] = prev
+    return indices
+
+
+def minmax_indices(x, y, n_out):
+    """
+    Select the minimum and maximum point of each of n_out / 2 equal-count buckets.
+
+    Parameters:
+    - x (np.ndarray): Sorted x values.
+    - y (np.ndarray): y values.
+    - n_out (int): Number of points to keep.
+
+    Returns:
+    - indices (np.ndarray): Positions of the kept points, in order.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    buckets = np.arange(n) * (n_out // 2) // n
+    # Within each bucket, order by y: the first row is the min and the last the max
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    lasts = np.r_[firsts[1:] - 1, n - 1]
+    return np.unique(np.r_[order[firsts], order[lasts]])
+
+
+def downsample(df, x, y, n_out, group=None, method="lttb"):
+    """
+    Downsample each line of a long-format chart frame to at most n_out points.
+
+    Parameters:
+    - df (pd.DataFrame): Chart data sorted by x within each group.
+    - x (str): x column.
+    - y (str): y column.
+    - n_out (int): Maximum points per line.
+    - group (str): Column separating the lines, e.g. the plotly color column.
+    - method (str): 'lttb' or 'minmax'.
+
+    Returns:
+    - df (pd.DataFrame): The kept rows.
+    """
+    select = lttb_indices if method == "lttb" else minmax_indices
+    if group is None:
+        return df.iloc[select(df[x].values, df[y].values, n_out)]
+
+    positions = [
+        rows[select(df[x].values[rows], df[y].values[rows], n_out)]
+        for rows in df.groupby(group, sort=False).indices.values()
+    ]
+    if not positions:
+        return df
+    return df.iloc[np.sort(np.concatenate(positions))]
+
+
+def zoom_window(df, x, start, end):
+    """Return the rows of df (sorted by x) with start <= x <= end, found by binary search."""
+    values = df[x].values
+    lo = np.searchsorted(values, np.asarray(start, dtype=values.dtype), side="left")
+    hi = np.searchsorted(values, np.asarray(end, dtype=values.dtype), side="right")
+    return df.iloc[lo:hi]
+
+
+def chart_payload_bytes(fig):
+    """Size of the figure JSON that Streamlit sends to the browser."""
+    return len(fig.to_json().encode("utf-8"))
+
+
+def display_payload_caption(container, fig, n_shown, n_total):
+    """Report how many points and bytes a chart sends to the browser."""
+    container.caption(
+        f"Showing {n_shown:,} of {n_total:,} points · "
+        f"{chart_payload_bytes(fig) / 1024:.1f} KB sent"
+    )
+
+
+def zoomable_chart_data(
+    container, df, x, y, key, group=None, width_px=DEFAULT_WIDTH_PX, method="lttb"
+):
+    """
+    Let the user zoom into an x range and downsample only that range to the chart width.
+
+    Points are only sent at full resolution once the zoomed range has fewer
+    points per line than the chart has pixels.
+
+    Parameters:
+    - container: Streamlit container to draw the zoom slider in.
+    - df (pd.DataFrame): Chart data with datetime x.
+    - x (str): x column.
+    - y (str): y column.
+    - key (str): Unique Streamlit widget key.
+    - group (str): Column separating the lines.
+    - width_px (int): Target chart width in pixels.
+    - method (str): 'lttb' or 'minmax'.
+
+    Returns:
+    - chart_df (pd.DataFrame): Downsampled rows of the zoomed range.
+    """
+    if df.empty:
+        return df
+    df = df.sort_values([group, x] if group else x, kind="stable")
+    min_x = df[x].min().to_pydatetime()
+    max_x = df[x].max().to_pydatetime()
+    if min_x == max_x:
+        return df
+
+    start, end = container.slider(
+        "Zoom", min_value=min_x, max_value=max_x, value=(min_x, max_x), key=key
+    )
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if group is None:
+        visible = zoom_window(df, x, start, end)
+    else:
+        visible = pd.concat(
+            [
+                zoom_window(part, x, start, end)
+                for _, part in df.groupby(group, sort=False)
+            ]
+        )
+    return downsample(visible, x, y, width_px, group=group, method=method)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Statuses of a successfully delivered shipment, in order
+FUNNEL_STEPS = [
+    "Pending",
+    "Packed",
+    "At logistics facility",
+    "Shipping",
+    "Delivered to buyer",
+]
+
+
+def encode_statuses(status, steps=FUNNEL_STEPS):
+    """Encode statuses as their position in steps, or -1 for other statuses (e.g. Returned)."""
+    codes = pd.Categorical(status, categories=steps).codes
+    return codes.astype(np.int8)
+
+
+def funnel_step_days(shipping_id, update_date, status, steps=FUNNEL_STEPS):
+    """
+    Find shipments that went through every funnel step in order and the days each step took.
+
+    Rows are sorted once by shipment, date and step. A shipment is valid when it
+    has exactly one row per step and the row at each position of its group is
+    that step, which is checked for all shipments at once with a segmented
+    reduction instead of a Python call per shipment.
+
+    Parameters:
+    - shipping_id (array-like): Shipment of each history row.
+    - update_date (array-like): Date of each status update.
+    - status (array-like): Status of each row.
+    - steps (list): Expected statuses, in order.
+
+    Returns:
+    - shipment_ids (np.ndarray): Valid shipments.
+    - step_days (np.ndarray): Days from the previous step, shape (shipments, len(steps) - 1); NaN where a date is missing.
+    - first_rows (np.ndarray): Input row of each valid shipment's first step, for looking up shipment attributes.
+    """
+    shipping_id = np.asarray(shipping_id)
+    codes = encode_statuses(status, steps)
+    days = pd.to_datetime(pd.Series(update_date)).values.astype("datetime64[D]")
+    days = np.where(np.isnat(days), np.nan, days.astype(np.int64).astype(np.float64))
+
+    n_steps = len(steps)
+    if len(shipping_id) == 0:
+        return shipping_id[:0], np.empty((0, n_steps - 1)), np.empty(0, dtype=np.int64)
+
+    order = np.lexsort((codes, days, shipping_id))
+    sorted_ids = shipping_id[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    position = np.arange(len(order)) - np.repeat(starts, sizes)
+
+    in_place = position == codes[order]
+    valid = (sizes == n_steps) & np.logical_and.reduceat(in_place, starts)
+
+    rows = order[starts[valid][:, None] + np.arange(n_steps)]
+    step_days = np.diff(days[rows], axis=1)
+    return sorted_ids[starts[valid]], step_days, rows[:, 0]
+
+
+def funnel_durations(shipping_history_df, group_col=None, steps=FUNNEL_STEPS):
+    """
+    Long frame of days taken by each step of every successfully delivered shipment.
+
+    Parameters:
+    - shipping_history_df (pd.DataFrame): Data with 'shipping_id', 'update_date' and 'status' columns.
+    - group_col (str): Shipment attribute to carry along, e.g. 'fulfilment_service_level'.
+    - steps (list): Expected statuses, in order.
+
+    Returns:
+    - durations (pd.DataFrame): 'shipping_id', 'status' (ordered categorical of steps[1:]), 'days_from_previous' and group_col.
+    """
+    shipment_ids, step_days, first_rows = funnel_step_days(
+        shipping_history_df["shipping_id"].values,
+        shipping_history_df["update_date"].values,
+        shipping_history_df["status"].values,
+        steps,
+    )
+    n_shipments, n_durations = step_days.shape
+    durations = pd.DataFrame(
+        {
+            "shipping_id": np.repeat(shipment_ids, n_durations),
+            "status": pd.Categorical.from_codes(
+                np.tile(np.arange(n_durations), n_shipments),
+                categories=steps[1:],
+                ordered=True,
+            ),
+            "days_from_previous": step_days.ravel(),
+        }
+    )
+    if group_col is not None:
+        groups = shipping_history_df[group_col].values[first_rows]
+        durations[group_col] = np.repeat(groups, n_durations)
+    return durations
@@ -0,0 +1,83 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def content_hash(data):
+    """SHA-256 hex digest of an upload, used as its cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def decode_image(img_bytes, sizes):
+    """
+    Decode an image once and resize it to each of the given sizes.
+
+    JPEGs are decoded in draft mode, which lets the decoder scale the image down
+    by 1/2, 1/4 or 1/8 while decoding, so large photos are never decoded at full
+    resolution. The draft is never smaller than the largest requested size.
+
+    Parameters:
+    - img_bytes (bytes): Encoded image.
+    - sizes (list): (width, height) sizes to produce.
+
+    Returns:
+    - images (dict): (width, height) -> uint8 RGB array of shape (height, width, 3).
+    """
+    image = Image.open(io.BytesIO(img_bytes))
+    largest = (max(w for w, _ in sizes), max(h for _, h in sizes))
+    image.draft("RGB", largest)
+    image = image.convert("RGB")
+    return {size: np.asarray(image.resize(size), dtype=np.uint8) for size in sizes}
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit and miss counts.
+
+    Parameters:
+    - name (str): Name shown in the stats.
+    - maxsize (int): Maximum number of entries kept.
+    """
+
+    def __init__(self, name, maxsize=256):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value, or None if the key is not cached."""
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        """Size and hit rate of the cache."""
+        with self._lock:
+            n_lookups = self.hits + self.misses
+            return {
+                "cache": self.name,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / n_lookups if n_lookups else None,
+            }
@@ -0,0 +1,316 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+from tabs.fulfilment_funnel import FUNNEL_STEPS, funnel_step_days
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+postgres_password = os.getenv("POSTGRES_PASSWORD")
+postgres_port_no = os.getenv("POSTGRES_PORT")
+host = os.getenv("POSTGRES_HOST")
+database = os.getenv("POSTGRES_DB")
+user = os.getenv("POSTGRES_USER")
+
+GROUP_COLUMNS = ["fulfilment", "ship_service_level", "origin_area"]
+# Funnel steps, plus the whole order-to-delivery lead time
+STEP_NAMES = FUNNEL_STEPS[1:] + ["Total"]
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Rows of one partition of the history, ordered by shipment so a shipment's rows
+# are never split across more than two consecutive chunks
+HISTORY_QUERY = """
+    SELECT
+        h.shipping_id, h.status, h.update_date, s.fulfilment,
+        s.ship_service_level, s.estimated_delivery_date, p.origin_area
+    FROM
+        shipping_history AS h
+    JOIN
+        shipping_status AS s
+    ON
+        h.shipping_id = s.shipping_id
+    LEFT JOIN
+        products AS p
+    ON
+        s.product_id = p.product_id
+    WHERE
+        h.shipping_id % :n_partitions = :partition
+    ORDER BY
+        h.shipping_id
+"""
+
+
+def create_db_engine():
+    """Create the database engine."""
+    return create_engine(
+        f"postgresql://{user}:{postgres_password}@{host}:{postgres_port_no}/{database}"
+    )
+
+
+class DayHistogram:
+    """
+    Exact, mergeable distribution of lead times in whole days.
+
+    Lead times are whole numbers of days, so a count per day summarises them
+    exactly in a few dozen integers. Histograms built on separate partitions
+    merge by adding counts, and every quantile is a day that was observed.
+    """
+
+    def __init__(self):
+        # counts[i] is the number of lead times of start + i days
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def update(self, days):
+        """Add a batch of lead times in days; NaNs are skipped."""
+        days = np.asarray(days, dtype=np.float64)
+        days = days[~np.isnan(days)].astype(np.int64)
+        if len(days) == 0:
+            return self
+        start = days.min()
+        return self._add(start, np.bincount(days - start))
+
+    def merge(self, other):
+        """Add the lead times counted by another histogram."""
+        return self._add(other.start, other.counts)
+
+    def _add(self, start, counts):
+        """Add counts of consecutive days from start, widening the day range as needed."""
+        if len(counts) == 0:
+            return self
+        if len(self.counts) == 0:
+            self.start, self.counts = int(start), counts.astype(np.int64)
+            return self
+        new_start = min(self.start, start)
+        end = max(self.start + len(self.counts), start + len(counts))
+        total = np.zeros(end - new_start, dtype=np.int64)
+        total[self.start - new_start :][: len(self.counts)] += self.counts
+        total[start - new_start :][: len(counts)] += counts
+        self.start, self.counts = int(new_start), total
+        return self
+
+    def quantile(self, q):
+        """
+        Exact quantiles (0 <= q <= 1): the smallest day by which a share q of
+        lead times are complete, as numpy's 'inverted_cdf' method.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+        cumulative = np.cumsum(self.counts)
+        # Rank of the quantile; the tolerance keeps e.g. 0.9 * 10 at rank 9
+        rank = np.maximum(np.ceil(q * cumulative[-1] - 1e-9), 1)
+        return (self.start + np.searchsorted(cumulative, rank)).astype(np.float64)
+
+
+class LeadTimeStats:
+    """
+    Lead-time histograms and SLA breach counts per fulfilment, service level and origin.
+
+    Built in one pass over chunks of the shipping history; stats of separate
+    partitions merge with merge().
+    """
+
+    def __init__(self):
+        # (fulfilment, ship_service_level, origin_area, step) -> DayHistogram
+        self.histograms = {}
+        # (fulfilment, ship_service_level, origin_area) ->
+        # [delivered, breached, days late]
+        self.sla = {}
+
+    def update(self, chunk):
+        """
+        Add a chunk of history rows holding every row of the shipments it contains.
+
+        Parameters:
+        - chunk (pd.DataFrame): Rows of HISTORY_QUERY.
+        """
+        chunk = chunk.reset_index(drop=True)
+        groups = chunk[GROUP_COLUMNS].fillna("Unknown")
+
+        _, step_days, first_rows = funnel_step_days(
+            chunk["shipping_id"].values,
+            chunk["update_date"].values,
+            chunk["status"].values,
+        )
+        step_days = np.column_stack([step_days, step_days.sum(axis=1)])
+        shipment_groups = groups.iloc[first_rows].reset_index(drop=True)
+        for key, rows in shipment_groups.groupby(GROUP_COLUMNS).indices.items():
+            for step, days in zip(STEP_NAMES, step_days[rows].T):
+                self.histograms.setdefault(key + (step,), DayHistogram()).update(days)
+
+        # SLA breach: delivered after the estimated delivery date
+        delivered = chunk["status"].values == "Delivered to buyer"
+        days_late = (
+            pd.to_datetime(chunk["update_date"][delivered])
+            - pd.to_datetime(chunk["estimated_delivery_date"][delivered])
+        ).dt.days
+        sla = pd.DataFrame(
+            {
+                "delivered": days_late.notna(),
+                "breached": days_late > 0,
+                "days_late": days_late.clip(lower=0).fillna(0),
+            }
+        )
+        sla = sla.groupby([groups[col][delivered] for col in GROUP_COLUMNS]).sum()
+        for key, counts in zip(sla.index, sla.values):
+            totals = self.sla.setdefault(key, np.zeros(3))
+            totals += counts
+        return self
+
+    def merge(self, other):
+        """Add the stats of another partition."""
+        for key, histogram in other.histograms.items():
+            self.histograms.setdefault(key, DayHistogram()).merge(histogram)
+        for key, counts in other.sla.items():
+            self.sla[key] = self.sla.get(key, np.zeros(3)) + counts
+        return self
+
+    def quantile_table(self, quantiles=DEFAULT_QUANTILES):
+        """
+        Lead-time quantiles per group and step.
+
+        Parameters:
+        - quantiles (list): Quantiles to compute.
+
+        Returns:
+        - table (pd.DataFrame): Group columns, 'step', 'n_shipments' and one 'p<q>' column per quantile, in whole days.
+        """
+        rows = [
+            key + (histogram.count,) + tuple(histogram.quantile(quantiles))
+            for key, histogram in self.histograms.items()
+        ]
+        quantile_columns = [f"p{q * 100:g}" for q in quantiles]
+        columns = GROUP_COLUMNS + ["step", "n_shipments"] + quantile_columns
+        table = pd.DataFrame(rows, columns=columns)
+        table[quantile_columns] = table[quantile_columns].astype("Int64")
+        table["step"] = pd.Categorical(
+            table["step"], categories=STEP_NAMES, ordered=True
+        )
+        return table.sort_values(GROUP_COLUMNS + ["step"], ignore_index=True)
+
+    def sla_table(self):
+        """
+        SLA breach rate per group.
+
+        Returns:
+        - table (pd.DataFrame): Group columns, 'n_delivered', 'n_breached', 'breach_rate' and 'avg_days_late' of breached deliveries.
+        """
+        table = pd.DataFrame(
+            [key + tuple(counts) for key, counts in self.sla.items()],
+            columns=GROUP_COLUMNS + ["n_delivered", "n_breached", "days_late"],
+        )
+        table["breach_rate"] = table["n_breached"] / table["n_delivered"]
+        table["avg_days_late"] = table["days_late"] / table["n_breached"]
+        return table.drop(columns="days_late").sort_values(
+            GROUP_COLUMNS, ignore_index=True
+        )
+
+
+def iter_shipment_chunks(chunks):
+    """
+    Re-cut chunks of rows ordered by shipping_id so no shipment spans two chunks.
+
+    The trailing shipment of each chunk may continue in the next one, so it is
+    carried over.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+        last = chunk["shipping_id"].values[-1]
+        complete = chunk["shipping_id"].values != last
+        carry = chunk[~complete]
+        yield chunk[complete]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def analyse_partition(partition, n_partitions=1, chunksize=500_000):
+    """
+    Build the stats of one partition of the history in one streaming pass.
+
+    Parameters:
+    - partition (int): Partition number, shipping_id % n_partitions.
+    - n_partitions (int): Number of partitions.
+    - chunksize (int): Rows fetched at a time.
+
+    Returns:
+    - stats (LeadTimeStats): Stats of the partition.
+    """
+    stats = LeadTimeStats()
+    engine = create_db_engine()
+    with engine.connect().execution_options(stream_results=True) as connection:
+        chunks = pd.read_sql(
+            text(HISTORY_QUERY),
+            connection,
+            params={"n_partitions": n_partitions, "partition": partition},
+            chunksize=chunksize,
+        )
+        for chunk in iter_shipment_chunks(chunks):
+            stats.update(chunk)
+    engine.dispose()
+    return stats
+
+
+def compute_lead_time_stats(n_partitions=1, chunksize=500_000):
+    """
+    Build lead-time stats over the whole history, one worker process per partition.
+
+    Parameters:
+    - n_partitions (int): Number of partitions processed in parallel.
+    - chunksize (int): Rows fetched at a time.
+
+    Returns:
+    - stats (LeadTimeStats): Merged stats.
+    """
+    args = [(p, n_partitions, chunksize) for p in range(n_partitions)]
+    if n_partitions == 1:
+        return analyse_partition(*args[0])
+    with ProcessPoolExecutor(max_workers=n_partitions) as executor:
+        partitions = list(executor.map(analyse_partition, *zip(*args)))
+    return reduce(LeadTimeStats.merge, partitions)
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Compute lead-time quantiles and SLA breach rates from the shipping history."
+    )
+    parser.add_argument(
+        "--n_partitions",
+        type=int,
+        default=1,
+        help="Number of partitions of the history processed in parallel.",
+    )
+    parser.add_argument(
+        "--quantiles_file",
+        type=str,
+        required=True,
+        help="Path to the output CSV file to save lead-time quantiles.",
+    )
+    parser.add_argument(
+        "--sla_file",
+        type=str,
+        required=True,
+        help="Path to the output CSV file to save SLA breach rates.",
+    )
+
+    # Parse arguments
+    args = parser.parse_args()
+
+    stats = compute_lead_time_stats(n_partitions=args.n_partitions)
+    stats.quantile_table().to_csv(args.quantiles_file, index=False)
+    stats.sla_table().to_csv(args.sla_file, index=False)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when a server's model cannot be loaded, e.g. because its files are missing."""
+
+
+class ModelServer:
+    """
+    Hold one loaded model and run its inference on a dedicated thread pool.
+
+    The model is loaded on first use (or explicitly at startup with load()) and
+    warmed with a dummy batch so the first request does not pay for graph
+    tracing. If loading fails, ModelUnavailableError is raised and loading is
+    retried on the next request. Load time and the latency of recent requests
+    are recorded.
+
+    Parameters:
+    - name (str): Name shown in the stats.
+    - loader (callable): Returns the model (or any resources inference needs).
+    - warmup (callable): Runs a dummy inference on the loaded model.
+    - max_workers (int): Inference threads. 1 serialises requests to the model.
+    - history (int): Number of recent request latencies kept.
+    """
+
+    def __init__(self, name, loader, warmup=None, max_workers=1, history=1000):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self.model = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.load_error = None
+        self.latencies = deque(maxlen=history)
+        self.n_requests = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load and warm the model once; later calls return the loaded model."""
+        with self._lock:
+            if self.model is None:
+                try:
+                    start = time.perf_counter()
+                    model = self.loader()
+                    self.load_seconds = time.perf_counter() - start
+                    if self.warmup is not None:
+                        start = time.perf_counter()
+                        self.warmup(model)
+                        self.warmup_seconds = time.perf_counter() - start
+                except Exception as e:
+                    self.load_error = f"{type(e).__name__}: {e}"
+                    raise ModelUnavailableError(
+                        f"Model {self.name} is unavailable: {self.load_error}"
+                    ) from e
+                self.model = model
+                self.load_error = None
+        return self.model
+
+    def _timed(self, fn, *args, **kwargs):
+        """Run fn(model, *args) and record its latency."""
+        model = self.load()
+        start = time.perf_counter()
+        try:
+            return fn(model, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latencies.append(elapsed)
+                self.n_requests += 1
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(model, *args) on the inference pool and wait for the result."""
+        return self.executor.submit(self._timed, fn, *args, **kwargs).result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(model, *args) on the inference pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, lambda: self._timed(fn, *args, **kwargs)
+        )
+
+    def stats(self):
+        """Load time and latency percentiles of recent requests, in milliseconds."""
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            n_requests = self.n_requests
+        stats = {
+            "model": self.name,
+            "loaded": self.model is not None,
+            "load_error": self.load_error,
+            "load_ms": None if self.load_seconds is None else self.load_seconds * 1000,
+            "warmup_ms": (
+                None if self.warmup_seconds is None else self.warmup_seconds * 1000
+            ),
+            "n_requests": n_requests,
+        }
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(
+                mean_ms=float(latencies.mean()),
+                p50_ms=float(p50),
+                p95_ms=float(p95),
+                p99_ms=float(p99),
+            )
+        return stats
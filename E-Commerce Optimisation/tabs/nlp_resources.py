@@ -0,0 +1,170 @@
+import os
+import pickle
+from functools import lru_cache
+from importlib.metadata import version
+from types import MappingProxyType
+
+# Parsed NLTK resources, pickled on first use so later processes skip parsing
+# and never check for downloads. NLTK itself is imported on first use, not at
+# import time, since importing it takes about a second
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", ".nlp_cache")
+# Cache files are keyed on the NLTK version, so an upgrade rebuilds them
+NLTK_VERSION = version("nltk")
+VADER_LEXICON = "sentiment/vader_lexicon.zip/vader_lexicon/vader_lexicon.txt"
+
+
+def load_nltk_resource(loader, package):
+    """Run loader, downloading the NLTK package only if it is not installed."""
+    import nltk
+
+    try:
+        return loader()
+    except LookupError:
+        nltk.download(package, quiet=True)
+        return loader()
+
+
+def load_cached(name, build, rebuild=False):
+    """
+    Load a resource from its pickle in CACHE_DIR, building and pickling it the first time.
+
+    The pickle records the resource name and NLTK version it was built with; a
+    pickle that does not match, or cannot be read, is rebuilt.
+
+    Parameters:
+    - name (str): Resource name.
+    - build (callable): Builds the resource.
+    - rebuild (bool): Build and pickle the resource even if a pickle exists.
+    """
+    path = os.path.join(CACHE_DIR, f"{name}-nltk{NLTK_VERSION}.pkl")
+    key = {"name": name, "nltk": NLTK_VERSION}
+    if not rebuild:
+        try:
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+            if isinstance(cached, dict) and cached.get("key") == key:
+                return cached["value"]
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+    value = build()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write then rename, so concurrent workers never read a partial pickle
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"key": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return value
+
+
+def parse_vader_lexicon():
+    """Parse the VADER lexicon file into a word -> valence dict."""
+    import nltk
+
+    text = load_nltk_resource(lambda: nltk.data.load(VADER_LEXICON), "vader_lexicon")
+    lexicon = {}
+    for line in text.split("\n"):
+        if line.strip():
+            word, measure = line.strip().split("\t")[0:2]
+            lexicon[word] = float(measure)
+    return lexicon
+
+
+@lru_cache(maxsize=None)
+def vader_lexicon():
+    """The VADER lexicon as a read-only mapping, loaded once per process."""
+    return MappingProxyType(load_cached("vader_lexicon", parse_vader_lexicon))
+
+
+def build_stopwords(language="english"):
+    """NLTK stopwords of a language as a frozenset."""
+    from nltk.corpus import stopwords
+
+    return frozenset(load_nltk_resource(lambda: stopwords.words(language), "stopwords"))
+
+
+def build_english_words():
+    """NLTK English word list as a frozenset."""
+    from nltk.corpus import words
+
+    return frozenset(load_nltk_resource(words.words, "words"))
+
+
+@lru_cache(maxsize=None)
+def stopword_set(language="english"):
+    """NLTK stopwords of a language as a frozenset, loaded once per process."""
+    return load_cached(f"stopwords_{language}", lambda: build_stopwords(language))
+
+
+@lru_cache(maxsize=None)
+def stopwords_keeping_not(language="english"):
+    """Stopwords of a language without 'not', which changes the sentiment of a phrase; built once per process."""
+    return stopword_set(language) - {"not"}
+
+
+@lru_cache(maxsize=None)
+def english_words():
+    """NLTK English word list as a frozenset, loaded once per process."""
+    return load_cached("english_words", build_english_words)
+
+
+@lru_cache(maxsize=None)
+def porter_stemmer():
+    """Shared PorterStemmer."""
+    from nltk.stem.porter import PorterStemmer
+
+    return PorterStemmer()
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """Porter stem of a word, memoised since the same words recur across texts."""
+    return porter_stemmer().stem(word)
+
+
+@lru_cache(maxsize=None)
+def wordnet_lemmatizer():
+    """Shared WordNetLemmatizer, with WordNet loaded (and downloaded if missing)."""
+    from nltk.stem.wordnet import WordNetLemmatizer
+
+    lemmatizer = WordNetLemmatizer()
+    # WordNet is read lazily, so load it now rather than on the first word
+    load_nltk_resource(lambda: lemmatizer.lemmatize("reviews"), "wordnet")
+    return lemmatizer
+
+
+@lru_cache(maxsize=100_000)
+def lemmatize(word):
+    """WordNet lemma of a word, memoised since the same words recur across texts."""
+    return wordnet_lemmatizer().lemmatize(word)
+
+
+def make_vader_analyzer():
+    """
+    VADER sentiment analyzer that shares the cached lexicon.
+
+    Scores are the same as SentimentIntensityAnalyzer(), but the lexicon file is
+    not re-read and re-parsed for every analyzer.
+    """
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+    analyzer = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+    analyzer.lexicon_file = None
+    analyzer.lexicon = vader_lexicon()
+    analyzer.constants = VaderConstants()
+    return analyzer
+
+
+if __name__ == "__main__":
+    # Rebuild the caches from NLTK, e.g. when building the Docker image
+    lexicon = load_cached("vader_lexicon", parse_vader_lexicon, rebuild=True)
+    print(f"VADER lexicon: {len(lexicon)} words")
+    stopwords = load_cached(
+        "stopwords_english", lambda: build_stopwords("english"), rebuild=True
+    )
+    print(f"Stopwords: {len(stopwords)} words")
+    words = load_cached("english_words", build_english_words, rebuild=True)
+    print(f"English words: {len(words)} words")
+    # WordNet is read from the NLTK data directory, so download it now rather
+    # than on the first review search in a container
+    wordnet_lemmatizer()
+    print("WordNet: loaded")
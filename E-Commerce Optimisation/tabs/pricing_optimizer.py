@@ -0,0 +1,221 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+PRICING_DATA_PATH = "pricing-strategies/forecast_with_ped.csv"
+
+# Bounds of the discount slider in the Pricing Strategies tab; a discount of 100%
+# would give the product away, so the optimizer stops short of it
+MIN_DISCOUNT = -0.5
+MAX_DISCOUNT = 0.9
+
+
+def revenue_curve(price, forecast_demand, ped, discounts, unit_cost=None):
+    """
+    Evaluate the constant-elasticity revenue (or profit) curve for many items at once.
+
+    Broadcasts the same model as expected_revenue in tabs/tab2b.py,
+    d_new = d * ((p * (1 - discount)) / p) ** PED, over every item and discount.
+
+    Parameters:
+    - price (np.ndarray): List price per item, shape (n,).
+    - forecast_demand (np.ndarray): Forecast demand per item, shape (n,).
+    - ped (np.ndarray): Price elasticity of demand per item, shape (n,).
+    - discounts (np.ndarray): Discounts as fractions, shape (g,) or (n, g).
+    - unit_cost (np.ndarray): Unit cost per item. If given, profit is returned instead of revenue.
+
+    Returns:
+    - new_demand (np.ndarray): Demand per item and discount, shape (n, g).
+    - new_price (np.ndarray): Price per item and discount, shape (n, g).
+    - value (np.ndarray): Revenue (or profit) per item and discount, shape (n, g).
+    """
+    price = np.asarray(price, dtype=np.float64)[:, None]
+    forecast_demand = np.asarray(forecast_demand, dtype=np.float64)[:, None]
+    ped = np.asarray(ped, dtype=np.float64)[:, None]
+    ratio = 1 - np.asarray(discounts, dtype=np.float64)
+
+    new_price = price * ratio
+    new_demand = forecast_demand * ratio**ped
+    margin = new_price
+    if unit_cost is not None:
+        margin = new_price - np.asarray(unit_cost, dtype=np.float64)[:, None]
+    return new_demand, new_price, margin * new_demand
+
+
+def discount_bounds(
+    price,
+    forecast_demand,
+    ped,
+    min_discount=MIN_DISCOUNT,
+    max_discount=MAX_DISCOUNT,
+    unit_cost=None,
+    min_margin=0.0,
+    inventory=None,
+):
+    """
+    Feasible discount range per item under margin and inventory constraints.
+
+    Parameters:
+    - price, forecast_demand, ped (np.ndarray): As in revenue_curve.
+    - min_discount (float): Lowest discount allowed (negative is a price increase).
+    - max_discount (float): Highest discount allowed.
+    - unit_cost (np.ndarray): Unit cost; the discounted price must keep min_margin over it.
+    - min_margin (float): Minimum margin over unit cost as a fraction of cost.
+    - inventory (np.ndarray): Units available; discounted demand must not exceed it.
+
+    Returns:
+    - lo (np.ndarray): Lowest feasible discount per item.
+    - hi (np.ndarray): Highest feasible discount per item.
+    - feasible (np.ndarray): False where the constraints cannot all be met.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    ped = np.asarray(ped, dtype=np.float64)
+    n = len(price)
+    lo = np.full(n, float(min_discount))
+    hi = np.full(n, float(max_discount))
+
+    if unit_cost is not None:
+        # p * (1 - discount) >= cost * (1 + min_margin)
+        floor_price = np.asarray(unit_cost, dtype=np.float64) * (1 + min_margin)
+        hi = np.minimum(hi, 1 - floor_price / price)
+
+    if inventory is not None:
+        # d * (1 - discount) ** PED <= inventory, solved for the discount
+        cover = np.asarray(inventory, dtype=np.float64) / np.asarray(
+            forecast_demand, dtype=np.float64
+        )
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            limit = 1 - cover ** (1 / ped)
+        # Demand rises with the discount when PED < 0, so the limit caps it from
+        # above; when PED > 0 it bounds it from below
+        hi = np.where(ped < 0, np.minimum(hi, np.nan_to_num(limit, nan=hi)), hi)
+        lo = np.where(ped > 0, np.maximum(lo, np.nan_to_num(limit, nan=lo)), lo)
+
+    feasible = lo <= hi
+    if inventory is not None:
+        # Demand does not respond to the price when PED == 0, so no discount can
+        # bring it within the inventory
+        feasible &= ~((ped == 0) & (cover < 1))
+    hi = np.where(feasible, hi, lo)
+    return lo, hi, feasible
+
+
+def optimal_discounts(
+    price,
+    forecast_demand,
+    ped,
+    min_discount=MIN_DISCOUNT,
+    max_discount=MAX_DISCOUNT,
+    unit_cost=None,
+    min_margin=0.0,
+    inventory=None,
+    grid_size=151,
+):
+    """
+    Find the revenue (or profit) maximising discount for every item in one broadcast.
+
+    A coarse grid over each item's feasible range is evaluated first. It is then
+    refined with the closed-form optimum of the constant-elasticity curve: revenue
+    p * d * (1 - discount) ** (1 + PED) is monotone, so its optimum is at a bound,
+    and profit has its only stationary point at
+    1 - discount = PED * cost / (price * (1 + PED)).
+
+    Parameters:
+    - price, forecast_demand, ped (np.ndarray): As in revenue_curve.
+    - min_discount, max_discount, unit_cost, min_margin, inventory: As in discount_bounds.
+    - grid_size (int): Number of grid points per item.
+
+    Returns:
+    - result (pd.DataFrame): 'optimal_discount', 'optimal_price', 'optimal_demand',
+      'optimal_value', 'base_value' and 'feasible' per item.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    ped = np.asarray(ped, dtype=np.float64)
+    lo, hi, feasible = discount_bounds(
+        price,
+        forecast_demand,
+        ped,
+        min_discount,
+        max_discount,
+        unit_cost,
+        min_margin,
+        inventory,
+    )
+
+    # Coarse grid, scaled to each item's feasible range
+    steps = np.linspace(0, 1, grid_size)
+    grid = lo[:, None] + (hi - lo)[:, None] * steps
+    _, _, values = revenue_curve(price, forecast_demand, ped, grid, unit_cost)
+
+    # Closed-form candidates: no discount (where feasible), both bounds, plus the
+    # interior profit optimum
+    candidates = [np.clip(0.0, lo, hi), lo, hi]
+    if unit_cost is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = ped * np.asarray(unit_cost, dtype=np.float64) / (price * (1 + ped))
+        candidates.append(np.clip(np.nan_to_num(1 - ratio, nan=lo), lo, hi))
+    candidates = np.column_stack(candidates)
+    _, _, candidate_values = revenue_curve(
+        price, forecast_demand, ped, candidates, unit_cost
+    )
+
+    all_discounts = np.hstack([grid, candidates])
+    all_values = np.hstack([values, candidate_values])
+    all_values = np.where(np.isfinite(all_values), all_values, -np.inf)
+    # Values within rounding of the best are ties, e.g. the flat curve of PED == -1;
+    # of those, the discount closest to 0 is picked so no change is recommended
+    # for nothing
+    best_values = all_values.max(axis=1, keepdims=True)
+    tied = np.isclose(all_values, best_values, rtol=1e-9, atol=0)
+    best = np.argmin(np.where(tied, np.abs(all_discounts), np.inf), axis=1)
+    rows = np.arange(len(price))
+    best_discount = all_discounts[rows, best]
+
+    new_demand, new_price, best_value = revenue_curve(
+        price, forecast_demand, ped, best_discount[:, None], unit_cost
+    )
+    _, _, base_value = revenue_curve(
+        price, forecast_demand, ped, np.zeros((len(price), 1)), unit_cost
+    )
+    return pd.DataFrame(
+        {
+            "optimal_discount": best_discount,
+            "optimal_price": new_price[:, 0],
+            "optimal_demand": new_demand[:, 0],
+            "optimal_value": best_value[:, 0],
+            "base_value": base_value[:, 0],
+            "feasible": feasible,
+        }
+    )
+
+
+def add_optimal_discounts(data, **constraints):
+    """
+    Append the optimal discount of every product and month to the pricing data.
+
+    Uses 'unit_cost' and 'inventory' columns as constraints when present.
+
+    Parameters:
+    - data (pd.DataFrame): Pricing data with 'actual_price', 'sales' and 'PED' columns.
+    - **constraints: Passed to optimal_discounts.
+
+    Returns:
+    - data (pd.DataFrame): Copy of data with the optimal_discounts columns added.
+    """
+    for col in ["unit_cost", "inventory"]:
+        if col in data.columns and col not in constraints:
+            constraints[col] = data[col].values
+    result = optimal_discounts(
+        data["actual_price"].values,
+        data["sales"].values,
+        data["PED"].values,
+        **constraints,
+    )
+    return pd.concat([data.reset_index(drop=True), result], axis=1)
+
+
+@lru_cache(maxsize=1)
+def load_optimal_discount_table(path=PRICING_DATA_PATH):
+    """Load the pricing data with optimal discounts, computed once per process."""
+    return add_optimal_discounts(pd.read_csv(path))
@@ -0,0 +1,243 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Spread of actual demand around the point forecast, as a coefficient of variation
+DEFAULT_DEMAND_CV = 0.25
+# PED uncertainty for estimates without a standard error, e.g. the -1 fallback
+DEFAULT_PED_SE = 0.25
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+# Scenario x item elements sampled at once; bounds memory at ~4M float32 per array
+CHUNK_ELEMENTS = 1 << 22
+
+# Process pool shared by every simulation, started on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def plan_arrays(data, plan, default_ped_se=DEFAULT_PED_SE):
+    """
+    Align a promotion plan with the pricing data.
+
+    Parameters:
+    - data (pd.DataFrame): Pricing data with 'product_id', 'month', 'actual_price', 'sales', 'PED' and optionally 'PED_se' columns.
+    - plan (pd.DataFrame): 'product_id', 'month' and 'discount' (fraction) per promoted item.
+    - default_ped_se (float): Standard error used where PED_se is missing.
+
+    Returns:
+    - arrays (dict): 'price', 'sales', 'ped', 'ped_se' and 'discount' per item of
+      the plan, and 'product_codes' numbering the distinct products.
+    """
+    chosen = plan.merge(data, on=["product_id", "month"], how="left", validate="m:1")
+    missing = chosen["sales"].isna()
+    if missing.any():
+        unknown = chosen.loc[missing, ["product_id", "month"]].values.tolist()
+        raise ValueError(f"No pricing data for {unknown}")
+
+    ped_se = chosen["PED_se"] if "PED_se" in chosen else pd.Series(np.nan, chosen.index)
+    return {
+        "product_codes": pd.factorize(chosen["product_id"])[0],
+        "price": chosen["actual_price"].to_numpy(np.float32),
+        "sales": chosen["sales"].to_numpy(np.float32),
+        "ped": chosen["PED"].to_numpy(np.float32),
+        "ped_se": ped_se.fillna(default_ped_se).to_numpy(np.float32),
+        "discount": chosen["discount"].to_numpy(np.float32),
+    }
+
+
+def simulate_revenue(
+    arrays, n_scenarios=1000, demand_cv=DEFAULT_DEMAND_CV, seed=0, chunk_elements=None
+):
+    """
+    Sample total plan revenue, with and without the discounts, over many scenarios.
+
+    Uses the demand model of expected_revenue in tabs/tab2b.py,
+    d_new = d * (1 - discount) ** PED, with the forecast demand d drawn from a
+    mean-preserving lognormal per item and PED drawn from a normal around its
+    estimate once per product, so all months of a product share the draw. Both
+    revenues use the same demand draw so their difference is the uplift.
+    Scenarios are processed in chunks, vectorized over every item.
+
+    Parameters:
+    - arrays (dict): Output of plan_arrays.
+    - n_scenarios (int): Number of scenarios.
+    - demand_cv (float): Coefficient of variation of demand around the forecast.
+    - seed (int or np.random.SeedSequence): Random seed.
+    - chunk_elements (int): Scenario x item elements sampled at once.
+
+    Returns:
+    - revenue (np.ndarray): Plan revenue per scenario.
+    - baseline (np.ndarray): Revenue of the same items without discounts, per scenario.
+    """
+    rng = np.random.default_rng(seed)
+    n_items = len(arrays["price"])
+    codes = arrays["product_codes"]
+    n_products = codes.max() + 1 if n_items else 0
+    sigma = np.float32(np.sqrt(np.log1p(demand_cv**2)))
+    log_ratio = np.log1p(-arrays["discount"])
+    base_revenue = arrays["price"] * arrays["sales"]
+    promo_revenue = base_revenue * (1 - arrays["discount"])
+    # Expected log change in demand, and its spread from the PED uncertainty
+    ped_shift = arrays["ped"] * log_ratio
+    ped_spread = arrays["ped_se"] * log_ratio
+
+    chunk = max(1, (chunk_elements or CHUNK_ELEMENTS) // max(n_items, 1))
+    revenue = np.empty(n_scenarios)
+    baseline = np.empty(n_scenarios)
+    for start in range(0, n_scenarios, chunk):
+        stop = min(start + chunk, n_scenarios)
+        demand_noise = rng.standard_normal((stop - start, n_items), np.float32)
+        demand_noise *= sigma
+        demand_noise -= sigma**2 / 2
+        demand_factor = np.exp(demand_noise)
+        baseline[start:stop] = demand_factor @ base_revenue
+
+        ped_noise = rng.standard_normal((stop - start, n_products), np.float32)
+        ped_noise = ped_noise[:, codes]
+        ped_noise *= ped_spread
+        ped_noise += ped_shift
+        np.exp(ped_noise, out=ped_noise)
+        ped_noise *= demand_factor
+        revenue[start:stop] = ped_noise @ promo_revenue
+    return revenue, baseline
+
+
+def summarise_revenue(revenue, baseline, percentiles=DEFAULT_PERCENTILES):
+    """
+    Summarise sampled revenues.
+
+    Parameters:
+    - revenue (np.ndarray): Plan revenue per scenario.
+    - baseline (np.ndarray): Revenue without discounts per scenario.
+    - percentiles (list): Percentiles to report.
+
+    Returns:
+    - summary (dict): Mean revenue and uplift, revenue and uplift percentiles and the probability that the plan beats no discount.
+    """
+    uplift = revenue - baseline
+    return {
+        "n_scenarios": len(revenue),
+        "expected_revenue": float(revenue.mean()),
+        "expected_baseline_revenue": float(baseline.mean()),
+        "expected_uplift": float(uplift.mean()),
+        "revenue_percentiles": dict(
+            zip(percentiles, np.percentile(revenue, percentiles).tolist())
+        ),
+        "uplift_percentiles": dict(
+            zip(percentiles, np.percentile(uplift, percentiles).tolist())
+        ),
+        "probability_of_uplift": float((uplift > 0).mean()),
+    }
+
+
+def _simulate_arrays(arrays, seed, percentiles, **kwargs):
+    """Simulate and summarise one plan; runs in a worker process."""
+    revenue, baseline = simulate_revenue(arrays, seed=seed, **kwargs)
+    return summarise_revenue(revenue, baseline, percentiles)
+
+
+def simulate_plan(
+    data,
+    plan,
+    n_scenarios=1000,
+    demand_cv=DEFAULT_DEMAND_CV,
+    default_ped_se=DEFAULT_PED_SE,
+    percentiles=DEFAULT_PERCENTILES,
+    seed=0,
+):
+    """
+    Simulate the revenue of one promotion plan.
+
+    Parameters:
+    - data (pd.DataFrame): Pricing data, as in plan_arrays.
+    - plan (pd.DataFrame): 'product_id', 'month' and 'discount' per promoted item.
+    - n_scenarios (int): Number of scenarios.
+    - demand_cv (float): Coefficient of variation of demand around the forecast.
+    - default_ped_se (float): Standard error used where PED_se is missing.
+    - percentiles (list): Percentiles to report.
+    - seed (int): Random seed.
+
+    Returns:
+    - summary (dict): Output of summarise_revenue.
+    """
+    arrays = plan_arrays(data, plan, default_ped_se)
+    return _simulate_arrays(
+        arrays, seed, percentiles, n_scenarios=n_scenarios, demand_cv=demand_cv
+    )
+
+
+def get_executor():
+    """
+    Process pool kept alive across calls so repeated simulations skip worker start-up.
+
+    One pool with a worker per CPU is shared by all calls. Workers are spawned
+    rather than forked, since the API process has TensorFlow and threads loaded.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+@atexit.register
+def shutdown_executor():
+    """Stop the shared process pool, if it was started."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+def simulate_plans(
+    data,
+    plans,
+    n_scenarios=1000,
+    demand_cv=DEFAULT_DEMAND_CV,
+    default_ped_se=DEFAULT_PED_SE,
+    percentiles=DEFAULT_PERCENTILES,
+    seed=0,
+    max_workers=None,
+):
+    """
+    Simulate several promotion plans in parallel across a process pool.
+
+    Every plan gets an independent random stream spawned from seed, so results
+    do not depend on the number of workers.
+
+    Parameters:
+    - data (pd.DataFrame): Pricing data, as in plan_arrays.
+    - plans (list): Promotion plans, as in simulate_plan.
+    - n_scenarios, demand_cv, default_ped_se, percentiles: As in simulate_plan.
+    - seed (int): Random seed.
+    - max_workers (int): Runs in-process if 1; otherwise plans run on the shared
+      pool of one worker process per CPU.
+
+    Returns:
+    - summaries (list): Output of summarise_revenue per plan.
+    """
+    arrays = [plan_arrays(data, plan, default_ped_se) for plan in plans]
+    seeds = np.random.SeedSequence(seed).spawn(len(plans))
+    kwargs = {"n_scenarios": n_scenarios, "demand_cv": demand_cv}
+
+    max_workers = max_workers or min(len(plans), os.cpu_count() or 1)
+    if max_workers <= 1 or len(plans) <= 1:
+        return [
+            _simulate_arrays(a, s, percentiles, **kwargs) for a, s in zip(arrays, seeds)
+        ]
+
+    executor = get_executor()
+    futures = [
+        executor.submit(_simulate_arrays, a, s, percentiles, **kwargs)
+        for a, s in zip(arrays, seeds)
+    ]
+    return [future.result() for future in futures]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import Counter
+
+
+class MicroBatcher:
+    """
+    Queue single requests and run them through a model as one batch.
+
+    A batch is closed when it reaches max_batch_size items or max_wait_ms after
+    its first item arrived, whichever comes first, then run with
+    server.run(batch_fn, items). Each awaiting caller gets the result at its own
+    position in the batch.
+
+    Parameters:
+    - server (ModelServer): Server whose inference pool runs the batches.
+    - batch_fn (callable): batch_fn(model, items) returning one result per item.
+    - max_batch_size (int): Maximum items per batch.
+    - max_wait_ms (float): Longest time the first item of a batch waits for others.
+    """
+
+    def __init__(self, server, batch_fn, max_batch_size=16, max_wait_ms=5):
+        self.server = server
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.worker = None
+        # Items per batch, and items left waiting when a batch starts
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+
+    def start(self):
+        """Start the batching loop on the running event loop."""
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop."""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for a first item, then gather more until the batch is full or the wait expires."""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self.batch_sizes[len(batch)] += 1
+            self.queue_depths[self.queue.qsize()] += 1
+            items = [item for item, _ in batch]
+            try:
+                results = await self.server.run(self.batch_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        """Batch size and queue depth histograms."""
+        n_batches = sum(self.batch_sizes.values())
+        n_items = sum(size * n for size, n in self.batch_sizes.items())
+        return {
+            "model": self.server.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "n_batches": n_batches,
+            "mean_batch_size": n_items / n_batches if n_batches else None,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth_histogram": dict(sorted(self.queue_depths.items())),
+        }
@@ -1,9 +1,12 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 from dotenv import load_dotenv
 import os
 import psycopg2
+from demand_forecast.inventory import get_inventory_plan
+from tabs.chart_downsampling import zoomable_chart_data, display_payload_caption
 
 # Load environment variables
 current_dir = os.getcwd()
@@ -28,8 +31,9 @@ def get_db_connection():
     )
 
 
+@st.cache_resource
 def load_data():
-    """Load and preprocess actual and forecast data."""
+    """Load actual and forecast data once and index them by product."""
     with get_db_connection() as conn:
         print("Connected to database")
         # Get products table
@@ -45,51 +49,91 @@ def load_data():
             conn,
         )
     forecast_data = pd.read_csv("demand_forecast/forecast.csv")
-    return actual_data, forecast_data, products
 
+    actual_store = build_series_store(actual_data, "product_id")
+    forecast_store = build_series_store(forecast_data, "product")
 
-def filter_data_by_product(actual_data, forecast_data, product_id):
-    """Filter actual and forecast data by selected product."""
-    actual_product_data = actual_data[actual_data["product_id"] == product_id]
-    forecast_product_data = forecast_data[forecast_data["product"] == product_id]
+    # Extract the first part of the category before '|' once, and keep only
+    # products that have actual sales
+    products = products[products["product_id"].isin(list(actual_store[1]))].copy()
+    products["category"] = products["category"].str.split("|").str[0]
+    products.index = products["product_id"].values
+    return actual_store, forecast_store, products
+
+
+def build_series_store(data, key):
+    """
+    Sort a series frame by product so each product's rows form one contiguous slice.
+
+    Parameters:
+    - data (pd.DataFrame): Data with 'date', key and 'sales' columns.
+    - key (str): Product column.
+
+    Returns:
+    - data (pd.DataFrame): Sorted data with parsed dates.
+    - offsets (dict): Product to (start, stop) row positions in data.
+    """
+    data = data.sort_values([key, "date"], kind="stable", ignore_index=True)
+    data["date"] = pd.to_datetime(data["date"])
+
+    keys = data[key].to_numpy()
+    if len(keys) == 0:
+        return data, {}
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    stops = np.r_[starts[1:], len(keys)]
+    offsets = {k: (start, stop) for k, start, stop in zip(keys[starts], starts, stops)}
+    return data, offsets
+
+
+def get_product_series(store, product_id):
+    """Return one product's rows from a series store as a slice."""
+    data, offsets = store
+    start, stop = offsets.get(product_id, (0, 0))
+    return data.iloc[start:stop]
+
+
+def filter_data_by_product(actual_store, forecast_store, product_id):
+    """Get actual and forecast data of the selected product."""
+    actual_product_data = get_product_series(actual_store, product_id)
+    forecast_product_data = get_product_series(forecast_store, product_id)
     return actual_product_data, forecast_product_data
 
 
-def create_line_chart(actual_product_data, forecast_product_data):
-    """Create a line chart for actual and forecast data."""
-    actual_product_data["date"] = pd.to_datetime(actual_product_data["date"])
-    forecast_product_data["date"] = pd.to_datetime(forecast_product_data["date"])
+def combine_actual_forecast(actual_product_data, forecast_product_data):
+    """Combine actual and forecast series into one long frame for charting."""
+    return pd.concat(
+        [
+            actual_product_data[["date", "sales"]].assign(type="actual"),
+            forecast_product_data[["date", "sales"]].assign(type="forecast"),
+        ],
+        ignore_index=True,
+    )
 
-    actual_product_data["type"] = "actual"
-    forecast_product_data["type"] = "forecast"
 
-    df = pd.concat([actual_product_data, forecast_product_data])
-    fig = px.line(df, x="date", y="sales", color="type", title="Actual vs Forecast")
+def create_line_chart(chart_data):
+    """Create a line chart for actual and forecast data."""
+    fig = px.line(
+        chart_data, x="date", y="sales", color="type", title="Actual vs Forecast"
+    )
 
     return fig
 
 
 def load_product_details(products, product_id):
-    """Load product details from products.csv."""
-    # Add USD in front of the price
-    products["actual_price"] = "USD " + products["actual_price"].astype(str)
-    products["discounted_price"] = "USD " + products["discounted_price"].astype(str)
-
-    product_details = products[products["product_id"] == product_id]
-    product_details = product_details[
-        ["product_name", "category", "actual_price", "discounted_price"]
-    ]
-    # Rename columns to more readable names
-    product_details = product_details.rename(
-        columns={
-            "product_name": "Product Name",
-            "category": "Category",
-            "actual_price": "Actual Price",
-            "discounted_price": "Discounted Price",
-        }
+    """Load product details of the selected product."""
+    product = products.loc[product_id]
+    product_details = pd.DataFrame(
+        {
+            "Details": [
+                product["product_name"],
+                product["category"],
+                # Add USD in front of the price
+                f"USD {product['actual_price']}",
+                f"USD {product['discounted_price']}",
+            ]
+        },
+        index=["Product Name", "Category", "Actual Price", "Discounted Price"],
     )
-    product_details = product_details.T
-    product_details.columns = ["Details"]
     return product_details
 
 
@@ -98,15 +142,24 @@ def display_product_details(tab, product_details):
     tab.dataframe(product_details, use_container_width=True)
 
 
-def display_tab1(tab1, actual_data, forecast_data, products):
-    """Display content for tab1."""
-    # Extract the first part of the category before '|'
-    products["category"] = products["category"].apply(lambda x: x.split("|")[0])
+def display_inventory_plan(tab, product_id):
+    """Display EOQ, safety stock and reorder point for the selected product."""
+    plan, version = get_inventory_plan()
+    product_plan = plan[plan["product_id"] == product_id]
+    if product_plan.empty:
+        tab.write("No inventory plan available for this product.")
+        return
 
-    # Top level filters for product from product details
-    # Get the products that exist in both actual and products data
-    products = products[products["product_id"].isin(actual_data["product_id"].unique())]
+    tab.subheader("Inventory Plan")
+    col1, col2, col3 = tab.columns(3)
+    col1.metric("Economic Order Quantity", f"{product_plan['eoq'].values[0]:.0f}")
+    col2.metric("Safety Stock", f"{product_plan['safety_stock'].values[0]:.1f}")
+    col3.metric("Reorder Point", f"{product_plan['reorder_point'].values[0]:.0f}")
+    tab.caption(f"Computed from forecast version {version}")
 
+
+def display_tab1(tab1, actual_store, forecast_store, products):
+    """Display content for tab1."""
     # Select a category
     categories = products["category"].unique()
     selected_category = tab1.selectbox("Select a category", categories)
@@ -115,25 +168,33 @@ def display_tab1(tab1, actual_data, forecast_data, products):
     filtered_products = products[products["category"] == selected_category]
 
     if not filtered_products.empty:
-        product = tab1.selectbox(
-            "Select a product", filtered_products["product_name"].values
+        # Key the selection on product_id, since product names may repeat
+        product_id = tab1.selectbox(
+            "Select a product",
+            filtered_products["product_id"].values,
+            format_func=lambda pid: products.at[pid, "product_name"],
         )
-        product_id = filtered_products[filtered_products["product_name"] == product][
-            "product_id"
-        ].values[0]
 
-        # Filter data by selected product
+        # Get the selected product's series
         actual_product_data, forecast_product_data = filter_data_by_product(
-            actual_data, forecast_data, product_id
+            actual_store, forecast_store, product_id
         )
 
-        # Create and display line chart
-        fig = create_line_chart(actual_product_data, forecast_product_data)
+        # Downsample the zoomed range to the chart width, then display line chart
+        chart_data = combine_actual_forecast(actual_product_data, forecast_product_data)
+        shown_data = zoomable_chart_data(
+            tab1, chart_data, "date", "sales", key="demand_forecast_zoom", group="type"
+        )
+        fig = create_line_chart(shown_data)
         tab1.plotly_chart(fig)
+        display_payload_caption(tab1, fig, len(shown_data), len(chart_data))
 
         # Load and display product details
 
         product_details = load_product_details(products, product_id)
         display_product_details(tab1, product_details)
+
+        # Display the inventory plan for the selected product
+        display_inventory_plan(tab1, product_id)
     else:
         tab1.write("No products found.")
@@ -2,10 +2,44 @@ import pandas as pd
 import streamlit as st
 import math
 from dotenv import load_dotenv
+from tabs.pricing_optimizer import load_optimal_discount_table
+from tabs.promotion_simulator import simulate_plan
 
 
+@st.cache_resource
 def load_data_tab2():
-    return pd.read_csv("pricing-strategies/forecast_with_ped.csv")
+    """Load the pricing data with optimal discounts once and index it by product and month."""
+    return build_pricing_index(load_optimal_discount_table())
+
+
+def build_pricing_index(data):
+    """
+    Index the pricing data for constant-time lookups from the pricing tab.
+
+    Parameters:
+    - data (pd.DataFrame): Pricing data with 'product_id', 'month', 'product_name' and 'base_cat' columns.
+
+    Returns:
+    - index (dict): 'records' maps (product_id, month) to the row as a dict,
+      'categories' maps base category to its product IDs, 'names' maps
+      product ID to product name and 'data' is the pricing data itself.
+    """
+    records = {
+        (record["product_id"], record["month"]): record
+        for record in data.to_dict("records")
+    }
+    products = data.drop_duplicates("product_id")
+    categories = {
+        category: group["product_id"].tolist()
+        for category, group in products.groupby("base_cat", sort=False)
+    }
+    names = dict(zip(products["product_id"], products["product_name"]))
+    return {
+        "records": records,
+        "categories": categories,
+        "names": names,
+        "data": data,
+    }
 
 
 def expected_revenue(price, discount, forecast_demand, ped):
@@ -84,17 +118,34 @@ def display_product_details(
     )
 
 
-def display_tab2(tab2, data):
-    base_categories = data["base_cat"].unique()
-    selected_category = tab2.selectbox("Select a category", base_categories)
+def display_optimal_discount(tab, optimal_discount, optimal_revenue, revenue):
+    """Display the revenue-maximising discount for the selected product and month."""
+    tab.markdown(
+        f"""
+    <div style="text-align:center; font-size:16px; margin-top: 10px;">
+        <strong>🎯 Optimal Discount:</strong> {optimal_discount * 100:.0f}%
+        (New Revenue: ${optimal_revenue:.2f}, Revenue Difference: ${optimal_revenue - revenue:.2f})
+    </div>
+    """,
+        unsafe_allow_html=True,
+    )
 
-    # Filter products by selected category
-    filtered_products = data[data["base_cat"] == selected_category]["product_name"]
+
+def display_tab2(tab2, index):
+    categories = index["categories"]
+    selected_category = tab2.selectbox("Select a category", list(categories))
+
+    # Products of the selected category
+    filtered_products = categories.get(selected_category, [])
 
     months = ["January", "February", "March"]
 
-    if not filtered_products.empty:
-        selected_product = tab2.selectbox("Select a product", filtered_products)
+    if filtered_products:
+        product_id = tab2.selectbox(
+            "Select a product",
+            filtered_products,
+            format_func=lambda pid: index["names"][pid],
+        )
         selected_month = tab2.selectbox("Select a month", months)
         selected_discount = tab2.slider(
             "Select your discount percentage between -50% and 100%",
@@ -104,13 +155,13 @@ def display_tab2(tab2, data):
             step=1,
         )
 
-        chosen = data[
-            (data["month"] == selected_month)
-            & (data["product_name"] == selected_product)
-        ]
-        original_demand = chosen["sales"].values[0]
-        original_price = chosen["actual_price"].values[0]
-        ped = chosen["PED"].values[0]
+        chosen = index["records"].get((product_id, selected_month))
+        if chosen is None:
+            tab2.write("No pricing data for this month.")
+            return
+        original_demand = chosen["sales"]
+        original_price = chosen["actual_price"]
+        ped = chosen["PED"]
 
         new_demand, new_price, new_revenue = expected_revenue(
             original_price, selected_discount / 100, original_demand, ped
@@ -118,7 +169,7 @@ def display_tab2(tab2, data):
 
         display_product_details(
             tab2,
-            selected_product,
+            index["names"][product_id],
             selected_category,
             ped,
             original_price,
@@ -128,5 +179,73 @@ def display_tab2(tab2, data):
             new_demand,
             new_revenue,
         )
+
+        display_optimal_discount(
+            tab2,
+            chosen["optimal_discount"],
+            chosen["optimal_value"],
+            original_price * original_demand,
+        )
     else:
         tab2.write("No products found.")
+
+    display_promotion_simulator(tab2, index)
+
+
+def display_promotion_simulator(tab, index):
+    """Simulate the revenue of discounting several products and months at once."""
+    expander = tab.expander("🎲 Promotion Simulator")
+    product_ids = expander.multiselect(
+        "Products to promote",
+        list(index["names"]),
+        format_func=lambda pid: index["names"][pid],
+        key="promotion_products",
+    )
+    months = expander.multiselect(
+        "Months to promote",
+        ["January", "February", "March"],
+        default=["January"],
+        key="promotion_months",
+    )
+    discount = expander.slider(
+        "Promotion discount percentage",
+        min_value=-50,
+        max_value=90,
+        value=10,
+        step=1,
+        key="promotion_discount",
+    )
+    n_scenarios = expander.select_slider(
+        "Number of scenarios", [500, 1000, 2000, 5000], value=1000
+    )
+
+    if not product_ids or not months:
+        expander.write("Select at least one product and month.")
+        return
+
+    plan = pd.DataFrame(
+        [(pid, month) for pid in product_ids for month in months],
+        columns=["product_id", "month"],
+    ).assign(discount=discount / 100)
+    plan = plan[
+        [key in index["records"] for key in zip(plan["product_id"], plan["month"])]
+    ]
+    summary = simulate_plan(index["data"], plan, n_scenarios=n_scenarios)
+
+    col1, col2, col3 = expander.columns(3)
+    col1.metric("Expected Revenue", f"${summary['expected_revenue']:,.2f}")
+    col2.metric(
+        "Expected Revenue Difference",
+        f"${summary['expected_uplift']:,.2f}",
+    )
+    col3.metric(
+        "Chance of Higher Revenue", f"{summary['probability_of_uplift'] * 100:.0f}%"
+    )
+    percentiles = pd.DataFrame(
+        {
+            "Revenue": summary["revenue_percentiles"],
+            "Revenue Difference": summary["uplift_percentiles"],
+        }
+    )
+    percentiles.index = [f"P{p}" for p in percentiles.index]
+    expander.dataframe(percentiles.style.format("${:,.2f}"))
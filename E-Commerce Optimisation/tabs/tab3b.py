@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 import os
 import psycopg2
 from sqlalchemy import create_engine
+from tabs.fulfilment_funnel import funnel_durations
+from tabs.lead_time_analytics import compute_lead_time_stats
 
 # Load environment variables
 current_dir = os.getcwd()
@@ -29,18 +31,67 @@ def get_db_connection():
     )
 
 
+STATUS_ORDER = ["Packed", "At logistics facility", "Shipping", "Delivered to buyer"]
+
+
 def load_data_tab3():
-    """Load the data for supply chain efficiency analysis."""
+    """
+    Load the data for supply chain efficiency analysis.
+
+    Reads the KPI tables maintained by data/kpi_tables.sql. If they have not been
+    created, falls back to computing the same KPIs from the raw shipping history.
+
+    Returns:
+    - data (dict): 'product_counts' (returns and cancellations per product),
+      'duration_df' (average days per step and condition), 'products_df' and
+      'updated_at' (KPI refresh time, None when computed from the raw history).
+    """
     with get_db_connection() as conn:
-        # Load the required tables for analysis
-        shipping_history_df = pd.read_sql_query(
-            "SELECT s.product_id, s.shipping_id, s.fulfilment, s.ship_service_level, s.estimated_delivery_date, s.fulfilled_by, h.status, h.update_date FROM shipping_status AS s RIGHT JOIN shipping_history AS h ON s.shipping_id = h.shipping_id",
-            conn,
-        )
         products_df = pd.read_sql_query(
             "SELECT product_id, product_name, origin_area FROM products", conn
         )
-    return shipping_history_df, products_df
+        kpis = load_shipping_kpis(conn)
+        if kpis is None:
+            # Load the required tables for analysis
+            shipping_history_df = pd.read_sql_query(
+                "SELECT s.product_id, s.shipping_id, s.fulfilment, s.ship_service_level, s.estimated_delivery_date, s.fulfilled_by, h.status, h.update_date FROM shipping_status AS s RIGHT JOIN shipping_history AS h ON s.shipping_id = h.shipping_id",
+                conn,
+            )
+            kpis = {
+                "product_counts": count_returns_and_cancellations(shipping_history_df),
+                "duration_df": preprocess_data(shipping_history_df),
+                "updated_at": None,
+            }
+    kpis["products_df"] = products_df
+    return kpis
+
+
+def load_shipping_kpis(conn):
+    """Load the precomputed shipping KPI tables, or None if they do not exist."""
+    kpi_tables = pd.read_sql_query("SELECT to_regclass('kpi_refresh') AS name", conn)
+    if kpi_tables["name"].isna().all():
+        return None
+
+    product_counts = pd.read_sql_query(
+        "SELECT product_id, returned_count + cancelled_count AS count FROM shipping_product_kpis WHERE returned_count + cancelled_count > 0",
+        conn,
+    )
+    duration_df = pd.read_sql_query(
+        "SELECT status, fulfilment_service_level, total_days::float / NULLIF(n_days, 0) AS days_from_previous FROM shipping_step_durations",
+        conn,
+    )
+    duration_df["status"] = pd.Categorical(
+        duration_df["status"], categories=STATUS_ORDER, ordered=True
+    )
+    duration_df = duration_df.sort_values(["status", "fulfilment_service_level"])
+    refresh = pd.read_sql_query(
+        "SELECT updated_at FROM kpi_refresh WHERE name = 'shipping'", conn
+    )
+    return {
+        "product_counts": product_counts,
+        "duration_df": duration_df,
+        "updated_at": refresh["updated_at"].iloc[0] if not refresh.empty else None,
+    }
 
 
 def preprocess_data(shipping_history_df):
@@ -53,31 +104,9 @@ def preprocess_data(shipping_history_df):
         + shipping_history_df["ship_service_level"]
     )
 
-    successful_orders = shipping_history_df.groupby("shipping_id").filter(
-        lambda x: list(x["status"])
-        == [
-            "Pending",
-            "Packed",
-            "At logistics facility",
-            "Shipping",
-            "Delivered to buyer",
-        ]
-    )
-    successful_orders["update_date"] = pd.to_datetime(successful_orders["update_date"])
-    successful_orders = successful_orders.sort_values(["shipping_id", "update_date"])
-    successful_orders["days_from_previous"] = (
-        successful_orders.groupby("shipping_id")["update_date"].diff().dt.days
-    )
-
-    successful_orders = successful_orders[
-        successful_orders["status"].isin(
-            ["Packed", "At logistics facility", "Shipping", "Delivered to buyer"]
-        )
-    ]
-
-    status_order = ["Packed", "At logistics facility", "Shipping", "Delivered to buyer"]
-    successful_orders["status"] = pd.Categorical(
-        successful_orders["status"], categories=status_order, ordered=True
+    # Days taken by each step of shipments that went through every step in order
+    successful_orders = funnel_durations(
+        shipping_history_df, group_col="fulfilment_service_level"
     )
 
     duration_df = (
@@ -104,18 +133,20 @@ def plot_proportion_of_days(duration_df):
     return fig
 
 
-def top_10_product_performance(shipping_history_df, products_df):
-    """Get the top 10 products with the most returns or cancellations."""
+def count_returns_and_cancellations(shipping_history_df):
+    """Count returned or cancelled shipments per product."""
     returned_df = shipping_history_df[
         shipping_history_df["status"].isin(["Returned", "Cancelled"])
     ]
     product_counts_df = returned_df["product_id"].value_counts().reset_index()
     product_counts_df.columns = ["product_id", "count"]
-    product_counts_df = product_counts_df.sort_values(by="count", ascending=False)
-    product_counts_df = pd.merge(
-        product_counts_df, products_df, how="left", on="product_id"
-    )
+    return product_counts_df
+
+
+def top_10_product_performance(product_counts_df, products_df):
+    """Get the top 10 products with the most returns or cancellations."""
     top_10_df = product_counts_df.nlargest(10, "count")
+    top_10_df = pd.merge(top_10_df, products_df, how="left", on="product_id")
 
     top_10_df.drop(columns=["product_id"], inplace=True)
 
@@ -124,26 +155,76 @@ def top_10_product_performance(shipping_history_df, products_df):
 
 def display_tab3(tab3, data_tab3):
     """Display content for tab3."""
-    shipping_history_df, products_df = data_tab3
+    if data_tab3["updated_at"] is not None:
+        tab3.caption(
+            f"Shipping KPIs last refreshed {data_tab3['updated_at']:%Y-%m-%d %H:%M:%S %Z}"
+        )
+    else:
+        tab3.caption("Shipping KPIs computed from the full shipping history")
 
-    # Create a select box to choose between two views
+    # Create a select box to choose between the views
     view_option = tab3.selectbox(
         "Select View",
         [
             "Top 10 Suppliers with Poor Product Performance",
             "Days Taken for Each Step in the Order Fulfillment Process",
+            "Lead Time Distribution and Late Deliveries",
         ],
     )
 
     if view_option == "Top 10 Suppliers with Poor Product Performance":
         tab3.subheader("Top 10 Frequently Returned or Cancelled Products")
-        top_10_df = top_10_product_performance(shipping_history_df, products_df)
+        top_10_df = top_10_product_performance(
+            data_tab3["product_counts"], data_tab3["products_df"]
+        )
         tab3.dataframe(top_10_df)  # Display the table in Streamlit
 
     elif view_option == "Days Taken for Each Step in the Order Fulfillment Process":
         tab3.subheader(
             "Number of Days Taken for Each Step in Order Fulfillment Process by Condition"
         )
-        duration_df = preprocess_data(shipping_history_df)
-        fig = plot_proportion_of_days(duration_df)
+        fig = plot_proportion_of_days(data_tab3["duration_df"])
         tab3.plotly_chart(fig)
+
+    elif view_option == "Lead Time Distribution and Late Deliveries":
+        display_lead_time_analytics(tab3)
+
+
+@st.cache_data(ttl=3600)
+def load_lead_time_tables():
+    """Compute lead-time quantiles and SLA breach rates in one pass over the history."""
+    stats = compute_lead_time_stats()
+    return stats.quantile_table(), stats.sla_table()
+
+
+def display_lead_time_analytics(tab3):
+    """Display lead-time quantiles per step and late delivery rates."""
+    quantile_df, sla_df = load_lead_time_tables()
+
+    tab3.subheader("Days Taken for Each Step by Percentile")
+    step = tab3.selectbox(
+        "Select a step", quantile_df["step"].cat.categories, key="lead_time_step"
+    )
+    step_df = quantile_df[quantile_df["step"] == step].drop(columns="step")
+    tab3.dataframe(step_df, hide_index=True)
+
+    tab3.subheader("Proportion of Deliveries Later than Estimated")
+    sla_df = sla_df.assign(
+        fulfilment_service_level=sla_df["fulfilment"]
+        + " + "
+        + sla_df["ship_service_level"]
+    )
+    fig = px.bar(
+        sla_df,
+        x="origin_area",
+        y="breach_rate",
+        color="fulfilment_service_level",
+        hover_data=["n_delivered", "n_breached", "avg_days_late"],
+        labels={
+            "breach_rate": "Late Delivery Rate",
+            "origin_area": "Product Origin",
+        },
+        barmode="group",
+    )
+    fig.update_yaxes(tickformat=".0%")
+    tab3.plotly_chart(fig)
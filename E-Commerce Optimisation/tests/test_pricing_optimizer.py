@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from tabs.pricing_optimizer import discount_bounds, optimal_discounts
+
+
+def test_unit_elastic_demand_recommends_no_discount():
+    # Revenue is flat in the discount when PED == -1, so no discount is optimal
+    result = optimal_discounts(
+        np.array([100.0, 25.5, 1999.0]),
+        np.array([40.0, 3.0, 120.0]),
+        np.array([-1.0, -1.0, -1.0]),
+    )
+    assert np.all(result["optimal_discount"] == 0)
+    np.testing.assert_allclose(result["optimal_value"], result["base_value"])
+
+
+def test_elastic_demand_still_takes_best_discount():
+    # Demand is elastic, so revenue keeps rising up to the largest discount
+    result = optimal_discounts(np.array([100.0]), np.array([40.0]), np.array([-2.0]))
+    assert result["optimal_discount"][0] == pytest.approx(0.9)
+    assert result["optimal_value"][0] > result["base_value"][0]
+
+
+def test_inelastic_demand_over_inventory_is_infeasible():
+    # With PED == 0 no discount changes demand, so only the second item fits its stock
+    _, _, feasible = discount_bounds(
+        np.array([100.0, 100.0]),
+        np.array([40.0, 40.0]),
+        np.array([0.0, 0.0]),
+        inventory=np.array([30.0, 50.0]),
+    )
+    assert feasible.tolist() == [False, True]
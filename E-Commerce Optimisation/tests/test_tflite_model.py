@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from computer_vision.tflite_model import TFLiteModel, run_model  # noqa: E402
+
+N_CLASSES = 5
+IMAGE_SHAPE = (32, 32, 3)
+
+
+@pytest.fixture(scope="module")
+def images():
+    # Images of each class differ in brightness, so a small model separates them
+    rng = np.random.default_rng(0)
+    labels = np.arange(40) % N_CLASSES
+    images = (labels[:, None, None, None] + 0.5) / N_CLASSES + rng.normal(
+        0, 0.02, (len(labels), *IMAGE_SHAPE)
+    )
+    return np.clip(images, 0, 1).astype(np.float32), labels
+
+
+@pytest.fixture(scope="module")
+def keras_model(images):
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential(
+        [
+            tf.keras.Input(IMAGE_SHAPE),
+            tf.keras.layers.Conv2D(8, 3, activation="relu"),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(N_CLASSES, activation="softmax"),
+        ]
+    )
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(0.05),
+        loss="sparse_categorical_crossentropy",
+    )
+    model.fit(*images, epochs=50, verbose=0)
+    return model
+
+
+@pytest.fixture(scope="module")
+def tflite_path(keras_model, tmp_path_factory):
+    # Dynamic-range quantization, as used for the embedding model
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    path = tmp_path_factory.mktemp("tflite") / "model.tflite"
+    path.write_bytes(converter.convert())
+    return str(path)
+
+
+def test_tflite_agrees_with_keras_on_top1(keras_model, tflite_path, images):
+    inputs, _ = images
+    keras_labels = run_model(keras_model, inputs).argmax(axis=1)
+    tflite_labels = run_model(TFLiteModel(tflite_path), inputs).argmax(axis=1)
+    assert np.mean(keras_labels == tflite_labels) >= 0.98
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 16, 20])
+def test_padded_batches_match_single_images(tflite_path, images, batch_size):
+    inputs = images[0][:batch_size]
+    model = TFLiteModel(tflite_path, max_batch_size=16)
+    batched = model(inputs)
+    single = np.concatenate([model(image[None]) for image in inputs])
+    assert batched.shape == (batch_size, N_CLASSES)
+    np.testing.assert_allclose(batched, single, rtol=1e-5, atol=1e-6)
+    # Only the fixed batch sizes are ever allocated
+    assert set(model.interpreters) <= set(model.batch_sizes)